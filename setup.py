@@ -80,13 +80,15 @@ setup(
             "colorlog",
             "crick",
             "flake8",
+            "numexpr",
             "matplotlib",
             "moto",
             "aws-xray-sdk",
             "pymysql>=1.0.0",
+            "apsw",
         ],
         "docs": ["sphinx", "sphinx_autodoc_typehints", "sphinx-click", "pymysql>=1.0.0"],
-        "recommended": ["colorlog", "crick", "pymysql>=1.0.0"],
+        "recommended": ["colorlog", "crick", "numexpr", "pymysql>=1.0.0", "zstandard"],
     },
     # CLI
     entry_points="""
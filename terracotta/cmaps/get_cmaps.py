@@ -3,23 +3,19 @@
 Define an interface to retrieve stored color maps.
 """
 
-from typing import Dict
+from typing import Dict, TYPE_CHECKING
 import os
-from pkg_resources import resource_filename, Requirement, DistributionNotFound
 
-import numpy as np
+if TYPE_CHECKING:  # pragma: no cover
+    # numpy is only needed to read colormaps, not to list them
+    import numpy as np
 
 SUFFIX = '_rgba.npy'
 EXTRA_CMAP_FOLDER = os.environ.get('TC_EXTRA_CMAP_FOLDER', '')
 
-try:
-    PACKAGE_DIR = resource_filename(
-        Requirement.parse('terracotta'),
-        'terracotta/cmaps/data'
-    )
-except DistributionNotFound:
-    # terracotta was not installed, fall back to file system
-    PACKAGE_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# colormaps are shipped as package data; this avoids importing pkg_resources,
+# which is slow and would dominate import time of the server
+PACKAGE_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
 
 def _get_cmap_files() -> Dict[str, str]:
@@ -53,7 +49,9 @@ def _get_cmap_files() -> Dict[str, str]:
     return cmap_files
 
 
-def _read_cmap(path: str) -> np.ndarray:
+def _read_cmap(path: str) -> 'np.ndarray':
+    import numpy as np
+
     with open(path, 'rb') as f:
         cmap_data = np.load(f)
 
@@ -69,14 +67,25 @@ def _read_cmap(path: str) -> np.ndarray:
 CMAP_FILES = _get_cmap_files()
 AVAILABLE_CMAPS = sorted(CMAP_FILES.keys())
 
+# colormaps are read from disk on first use
+_CMAP_REGISTRY: Dict[str, 'np.ndarray'] = {}
+
 
-def get_cmap(name: str) -> np.ndarray:
-    """Retrieve the given colormap and return RGBA values as a uint8 NumPy array of
+def get_cmap(name: str) -> 'np.ndarray':
+    """Retrieve the given colormap and return RGBA values as a read-only uint8 NumPy array of
     shape (255, 4)
     """
     name = name.lower()
 
-    if name not in AVAILABLE_CMAPS:
+    if name not in CMAP_FILES:
         raise ValueError(f'Unknown colormap {name}, must be one of {AVAILABLE_CMAPS}')
 
-    return _read_cmap(CMAP_FILES[name])
+    cmap_data = _CMAP_REGISTRY.get(name)
+
+    if cmap_data is None:
+        cmap_data = _read_cmap(CMAP_FILES[name])
+        # shared between all callers, so guard against accidental modification
+        cmap_data.flags.writeable = False
+        _CMAP_REGISTRY[name] = cmap_data
+
+    return cmap_data
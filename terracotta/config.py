@@ -46,6 +46,24 @@ class TerracottaSettings(NamedTuple):
     #: Compression level of output PNGs, from 0-9
     PNG_COMPRESS_LEVEL: int = 1
 
+    #: Encoder to use for output PNGs (pil, spng, fast)
+    PNG_ENCODER: str = 'pil'
+
+    #: Quality of output WebP images, from 0-100
+    WEBP_QUALITY: int = 80
+
+    #: Quality of output JPEG images, from 0-100
+    JPEG_QUALITY: int = 85
+
+    #: How to respond to requests for tiles outside of the dataset (image, no-content)
+    EMPTY_TILE_RESPONSE: str = 'image'
+
+    #: Max age in seconds clients and proxies may cache empty tiles for (0 to disable)
+    EMPTY_TILE_MAX_AGE: int = 60 * 60 * 24  # 1 day
+
+    #: Maximum number of datasets that may contribute to a single mosaic tile
+    MAX_MOSAIC_DATASETS: int = 100
+
     #: Timeout in seconds for database connections
     DB_CONNECTION_TIMEOUT: int = 10
 
@@ -55,6 +73,13 @@ class TerracottaSettings(NamedTuple):
     #: Time-to-live of remote database cache in seconds
     REMOTE_DB_CACHE_TTL: int = 10 * 60  # 10 min
 
+    #: Read pages of remote SQLite databases on demand through HTTP range requests
+    #: instead of downloading the whole database (requires APSW)
+    REMOTE_DB_RANGE_REQUESTS: bool = False
+
+    #: Size in bytes of the blocks fetched from remote SQLite databases per range request
+    REMOTE_DB_BLOCK_SIZE: int = 64 * 1024  # 64 KiB
+
     #: Resampling method to use when reading reprojected data
     RESAMPLING_METHOD: str = 'average'
 
@@ -108,10 +133,20 @@ class SettingSchema(Schema):
     )
 
     PNG_COMPRESS_LEVEL = fields.Integer(validate=validate.Range(min=0, max=9))
+    PNG_ENCODER = fields.String(validate=validate.OneOf(['pil', 'spng', 'fast']))
+    WEBP_QUALITY = fields.Integer(validate=validate.Range(min=0, max=100))
+    JPEG_QUALITY = fields.Integer(validate=validate.Range(min=0, max=100))
+
+    EMPTY_TILE_RESPONSE = fields.String(validate=validate.OneOf(['image', 'no-content']))
+    EMPTY_TILE_MAX_AGE = fields.Integer(validate=validate.Range(min=0))
+
+    MAX_MOSAIC_DATASETS = fields.Integer(validate=validate.Range(min=1))
 
     DB_CONNECTION_TIMEOUT = fields.Integer(validate=validate.Range(min=0))
     REMOTE_DB_CACHE_DIR = fields.String(validate=_is_writable)
     REMOTE_DB_CACHE_TTL = fields.Integer(validate=validate.Range(min=0))
+    REMOTE_DB_RANGE_REQUESTS = fields.Boolean()
+    REMOTE_DB_BLOCK_SIZE = fields.Integer(validate=validate.Range(min=512))
 
     RESAMPLING_METHOD = fields.String(
         validate=validate.OneOf(['nearest', 'linear', 'cubic', 'average'])
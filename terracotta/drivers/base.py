@@ -26,7 +26,7 @@ class Driver(ABC):
 
     Defines a common interface for all drivers.
     """
-    _RESERVED_KEYS = ('limit', 'page')
+    _RESERVED_KEYS = ('limit', 'page', 'bbox')
 
     db_version: str  #: Terracotta version used to create the database
     key_names: Tuple[str]  #: Names of all keys defined by the database
@@ -83,7 +83,8 @@ class Driver(ABC):
 
     @abstractmethod
     def get_datasets(self, where: Mapping[str, Union[str, List[str]]] = None,
-                     page: int = 0, limit: int = None) -> Dict[Tuple[str, ...], Any]:
+                     page: int = 0, limit: int = None, *,
+                     where_bbox: Sequence[float] = None) -> Dict[Tuple[str, ...], Any]:
         # Get all known dataset key combinations matching the given constraints,
         # and a handle to retrieve the data (driver dependent)
         pass
@@ -106,6 +107,8 @@ class Driver(ABC):
             - ``convex_hull``: GeoJSON shape specifying total data coverage in latitude-longitude
               projection
             - ``percentiles``: array of pre-computed percentiles from 1% through 99%
+            - ``histogram``: pixel counts in 256 equally sized bins spanning ``range``
+              (``None`` if the dataset was inserted without one)
             - ``mean``: global mean
             - ``stdev``: global standard deviation
             - ``metadata``: any additional client-relevant metadata
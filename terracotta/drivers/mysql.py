@@ -11,6 +11,7 @@ import contextlib
 from contextlib import AbstractContextManager
 import re
 import json
+import threading
 import urllib.parse as urlparse
 from urllib.parse import ParseResult
 
@@ -81,16 +82,23 @@ class MySQLDriver(RasterDriver):
     Assumes raster data to be present in separate GDAL-readable files on disk or remotely.
     Stores metadata and paths to raster files in MySQL.
 
-    Requires a running MySQL server.
+    Requires a running MySQL server (5.7 or later, or MariaDB 10.2 or later, for the
+    spatial index over dataset bounds).
 
-    The MySQL database consists of 4 different tables:
+    The MySQL database consists of 5 different tables:
 
     - ``terracotta``: Metadata about the database itself.
     - ``key_names``: Contains two columns holding all available keys and their description.
     - ``datasets``: Maps key values to physical raster path.
     - ``metadata``: Contains actual metadata as separate columns. Indexed via key values.
+    - ``dataset_bounds``: Bounds of all datasets with metadata as polygons, with a spatial
+      index. Indexed via key values.
 
-    This driver caches raster data and key names, but not metadata.
+    Databases created by earlier versions are upgraded on first connection. If the user
+    lacks the permissions to do so, datasets are filtered by bounds without the index.
+
+    This driver caches raster data and key names, but not metadata. Connections are kept
+    per thread, so a single driver instance can be shared between threads.
     """
     _MAX_PRIMARY_KEY_LENGTH = 767 // 4  # Max key length for MySQL is at least 767B
     _METADATA_COLUMNS: Tuple[Tuple[str, ...], ...] = (
@@ -105,6 +113,7 @@ class MySQLDriver(RasterDriver):
         ('mean', 'REAL'),
         ('stdev', 'REAL'),
         ('percentiles', 'BLOB'),
+        ('histogram', 'BLOB'),
         ('metadata', 'LONGTEXT')
     )
     _CHARSET: str = 'utf8mb4'
@@ -142,17 +151,40 @@ class MySQLDriver(RasterDriver):
             db=self._parse_db_name(con_params)
         )
 
-        self._connection: Connection
-        self._cursor: DictCursor
-        self._connected = False
+        self._thread_state = threading.local()
 
         self._version_checked: bool = False
+        self._has_spatial_index: bool = True
         self._db_keys: Optional[OrderedDict] = None
 
         # use normalized path to make sure username and password don't leak into __repr__
         qualified_path = self._normalize_path(mysql_path)
         super().__init__(qualified_path)
 
+    @property
+    def _connected(self) -> bool:
+        return getattr(self._thread_state, 'connected', False)
+
+    @_connected.setter
+    def _connected(self, value: bool) -> None:
+        self._thread_state.connected = value
+
+    @property
+    def _connection(self) -> Connection:
+        return self._thread_state.connection
+
+    @_connection.setter
+    def _connection(self, value: Connection) -> None:
+        self._thread_state.connection = value
+
+    @property
+    def _cursor(self) -> DictCursor:
+        return self._thread_state.cursor
+
+    @_cursor.setter
+    def _cursor(self, value: DictCursor) -> None:
+        self._thread_state.cursor = value
+
     @classmethod
     def _normalize_path(cls, path: str) -> str:
         parts = urlparse.urlparse(path)
@@ -200,8 +232,97 @@ class MySQLDriver(RasterDriver):
                     f'Version conflict: database was created in v{db_version}, '
                     f'but this is v{current_version}'
                 )
+
+            self._has_spatial_index = self._upgrade_schema()
             self._version_checked = True
 
+    @convert_exceptions('Could not upgrade database')
+    def _upgrade_schema(self) -> bool:
+        """Add columns and tables introduced after the database was created.
+
+        Returns whether the spatial index can be used. Databases that cannot be altered
+        (e.g. by users without write permissions) are served without it.
+        """
+        from pymysql import OperationalError, InternalError, ProgrammingError
+
+        cursor = self._cursor
+        cursor.execute("SHOW COLUMNS FROM metadata LIKE 'histogram'")
+        has_histogram = cursor.fetchone() is not None
+        cursor.execute("SHOW TABLES LIKE 'dataset_bounds'")
+        has_bounds_table = cursor.fetchone() is not None
+
+        if has_histogram and has_bounds_table:
+            return True
+
+        try:
+            if not has_histogram:
+                cursor.execute('ALTER TABLE metadata ADD COLUMN histogram BLOB')
+
+            if not has_bounds_table:
+                self._backfill_bounds_table()
+
+        except (OperationalError, InternalError, ProgrammingError):
+            self._connection.rollback()
+            return has_bounds_table
+
+        return True
+
+    def _backfill_bounds_table(self) -> None:
+        """Create the spatial index from the bounds stored in metadata"""
+        cursor = self._cursor
+        key_names = self.key_names
+
+        # fill under a temporary name, so an interrupted backfill is never used
+        cursor.execute('DROP TABLE IF EXISTS dataset_bounds_new')
+        self._create_bounds_table(key_names, table_name='dataset_bounds_new')
+
+        bounds_columns = [f'bounds_{d}' for d in ('north', 'east', 'south', 'west')]
+        cursor.execute(f'SELECT {", ".join(key_names + tuple(bounds_columns))} FROM metadata')
+
+        bounds_rows = []
+        for row in cursor.fetchall() or ():
+            bounds = [row[col] for col in bounds_columns]
+            bounds_rows.append([*(row[key] for key in key_names), self._bounds_to_wkt(bounds)])
+
+        template_string = ', '.join(['%s'] * len(key_names))
+        cursor.executemany(
+            f'INSERT INTO dataset_bounds_new VALUES ({template_string}, ST_GeomFromText(%s))',
+            bounds_rows
+        )
+        self._connection.commit()
+        cursor.execute('RENAME TABLE dataset_bounds_new TO dataset_bounds')
+
+    def _supports_column_srid(self) -> bool:
+        """Whether the server supports the SRID attribute on spatial columns (MySQL 8+)"""
+        cursor = self._cursor
+        cursor.execute('SELECT VERSION() AS version')
+        version = cast(Dict[str, str], cursor.fetchone())['version']
+
+        if 'mariadb' in version.lower():
+            return False
+
+        return int(version.split('.')[0]) >= 8
+
+    def _create_bounds_table(self, keys: Sequence[str],
+                             table_name: str = 'dataset_bounds') -> None:
+        key_string = ', '.join([f'{key} {self._get_key_type(len(keys))}' for key in keys])
+
+        # MySQL 8 ignores spatial indices on columns without SRID attribute,
+        # which is not supported by earlier versions
+        srid_fragment = 'SRID 0' if self._supports_column_srid() else ''
+
+        self._cursor.execute(
+            f'CREATE TABLE {table_name} ({key_string}, '
+            f'bounds POLYGON NOT NULL {srid_fragment}, SPATIAL INDEX (bounds), '
+            f'PRIMARY KEY ({", ".join(keys)})) CHARACTER SET {self._CHARSET}'
+        )
+
+    @classmethod
+    def _get_key_type(cls, num_keys: int) -> str:
+        # total primary key length has an upper limit in MySQL
+        key_size = cls._MAX_PRIMARY_KEY_LENGTH // num_keys
+        return f'VARCHAR({key_size})'
+
     def _get_key_names(self) -> Tuple[str, ...]:
         """Names of all keys defined by the database"""
         return tuple(self.get_keys().keys())
@@ -275,9 +396,7 @@ class MySQLDriver(RasterDriver):
             if key not in key_descriptions:
                 key_descriptions[key] = ''
 
-        # total primary key length has an upper limit in MySQL
-        key_size = self._MAX_PRIMARY_KEY_LENGTH // len(keys)
-        key_type = f'VARCHAR({key_size})'
+        key_type = self._get_key_type(len(keys))
 
         connection = pymysql.connect(
             host=self._db_args.host, user=self._db_args.user,
@@ -310,6 +429,8 @@ class MySQLDriver(RasterDriver):
             cursor.execute(f'CREATE TABLE metadata ({key_string}, {column_string}, '
                            f'PRIMARY KEY ({", ".join(keys)})) CHARACTER SET {self._CHARSET}')
 
+            self._create_bounds_table(keys)
+
         # invalidate key cache
         self._db_keys = None
 
@@ -336,7 +457,8 @@ class MySQLDriver(RasterDriver):
     @requires_connection
     @convert_exceptions('Could not retrieve datasets')
     def get_datasets(self, where: Mapping[str, Union[str, List[str]]] = None,
-                     page: int = 0, limit: int = None) -> Dict[Tuple[str, ...], str]:
+                     page: int = 0, limit: int = None, *,
+                     where_bbox: Sequence[float] = None) -> Dict[Tuple[str, ...], str]:
         cursor = self._cursor
 
         if limit is not None:
@@ -348,24 +470,47 @@ class MySQLDriver(RasterDriver):
         # sort by keys to ensure deterministic results
         order_fragment = f'ORDER BY {", ".join(self.key_names)}'
 
-        if where is None:
-            cursor.execute(f'SELECT * FROM datasets {order_fragment} {page_fragment}')
-        else:
+        conditions = []
+        values: List[Any] = []
+
+        if where is not None:
             if not all(key in self.key_names for key in where.keys()):
                 raise exceptions.InvalidKeyError('Encountered unrecognized keys in '
                                                  'where clause')
-            conditions = []
-            values = []
             for key, value in where.items():
                 if isinstance(value, str):
                     value = [value]
                 values.extend(value)
                 conditions.append(' OR '.join([f'{key}=%s'] * len(value)))
-            where_fragment = ' AND '.join([f'({condition})' for condition in conditions])
-            cursor.execute(
-                f'SELECT * FROM datasets WHERE {where_fragment} {order_fragment} {page_fragment}',
-                values
-            )
+
+        if where_bbox is not None:
+            key_string = ', '.join(self.key_names)
+
+            if self._has_spatial_index:
+                conditions.append(
+                    f'({key_string}) IN (SELECT {key_string} FROM dataset_bounds '
+                    'WHERE MBRIntersects(bounds, ST_GeomFromText(%s)))'
+                )
+                values.append(self._bounds_to_wkt(where_bbox))
+            else:
+                west, south, east, north = where_bbox
+                # bounds columns hold (west, south, east, north) in this order
+                conditions.append(
+                    f'({key_string}) IN (SELECT {key_string} FROM metadata '
+                    'WHERE bounds_north <= %s AND bounds_south >= %s '
+                    'AND bounds_east <= %s AND bounds_west >= %s)'
+                )
+                values.extend([east, west, north, south])
+
+        if conditions:
+            where_fragment = 'WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+        else:
+            where_fragment = ''
+
+        cursor.execute(
+            f'SELECT * FROM datasets {where_fragment} {order_fragment} {page_fragment}',
+            values
+        )
 
         def keytuple(row: Dict[str, Any]) -> Tuple[str, ...]:
             return tuple(row[key] for key in self.key_names)
@@ -376,6 +521,15 @@ class MySQLDriver(RasterDriver):
 
         return datasets
 
+    @staticmethod
+    def _bounds_to_wkt(bounds: Sequence[float]) -> str:
+        """Convert (west, south, east, north) bounds to a WKT polygon"""
+        west, south, east, north = bounds
+        return (
+            f'POLYGON(({west} {south}, {east} {south}, {east} {north}, '
+            f'{west} {north}, {west} {south}))'
+        )
+
     @staticmethod
     def _encode_data(decoded: Mapping[str, Any]) -> Dict[str, Any]:
         """Transform from internal format to database representation"""
@@ -391,6 +545,7 @@ class MySQLDriver(RasterDriver):
             'mean': decoded['mean'],
             'stdev': decoded['stdev'],
             'percentiles': np.array(decoded['percentiles'], dtype='float32').tobytes(),
+            'histogram': RasterDriver._encode_histogram(decoded.get('histogram')),
             'metadata': json.dumps(decoded['metadata'])
         }
         return encoded
@@ -406,6 +561,7 @@ class MySQLDriver(RasterDriver):
             'mean': encoded['mean'],
             'stdev': encoded['stdev'],
             'percentiles': np.frombuffer(encoded['percentiles'], dtype='float32').tolist(),
+            'histogram': RasterDriver._decode_histogram(encoded.get('histogram')),
             'metadata': json.loads(encoded['metadata'])
         }
         return decoded
@@ -439,7 +595,7 @@ class MySQLDriver(RasterDriver):
         assert row
 
         data_columns, _ = zip(*self._METADATA_COLUMNS)
-        encoded_data = {col: row[col] for col in self.key_names + data_columns}
+        encoded_data = {col: row[col] for col in self.key_names + data_columns if col in row}
         return self._decode_data(encoded_data)
 
     @trace('insert')
@@ -477,6 +633,12 @@ class MySQLDriver(RasterDriver):
                            f'{", ".join(row_keys)}) VALUES ({template_string})',
                            [*keys, *row_values])
 
+            if self._has_spatial_index:
+                template_string = ', '.join(['%s'] * len(keys))
+                cursor.execute(f'REPLACE INTO dataset_bounds VALUES ({template_string}, '
+                               'ST_GeomFromText(%s))',
+                               [*keys, self._bounds_to_wkt(metadata['bounds'])])
+
     @trace('delete')
     @requires_connection
     @convert_exceptions('Could not write to database')
@@ -497,3 +659,6 @@ class MySQLDriver(RasterDriver):
         where_string = ' AND '.join([f'{key}=%s' for key in self.key_names])
         cursor.execute(f'DELETE FROM datasets WHERE {where_string}', keys)
         cursor.execute(f'DELETE FROM metadata WHERE {where_string}', keys)
+
+        if self._has_spatial_index:
+            cursor.execute(f'DELETE FROM dataset_bounds WHERE {where_string}', keys)
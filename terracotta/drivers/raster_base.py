@@ -12,6 +12,8 @@ from concurrent.futures.process import BrokenProcessPool
 import contextlib
 import functools
 import logging
+import os
+import types
 import warnings
 import threading
 
@@ -35,8 +37,20 @@ Number = TypeVar('Number', int, float)
 
 logger = logging.getLogger(__name__)
 
-context = threading.local()
-context.executor = None
+# the executor is shared by all threads of a process
+context = types.SimpleNamespace(executor=None)
+_executor_lock = threading.Lock()
+
+
+def _reset_executor() -> None:
+    global _executor_lock
+    context.executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    # executors (and locks held by other threads) are unusable in forked processes
+    os.register_at_fork(after_in_child=_reset_executor)
 
 
 def create_executor() -> Executor:
@@ -61,17 +75,31 @@ def create_executor() -> Executor:
     return executor
 
 
+def get_executor() -> Executor:
+    """Return the executor of this process, creating it on first use"""
+    with _executor_lock:
+        if context.executor is None:
+            context.executor = create_executor()
+
+        return context.executor
+
+
 def submit_to_executor(task: Callable[..., Any]) -> Future:
-    if context.executor is None:
-        context.executor = create_executor()
+    executor = get_executor()
 
     try:
-        future = context.executor.submit(task)
+        future = executor.submit(task)
     except BrokenProcessPool:
-        # re-create executor and try again
+        # re-create executor (unless another thread did already) and try again
         logger.warn('Re-creating broken process pool')
-        context.executor = create_executor()
-        future = context.executor.submit(task)
+
+        with _executor_lock:
+            if context.executor is executor:
+                context.executor = create_executor()
+
+            executor = context.executor
+
+        future = executor.submit(task)
 
     return future
 
@@ -83,6 +111,7 @@ class RasterDriver(Driver):
     """
     _TARGET_CRS: str = 'epsg:3857'
     _LARGE_RASTER_THRESHOLD: int = 10980 * 10980
+    _HISTOGRAM_BINS: int = 256
     _RIO_ENV_KEYS = dict(
         GDAL_TIFF_INTERNAL_MASK=True,
         GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'
@@ -131,7 +160,8 @@ class RasterDriver(Driver):
     # specify signature and docstring for get_datasets
     @abstractmethod
     def get_datasets(self, where: Mapping[str, Union[str, List[str]]] = None,
-                     page: int = 0, limit: int = None) -> Dict[Tuple[str, ...], str]:
+                     page: int = 0, limit: int = None, *,
+                     where_bbox: Sequence[float] = None) -> Dict[Tuple[str, ...], str]:
         """Retrieve keys and file paths of datasets.
 
         Arguments:
@@ -140,6 +170,10 @@ class RasterDriver(Driver):
                 Returns all datasets if not given (default).
             page: Current page of results. Has no effect if ``limit`` is not given.
             limit: If given, return at most this many datasets. Unlimited by default.
+            where_bbox: If given, only return datasets whose bounds intersect this bounding
+                box, given as ``(west, south, east, north)`` in latitude-longitude projection.
+                Uses a spatial index. Datasets without metadata (see ``skip_metadata`` in
+                :meth:`insert`) are only found after their metadata has been computed.
 
 
         Returns:
@@ -158,6 +192,8 @@ class RasterDriver(Driver):
             }
             >>> driver.get_datasets({'date': '20180101'})
             {('reflectance', '20180101', 'B04'): 'reflectance_20180101_B04.tif'}
+            >>> driver.get_datasets(where_bbox=(10.0, 55.0, 11.0, 56.0))
+            {('reflectance', '20180101', 'B04'): 'reflectance_20180101_B04.tif'}
 
         """
         pass
@@ -203,16 +239,112 @@ class RasterDriver(Driver):
 
         return out
 
+    @staticmethod
+    def _hull_candidate_corners(mask: np.ndarray) -> np.ndarray:
+        """Returns the (column, row) coordinates of all pixel corners of True entries in mask.
+
+        Only the lowest and highest corner of each column are kept, since no other corner
+        can be a vertex of the convex hull.
+        """
+        rows, cols = np.nonzero(mask)
+
+        corner_offsets = np.array([[0, 0], [1, 0], [0, 1], [1, 1]], dtype='int64')
+        pixels = np.column_stack((cols, rows)).astype('int64')
+        corners = (pixels[:, np.newaxis, :] + corner_offsets).reshape(-1, 2)
+
+        return RasterDriver._column_extrema(corners)
+
+    @staticmethod
+    def _column_extrema(points: np.ndarray) -> np.ndarray:
+        """Reduce a point array of shape (n, 2) to the lowest and highest point per x value"""
+        if len(points) == 0:
+            return points
+
+        # np.unique sorts lexicographically by x, then y
+        points = np.unique(points, axis=0)
+        x = points[:, 0]
+        first_idx = np.flatnonzero(np.concatenate(([True], x[1:] != x[:-1])))
+        last_idx = np.concatenate((first_idx[1:] - 1, [len(points) - 1]))
+        return points[np.union1d(first_idx, last_idx)]
+
+    @staticmethod
+    def _monotone_chain_hull(points: np.ndarray) -> np.ndarray:
+        """Compute the convex hull of a point array of shape (n, 2) via Andrew's monotone chain.
+
+        Returns hull vertices in counter-clockwise order. Integer input yields exact results.
+        """
+        points = RasterDriver._column_extrema(points)
+
+        if len(points) <= 2:
+            return points
+
+        def cross(o: Sequence[float], a: Sequence[float], b: Sequence[float]) -> float:
+            return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+        def half_hull(sorted_points: List[List[float]]) -> List[List[float]]:
+            hull: List[List[float]] = []
+            for p in sorted_points:
+                while len(hull) >= 2 and cross(hull[-2], hull[-1], p) <= 0:
+                    hull.pop()
+                hull.append(p)
+            return hull
+
+        point_list = points.tolist()
+        lower = half_hull(point_list)
+        upper = half_hull(point_list[::-1])
+
+        # last point of each half is the first point of the other
+        return np.array(lower[:-1] + upper[:-1], dtype=points.dtype)
+
+    @staticmethod
+    def _hull_polygon(hull_vertices: np.ndarray, affine_transform: Any) -> Any:
+        """Convert hull vertices in pixel coordinates to a shapely polygon in physical space"""
+        from shapely import geometry
+        xs, ys = affine_transform * (hull_vertices[:, 0], hull_vertices[:, 1])
+        return geometry.Polygon(np.column_stack((xs, ys)))
+
+    @staticmethod
+    def _histogram_edges(data_range: Sequence[float]) -> np.ndarray:
+        """Returns the edges of the fixed-size histogram bins spanning the given data range"""
+        return np.linspace(data_range[0], data_range[1], RasterDriver._HISTOGRAM_BINS + 1)
+
+    @staticmethod
+    def _compute_histogram(valid_data: np.ndarray,
+                           data_range: Sequence[float]) -> np.ndarray:
+        """Compute pixel counts in fixed-size bins spanning the data range."""
+        if data_range[1] <= data_range[0]:
+            # constant data, everything goes into the first bin
+            counts = np.zeros(RasterDriver._HISTOGRAM_BINS, dtype='int64')
+            counts[0] = valid_data.size
+            return counts
+
+        counts, _ = np.histogram(valid_data, bins=RasterDriver._histogram_edges(data_range))
+        return counts.astype('int64')
+
+    @staticmethod
+    def _encode_histogram(histogram: Optional[Sequence[int]]) -> Optional[bytes]:
+        """Transform histogram counts to database representation (missing histograms are NULL)"""
+        if histogram is None:
+            return None
+        return np.array(histogram, dtype='int64').tobytes()
+
+    @staticmethod
+    def _decode_histogram(encoded: Optional[bytes]) -> Optional[List[int]]:
+        """Transform histogram counts from database representation"""
+        if encoded is None:
+            return None
+        return np.frombuffer(encoded, dtype='int64').tolist()
+
     @staticmethod
     def _compute_image_stats_chunked(dataset: 'DatasetReader') -> Optional[Dict[str, Any]]:
         """Compute statistics for the given rasterio dataset by looping over chunks."""
-        from rasterio import features, warp, windows
+        from rasterio import warp
         from shapely import geometry
 
         total_count = valid_data_count = 0
         tdigest = TDigest()
         sstats = SummaryStats()
-        convex_hull = geometry.Polygon()
+        hull_vertices = np.empty((0, 2), dtype='int64')
 
         block_windows = [w for _, w in dataset.block_windows(1)]
 
@@ -232,17 +364,20 @@ class RasterDriver(Driver):
 
             valid_data_count += int(valid_data.size)
 
+            # accumulate hull vertices in pixel coordinates of the whole dataset
             if np.any(block_data.mask):
                 hull_candidates = RasterDriver._hull_candidate_mask(~block_data.mask)
-                hull_shapes = [geometry.shape(s) for s, _ in features.shapes(
-                    np.ones(hull_candidates.shape, 'uint8'),
-                    mask=hull_candidates,
-                    transform=windows.transform(w, dataset.transform)
-                )]
+                block_corners = RasterDriver._hull_candidate_corners(hull_candidates)
             else:
-                w, s, e, n = windows.bounds(w, dataset.transform)
-                hull_shapes = [geometry.Polygon([(w, s), (e, s), (e, n), (w, n)])]
-            convex_hull = geometry.MultiPolygon([convex_hull, *hull_shapes]).convex_hull
+                width, height = int(w.width), int(w.height)
+                block_corners = np.array(
+                    [[0, 0], [width, 0], [0, height], [width, height]], dtype='int64'
+                )
+            block_corners += np.array([int(w.col_off), int(w.row_off)], dtype='int64')
+
+            hull_vertices = RasterDriver._monotone_chain_hull(
+                np.concatenate((hull_vertices, block_corners))
+            )
 
             tdigest.update(valid_data)
             sstats.update(valid_data)
@@ -250,16 +385,28 @@ class RasterDriver(Driver):
         if sstats.count() == 0:
             return None
 
+        convex_hull = RasterDriver._hull_polygon(hull_vertices, dataset.transform)
         convex_hull_wgs = warp.transform_geom(
             dataset.crs, 'epsg:4326', geometry.mapping(convex_hull)
         )
 
+        data_range = (sstats.min(), sstats.max())
+
+        # approximate histogram from the digest's CDF to avoid another pass over the data
+        if data_range[1] > data_range[0]:
+            cdf = tdigest.cdf(RasterDriver._histogram_edges(data_range))
+            cdf[0], cdf[-1] = 0., 1.
+            histogram = np.diff(np.round(cdf * valid_data_count)).astype('int64')
+        else:
+            histogram = RasterDriver._compute_histogram(np.empty(valid_data_count), data_range)
+
         return {
             'valid_percentage': valid_data_count / total_count * 100,
-            'range': (sstats.min(), sstats.max()),
+            'range': data_range,
             'mean': sstats.mean(),
             'stdev': sstats.std(),
             'percentiles': tdigest.quantile(np.arange(0.01, 1, 0.01)),
+            'histogram': histogram,
             'convex_hull': convex_hull_wgs
         }
 
@@ -267,7 +414,7 @@ class RasterDriver(Driver):
     def _compute_image_stats(dataset: 'DatasetReader',
                              max_shape: Sequence[int] = None) -> Optional[Dict[str, Any]]:
         """Compute statistics for the given rasterio dataset by reading it into memory."""
-        from rasterio import features, warp, transform
+        from rasterio import warp, transform
         from shapely import geometry
 
         out_shape = (dataset.height, dataset.width)
@@ -297,12 +444,10 @@ class RasterDriver(Driver):
 
         if np.any(raster_data.mask):
             hull_candidates = RasterDriver._hull_candidate_mask(~raster_data.mask)
-            hull_shapes = (geometry.shape(s) for s, _ in features.shapes(
-                np.ones(hull_candidates.shape, 'uint8'),
-                mask=hull_candidates,
-                transform=data_transform
-            ))
-            convex_hull = geometry.MultiPolygon(hull_shapes).convex_hull
+            hull_vertices = RasterDriver._monotone_chain_hull(
+                RasterDriver._hull_candidate_corners(hull_candidates)
+            )
+            convex_hull = RasterDriver._hull_polygon(hull_vertices, data_transform)
         else:
             # no masked entries -> convex hull == dataset bounds
             w, s, e, n = dataset.bounds
@@ -312,12 +457,15 @@ class RasterDriver(Driver):
             dataset.crs, 'epsg:4326', geometry.mapping(convex_hull)
         )
 
+        data_range = (float(valid_data.min()), float(valid_data.max()))
+
         return {
             'valid_percentage': valid_data.size / raster_data.size * 100,
-            'range': (float(valid_data.min()), float(valid_data.max())),
+            'range': data_range,
             'mean': float(valid_data.mean()),
             'stdev': float(valid_data.std()),
             'percentiles': np.percentile(valid_data, np.arange(1, 100)),
+            'histogram': RasterDriver._compute_histogram(valid_data, data_range),
             'convex_hull': convex_hull_wgs
         }
 
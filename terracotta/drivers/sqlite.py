@@ -4,13 +4,14 @@ SQLite-backed raster driver. Metadata is stored in an SQLite database, raster da
 to be present on disk.
 """
 
-from typing import Any, List, Sequence, Mapping, Tuple, Union, Iterator, Dict, cast
+from typing import Any, List, Sequence, Mapping, Tuple, Union, Iterator, Dict, Optional, cast
 import os
 import contextlib
 from contextlib import AbstractContextManager
 import json
 import re
 import sqlite3
+import threading
 from sqlite3 import Connection
 from pathlib import Path
 from collections import OrderedDict
@@ -53,19 +54,18 @@ class SQLiteDriver(RasterDriver):
         For remote SQLite databases hosted on S3, use
         :class:`~terracotta.drivers.sqlite_remote.RemoteSQLiteDriver`.
 
-    The SQLite database consists of 4 different tables:
+    The SQLite database consists of 5 different tables:
 
     - ``terracotta``: Metadata about the database itself.
     - ``keys``: Contains two columns holding all available keys and their description.
     - ``datasets``: Maps key values to physical raster path.
-    - ``metadata``: Contains actual metadata as separate columns. Indexed via key values.
+    - ``metadata``: Contains actual metadata as separate columns. Indexed via key values and
+      an integer ID.
+    - ``dataset_bounds``: R*Tree spatial index over the bounds of all datasets with metadata.
+      Indexed via the ID of the ``metadata`` table.
 
-    This driver caches raster data, but not metadata.
-
-    Warning:
-
-        This driver is not thread-safe. It is not possible to connect to the database
-        outside the main thread.
+    This driver caches raster data, but not metadata. Connections are kept per thread,
+    so a single driver instance can be shared between threads.
 
     """
     _KEY_TYPE: str = 'VARCHAR[256]'
@@ -81,6 +81,7 @@ class SQLiteDriver(RasterDriver):
         ('mean', 'REAL'),
         ('stdev', 'REAL'),
         ('percentiles', 'BLOB'),
+        ('histogram', 'BLOB'),
         ('metadata', 'VARCHAR[max]')
     )
 
@@ -100,11 +101,37 @@ class SQLiteDriver(RasterDriver):
         self.DB_CONNECTION_TIMEOUT: int = settings.DB_CONNECTION_TIMEOUT
         self.LAZY_LOADING_MAX_SHAPE: Tuple[int, int] = settings.LAZY_LOADING_MAX_SHAPE
 
-        self._connection: Connection
-        self._connected = False
+        self._thread_state = threading.local()
+
+        # whether the spatial index can be used, None until the schema has been checked
+        self._spatial_index_available: Optional[bool] = None
 
         super().__init__(os.path.realpath(path))
 
+    @property
+    def _connected(self) -> bool:
+        return getattr(self._thread_state, 'connected', False)
+
+    @_connected.setter
+    def _connected(self, value: bool) -> None:
+        self._thread_state.connected = value
+
+    @property
+    def _connection(self) -> Connection:
+        return self._thread_state.connection
+
+    @_connection.setter
+    def _connection(self, value: Connection) -> None:
+        self._thread_state.connection = value
+
+    @property
+    def _has_spatial_index(self) -> bool:
+        return getattr(self._thread_state, 'has_spatial_index', True)
+
+    @_has_spatial_index.setter
+    def _has_spatial_index(self, value: bool) -> None:
+        self._thread_state.has_spatial_index = value
+
     @classmethod
     def _normalize_path(cls, path: str) -> str:
         return os.path.normpath(os.path.realpath(path))
@@ -112,16 +139,19 @@ class SQLiteDriver(RasterDriver):
     def connect(self) -> AbstractContextManager:
         return self._connect(check=True)
 
+    def _open_connection(self) -> Connection:
+        """Open a new connection to the database, with rows accessible by column name"""
+        connection = sqlite3.connect(self.path, timeout=self.DB_CONNECTION_TIMEOUT)
+        connection.row_factory = sqlite3.Row
+        return connection
+
     @contextlib.contextmanager
     def _connect(self, check: bool = True) -> Iterator:
         try:
             close = False
             if not self._connected:
                 with convert_exceptions(_ERROR_ON_CONNECT):
-                    self._connection = sqlite3.connect(
-                        self.path, timeout=self.DB_CONNECTION_TIMEOUT
-                    )
-                self._connection.row_factory = sqlite3.Row
+                    self._connection = self._open_connection()
                 self._connected = close = True
 
                 if check:
@@ -164,6 +194,98 @@ class SQLiteDriver(RasterDriver):
                 f'but this is v{current_version}'
             )
 
+        has_spatial_index = self._spatial_index_available
+        if has_spatial_index is None:
+            has_spatial_index = self._upgrade_schema()
+
+        self._has_spatial_index = has_spatial_index
+
+    def _inspect_schema(self) -> Tuple[List[str], bool]:
+        """Return the columns of the metadata table, and whether the bounds table exists"""
+        conn = self._connection
+        metadata_columns = [row['name'] for row in conn.execute('PRAGMA table_info(metadata)')]
+        has_bounds_table = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='dataset_bounds'"
+        ).fetchone() is not None
+        return metadata_columns, has_bounds_table
+
+    def _upgrade_schema(self) -> bool:
+        """Add columns and tables introduced after the database was created.
+
+        Returns whether the spatial index can be used. Read-only databases are served
+        without histograms and spatial index.
+        """
+        conn = self._connection
+        metadata_columns, has_bounds_table = self._inspect_schema()
+
+        if 'histogram' in metadata_columns and 'id' in metadata_columns and has_bounds_table:
+            self._spatial_index_available = True
+            return True
+
+        try:
+            # DDL does not start an implicit transaction in sqlite3, so lock explicitly to
+            # make the upgrade atomic and wait for concurrent upgrades
+            conn.execute('BEGIN IMMEDIATE')
+
+            # another connection may have upgraded the database in the meantime
+            metadata_columns, has_bounds_table = self._inspect_schema()
+
+            if 'histogram' not in metadata_columns:
+                conn.execute('ALTER TABLE metadata ADD COLUMN histogram BLOB')
+
+            if 'id' not in metadata_columns:
+                # the spatial index must not refer to implicit row IDs, which may change
+                # during VACUUM, so re-create the table with an explicit ID column
+                conn.execute('ALTER TABLE metadata RENAME TO metadata_old')
+                self._create_metadata_table(self.key_names)
+
+                column_string = ', '.join(
+                    (*self.key_names, *(col for col, _ in self._METADATA_COLUMNS))
+                )
+                conn.execute(f'INSERT INTO metadata ({column_string}) '
+                             f'SELECT {column_string} FROM metadata_old')
+                conn.execute('DROP TABLE metadata_old')
+                conn.execute('DROP TABLE IF EXISTS dataset_bounds')
+                self._create_spatial_index()
+
+            elif not has_bounds_table:
+                self._create_spatial_index()
+
+            conn.commit()
+
+        except sqlite3.OperationalError as exc:
+            conn.rollback()
+            metadata_columns, has_bounds_table = self._inspect_schema()
+            has_spatial_index = 'id' in metadata_columns and has_bounds_table
+
+            # try again on the next connection if the database is only locked right now
+            if 'locked' not in str(exc):
+                self._spatial_index_available = has_spatial_index
+
+            return has_spatial_index
+
+        self._spatial_index_available = True
+        return True
+
+    def _create_metadata_table(self, keys: Sequence[str]) -> None:
+        key_string = ', '.join([f'{key} {self._KEY_TYPE}' for key in keys])
+        column_string = ', '.join(f'{col} {col_type}' for col, col_type
+                                  in self._METADATA_COLUMNS)
+        self._connection.execute(
+            f'CREATE TABLE metadata (id INTEGER PRIMARY KEY, {key_string}, {column_string}, '
+            f'UNIQUE ({", ".join(keys)}))'
+        )
+
+    def _create_spatial_index(self) -> None:
+        """Create the R*Tree index over dataset bounds, from the bounds stored in metadata"""
+        conn = self._connection
+        conn.execute('CREATE VIRTUAL TABLE dataset_bounds USING rtree('
+                     'id, west, east, south, north)')
+        # bounds columns hold (west, south, east, north) in this order
+        conn.execute('INSERT INTO dataset_bounds '
+                     'SELECT id, bounds_north, bounds_south, bounds_east, bounds_west '
+                     'FROM metadata')
+
     def _get_key_names(self) -> Tuple[str, ...]:
         """Names of all keys defined by the database"""
         return tuple(self.get_keys().keys())
@@ -214,10 +336,8 @@ class SQLiteDriver(RasterDriver):
             conn.execute(f'CREATE TABLE datasets ({key_string}, filepath VARCHAR[8000], '
                          f'PRIMARY KEY({", ".join(keys)}))')
 
-            column_string = ', '.join(f'{col} {col_type}' for col, col_type
-                                      in self._METADATA_COLUMNS)
-            conn.execute(f'CREATE TABLE metadata ({key_string}, {column_string}, '
-                         f'PRIMARY KEY ({", ".join(keys)}))')
+            self._create_metadata_table(keys)
+            self._create_spatial_index()
 
     @requires_connection
     @convert_exceptions('Could not retrieve keys from database')
@@ -234,7 +354,8 @@ class SQLiteDriver(RasterDriver):
     @requires_connection
     @convert_exceptions('Could not retrieve datasets')
     def get_datasets(self, where: Mapping[str, Union[str, List[str]]] = None,
-                     page: int = 0, limit: int = None) -> Dict[Tuple[str, ...], str]:
+                     page: int = 0, limit: int = None, *,
+                     where_bbox: Sequence[float] = None) -> Dict[Tuple[str, ...], str]:
         conn = self._connection
 
         if limit is not None:
@@ -246,24 +367,48 @@ class SQLiteDriver(RasterDriver):
         # sort by keys to ensure deterministic results
         order_fragment = f'ORDER BY {", ".join(self.key_names)}'
 
-        if where is None:
-            rows = conn.execute(f'SELECT * FROM datasets {order_fragment} {page_fragment}')
-        else:
+        conditions = []
+        values: List[Any] = []
+
+        if where is not None:
             if not all(key in self.key_names for key in where.keys()):
                 raise exceptions.InvalidKeyError('Encountered unrecognized keys in '
                                                  'where clause')
-            conditions = []
-            values = []
             for key, value in where.items():
                 if isinstance(value, str):
                     value = [value]
                 values.extend(value)
                 conditions.append(' OR '.join([f'{key}=?'] * len(value)))
-            where_fragment = ' AND '.join([f'({condition})' for condition in conditions])
-            rows = conn.execute(
-                f'SELECT * FROM datasets WHERE {where_fragment} {order_fragment} {page_fragment}',
-                values
-            )
+
+        if where_bbox is not None:
+            west, south, east, north = where_bbox
+            key_string = ', '.join(self.key_names)
+
+            if self._has_spatial_index:
+                conditions.append(
+                    f'({key_string}) IN (SELECT {key_string} FROM metadata WHERE id IN ('
+                    'SELECT id FROM dataset_bounds '
+                    'WHERE west <= ? AND east >= ? AND south <= ? AND north >= ?))'
+                )
+            else:
+                # bounds columns hold (west, south, east, north) in this order
+                conditions.append(
+                    f'({key_string}) IN (SELECT {key_string} FROM metadata '
+                    'WHERE bounds_north <= ? AND bounds_south >= ? '
+                    'AND bounds_east <= ? AND bounds_west >= ?)'
+                )
+
+            values.extend([east, west, north, south])
+
+        if conditions:
+            where_fragment = 'WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+        else:
+            where_fragment = ''
+
+        rows = conn.execute(
+            f'SELECT * FROM datasets {where_fragment} {order_fragment} {page_fragment}',
+            values
+        )
 
         def keytuple(row: Dict[str, Any]) -> Tuple[str, ...]:
             return tuple(row[key] for key in self.key_names)
@@ -285,6 +430,7 @@ class SQLiteDriver(RasterDriver):
             'mean': decoded['mean'],
             'stdev': decoded['stdev'],
             'percentiles': np.array(decoded['percentiles'], dtype='float32').tobytes(),
+            'histogram': RasterDriver._encode_histogram(decoded.get('histogram')),
             'metadata': json.dumps(decoded['metadata'])
         }
         return encoded
@@ -300,6 +446,7 @@ class SQLiteDriver(RasterDriver):
             'mean': encoded['mean'],
             'stdev': encoded['stdev'],
             'percentiles': np.frombuffer(encoded['percentiles'], dtype='float32').tolist(),
+            'histogram': RasterDriver._decode_histogram(encoded.get('histogram')),
             'metadata': json.loads(encoded['metadata'])
         }
         return decoded
@@ -333,7 +480,9 @@ class SQLiteDriver(RasterDriver):
         assert row
 
         data_columns, _ = zip(*self._METADATA_COLUMNS)
-        encoded_data = {col: row[col] for col in self.key_names + data_columns}
+        row_columns = row.keys()
+        encoded_data = {col: row[col] for col in self.key_names + data_columns
+                        if col in row_columns}
         return self._decode_data(encoded_data)
 
     @trace('insert')
@@ -364,11 +513,21 @@ class SQLiteDriver(RasterDriver):
             metadata = self.compute_metadata(filepath)
 
         if metadata is not None:
+            where_string = ' AND '.join([f'{key}=?' for key in self.key_names])
+            conn.execute('DELETE FROM dataset_bounds WHERE id IN '
+                         f'(SELECT id FROM metadata WHERE {where_string})', keys)
+
             encoded_data = self._encode_data(metadata)
             row_keys, row_values = zip(*encoded_data.items())
             template_string = ', '.join(['?'] * (len(keys) + len(row_values)))
-            conn.execute(f'INSERT OR REPLACE INTO metadata ({", ".join(self.key_names)}, '
-                         f'{", ".join(row_keys)}) VALUES ({template_string})', [*keys, *row_values])
+            cursor = conn.execute(
+                f'INSERT OR REPLACE INTO metadata ({", ".join(self.key_names)}, '
+                f'{", ".join(row_keys)}) VALUES ({template_string})', [*keys, *row_values]
+            )
+
+            west, south, east, north = metadata['bounds']
+            conn.execute('INSERT INTO dataset_bounds VALUES (?, ?, ?, ?, ?)',
+                         [cursor.lastrowid, west, east, south, north])
 
     @trace('delete')
     @requires_connection
@@ -389,4 +548,6 @@ class SQLiteDriver(RasterDriver):
 
         where_string = ' AND '.join([f'{key}=?' for key in self.key_names])
         conn.execute(f'DELETE FROM datasets WHERE {where_string}', keys)
+        conn.execute('DELETE FROM dataset_bounds WHERE id IN '
+                     f'(SELECT id FROM metadata WHERE {where_string})', keys)
         conn.execute(f'DELETE FROM metadata WHERE {where_string}', keys)
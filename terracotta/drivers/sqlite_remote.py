@@ -4,21 +4,48 @@ SQLite-backed raster driver. Metadata is stored in an SQLite database, raster da
 to be present on disk.
 """
 
-from typing import Any, Iterator
+from typing import Any, Iterator, Optional, Tuple, TYPE_CHECKING, cast
 import os
+import glob
 import time
 import tempfile
 import shutil
+import hashlib
 import logging
+import threading
+import warnings
 import contextlib
 import urllib.parse as urlparse
+import sqlite3
+from sqlite3 import Connection
 
 from terracotta import get_settings, exceptions
 from terracotta.drivers.sqlite import SQLiteDriver
 from terracotta.profile import trace
 
+if TYPE_CHECKING:  # pragma: no cover
+    from terracotta.drivers.sqlite_remote_vfs import RemoteFile
+
+try:
+    import apsw  # noqa: F401
+    has_apsw = True
+except ImportError:  # pragma: no cover
+    has_apsw = False
+
 logger = logging.getLogger(__name__)
 
+#: Maximum number of bytes of a cached database to map into memory (capped by SQLite)
+MMAP_SIZE = 2 ** 40
+
+#: Seconds to keep cached blocks of outdated versions after REMOTE_DB_CACHE_TTL has passed,
+#: for queries of other processes that are still running on them
+PRUNE_GRACE_PERIOD = 60
+
+
+class RemoteDatabaseChangedError(exceptions.InvalidDatabaseError):
+    """Raised when the remote database changes while reading from it via range requests"""
+    pass
+
 
 @contextlib.contextmanager
 def convert_exceptions(msg: str) -> Iterator:
@@ -31,23 +58,100 @@ def convert_exceptions(msg: str) -> Iterator:
         raise exceptions.InvalidDatabaseError(msg) from exc
 
 
-def _update_from_s3(remote_path: str, local_path: str) -> None:
-    import boto3
-
+def _parse_s3_url(remote_path: str) -> Tuple[str, str]:
     parsed_remote_path = urlparse.urlparse(remote_path)
-    bucket_name, key = parsed_remote_path.netloc, parsed_remote_path.path.strip('/')
 
     if parsed_remote_path.scheme != 's3':
         raise ValueError('Expected s3:// URL')
 
-    s3 = boto3.resource('s3')
-    obj = s3.Object(bucket_name, key)
-    obj_bytes = obj.get()['Body']
+    return parsed_remote_path.netloc, parsed_remote_path.path.strip('/')
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+
+
+def _get_s3_etag(remote_path: str) -> str:
+    import boto3
+
+    bucket_name, key = _parse_s3_url(remote_path)
+
+    s3 = boto3.client('s3')
+    return s3.head_object(Bucket=bucket_name, Key=key)['ETag']
+
+
+def _download_from_s3(remote_path: str, local_path: str, etag: str) -> None:
+    import boto3
+
+    bucket_name, key = _parse_s3_url(remote_path)
+
+    s3 = boto3.client('s3')
+    # make sure the downloaded database is the version we expect
+    response = s3.get_object(Bucket=bucket_name, Key=key, IfMatch=etag)
+
+    # download next to the target, then move atomically so nobody reads a partial file
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(local_path), prefix='tc_s3_db_', suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(response['Body'], f)
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def _file_lock(path: str, shared: bool = False) -> Iterator:
+    """Hold an exclusive (or shared) lock on the given file, across threads and processes"""
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover
+        # no locking on Windows; concurrent downloads are still safe, just wasteful
+        yield
+        return
 
-    # copy over existing database; this is somewhat safe since it is read-only
-    # NOTE: replace with Connection.backup after switching to Python 3.7
-    with open(local_path, 'wb') as f:
-        shutil.copyfileobj(obj_bytes, f)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _open_s3_range_reader(remote_path: str, cache_prefix: str,
+                          block_size: int) -> 'RemoteFile':
+    import boto3
+    from terracotta.drivers.sqlite_remote_vfs import RemoteFile
+
+    bucket_name, key = _parse_s3_url(remote_path)
+
+    s3 = boto3.client('s3')
+    head = s3.head_object(Bucket=bucket_name, Key=key)
+    etag = head['ETag']
+
+    def fetch_range(start: int, stop: int) -> bytes:
+        import botocore.exceptions
+
+        try:
+            # fails if the remote database changes, instead of mixing pages of different versions
+            response = s3.get_object(
+                Bucket=bucket_name, Key=key, Range=f'bytes={start}-{stop - 1}', IfMatch=etag
+            )
+        except botocore.exceptions.ClientError as exc:
+            if exc.response.get('Error', {}).get('Code') == 'PreconditionFailed':
+                raise RemoteDatabaseChangedError(
+                    'Remote database changed while reading from it'
+                ) from exc
+            raise
+
+        return response['Body'].read()
+
+    # cached blocks are only valid for this version of the database
+    block_cache_dir = f'{cache_prefix}_{_hash(etag)}'
+
+    return RemoteFile(fetch_range, head['ContentLength'], block_cache_dir, block_size)
 
 
 class RemoteSQLiteDriver(SQLiteDriver):
@@ -62,11 +166,30 @@ class RemoteSQLiteDriver(SQLiteDriver):
         driver.
 
     The SQLite database is simply a file that can be stored together with the actual
-    raster files on S3. Before handling the first request, this driver will download a
-    temporary copy of the remote database file. It is thus not feasible for large databases.
-
-    The local database copy will be updated in regular intervals defined by
-    :attr:`~terracotta.config.TerracottaSettings.REMOTE_DB_CACHE_TTL`.
+    raster files on S3. There are two ways to access it:
+
+    - By default, the driver downloads a copy of the whole database before handling the
+      first request. Copies are stored in
+      :attr:`~terracotta.config.TerracottaSettings.REMOTE_DB_CACHE_DIR` under a name
+      derived from the remote path and its ETag, and are shared between all processes on
+      the host: only one process downloads each version of the database, all others reuse
+      it through read-only, memory-mapped connections. Queries are as fast as with a local
+      database, so this is the best choice for databases that are small enough to
+      download quickly.
+
+    - If :attr:`~terracotta.config.TerracottaSettings.REMOTE_DB_RANGE_REQUESTS` is set
+      (requires `APSW <https://github.com/rogerbinns/apsw>`__), the driver only fetches
+      the blocks of the database that are actually read by a query, via HTTP range
+      requests, and caches them on disk. Startup does not depend on the size of the
+      database, but the first queries touching a block wait for it to be fetched, so this
+      is the choice for large databases.
+
+    The database is checked for new versions in regular intervals defined by
+    :attr:`~terracotta.config.TerracottaSettings.REMOTE_DB_CACHE_TTL`. Only the first
+    connection waits for the database; later updates happen in a background thread while
+    requests are answered from the current version, and cost a single HEAD request if the
+    remote database is unchanged. Cached copies and blocks of outdated versions are
+    removed once no other process can still be using them.
 
     Warning:
 
@@ -88,21 +211,36 @@ class RemoteSQLiteDriver(SQLiteDriver):
         """
         settings = get_settings()
 
-        self.__rm = os.remove  # keep reference to use in __del__
-
         os.makedirs(settings.REMOTE_DB_CACHE_DIR, exist_ok=True)
-        local_db_file = tempfile.NamedTemporaryFile(
-            dir=settings.REMOTE_DB_CACHE_DIR,
-            prefix='tc_s3_db_',
-            suffix='.sqlite',
-            delete=False
-        )
-        local_db_file.close()
 
         self._remote_path = str(remote_path)
+        self._cache_prefix = os.path.join(
+            settings.REMOTE_DB_CACHE_DIR, f'tc_s3_db_{_hash(self._remote_path)}'
+        )
+        self._block_cache_prefix = os.path.join(
+            settings.REMOTE_DB_CACHE_DIR, f'tc_s3_blocks_{_hash(self._remote_path)}'
+        )
         self._last_updated = -float('inf')
+        self._etag: Optional[str] = None
+
+        # held while the database is updated, so there is at most one update at a time
+        self._update_lock = threading.Lock()
+        self._update_thread: Optional[threading.Thread] = None
+
+        self._range_requests = settings.REMOTE_DB_RANGE_REQUESTS
+        if self._range_requests and not has_apsw:
+            warnings.warn(
+                'REMOTE_DB_RANGE_REQUESTS requires APSW to be installed. '
+                'Falling back to downloading the whole database.',
+                exceptions.PerformanceWarning
+            )
+            self._range_requests = False
 
-        super().__init__(local_db_file.name)
+        self._remote_file: Optional['RemoteFile'] = None
+        self._prune_blocks_after: Optional[float] = None
+
+        # replaced by the path of the cached copy of the current version on first update
+        super().__init__(f'{self._cache_prefix}.sqlite')
 
     @classmethod
     def _normalize_path(cls, path: str) -> str:
@@ -119,19 +257,163 @@ class RemoteSQLiteDriver(SQLiteDriver):
         path = path.rstrip('/')
         return path
 
+    def _has_local_copy(self) -> bool:
+        if self._range_requests:
+            return self._remote_file is not None
+        # copies of outdated versions may be removed by other processes
+        return self._etag is not None and os.path.isfile(self.path)
+
+    def _prune_cache(self, keep: str) -> None:
+        """Remove cached copies of other versions of this database"""
+        paths = glob.glob(f'{glob.escape(self._cache_prefix)}_*.sqlite*')
+        copies = {path[:-len('.lock')] if path.endswith('.lock') else path for path in paths}
+
+        for path in copies - {keep}:
+            # wait for processes that are about to open this copy (see _open_connection);
+            # open connections keep working after the file is removed
+            with _file_lock(f'{path}.lock'):
+                for filename in (path, f'{path}.lock'):
+                    try:
+                        os.remove(filename)
+                    except OSError:
+                        # still in use (on Windows) or removed by another process
+                        pass
+
+    def _prune_block_cache(self, keep: str) -> None:
+        """Remove cached blocks of other versions of this database"""
+        for path in glob.glob(f'{glob.escape(self._block_cache_prefix)}_*'):
+            if path == keep:
+                continue
+
+            shutil.rmtree(path, ignore_errors=True)
+
     @convert_exceptions('Could not retrieve database from S3')
     @trace('download_db_from_s3')
-    def _update_db(self, remote_path: str, local_path: str) -> None:
+    def _refresh_db(self) -> None:
         settings = get_settings()
 
-        if self._last_updated < time.time() - settings.REMOTE_DB_CACHE_TTL:
-            logger.debug('Remote database cache expired, re-downloading')
-            _update_from_s3(remote_path, local_path)
+        if self._range_requests:
+            logger.debug('Remote database cache expired, checking for new version')
+            remote_file = _open_s3_range_reader(
+                self._remote_path, self._block_cache_prefix, settings.REMOTE_DB_BLOCK_SIZE
+            )
+
+            is_new_version = (
+                self._remote_file is None or remote_file.cache_dir != self._remote_file.cache_dir
+            )
+            self._remote_file = remote_file
+
+            if is_new_version:
+                # other processes switch to the new version within one TTL, but may still
+                # be reading blocks of the old one until then
+                self._prune_blocks_after = (
+                    time.time() + settings.REMOTE_DB_CACHE_TTL + PRUNE_GRACE_PERIOD
+                )
+                # new versions may have a different schema
+                self._spatial_index_available = None
+
+            if self._prune_blocks_after is not None and time.time() >= self._prune_blocks_after:
+                self._prune_block_cache(keep=remote_file.cache_dir)
+                self._prune_blocks_after = None
+        else:
+            logger.debug('Remote database cache expired, checking for new version')
+            etag = _get_s3_etag(self._remote_path)
+            cache_path = f'{self._cache_prefix}_{_hash(etag)}.sqlite'
+
+            if not os.path.isfile(cache_path):
+                # only one process downloads each version, all others wait and reuse it
+                with _file_lock(f'{cache_path}.lock'):
+                    if not os.path.isfile(cache_path):
+                        logger.debug('Downloading new version of remote database')
+                        _download_from_s3(self._remote_path, cache_path, etag)
+                        self._prune_cache(keep=cache_path)
+
+            if cache_path != self.path:
+                self.path = cache_path
+                # new versions may have a different schema
+                self._spatial_index_available = None
+
+            self._etag = etag
+
+        self._last_updated = time.time()
+
+    def _refresh_db_in_background(self) -> None:
+        try:
+            self._refresh_db()
+        except Exception as exc:
+            # keep using the current copy, and try again after the next TTL
+            logger.warning('Could not update remote database: %s', exc)
             self._last_updated = time.time()
+        finally:
+            self._update_lock.release()
 
-    def _connection_callback(self) -> None:
-        self._update_db(self._remote_path, self.path)
-        super()._connection_callback()
+    def _update_db(self) -> None:
+        settings = get_settings()
+
+        if not self._has_local_copy():
+            # nothing to serve yet, so we have to wait
+            with self._update_lock:
+                if not self._has_local_copy():
+                    self._refresh_db()
+            return
+
+        if self._last_updated >= time.time() - settings.REMOTE_DB_CACHE_TTL:
+            return
+
+        if not self._update_lock.acquire(blocking=False):
+            # update already in progress
+            return
+
+        self._update_thread = threading.Thread(
+            target=self._refresh_db_in_background, daemon=True
+        )
+        self._update_thread.start()
+
+    @contextlib.contextmanager
+    def _connect(self, check: bool = True) -> Iterator:
+        try:
+            with super()._connect(check=check):
+                yield
+        except RemoteDatabaseChangedError:
+            # blocks of the current version are gone, so wait for the new version
+            # on the next connection
+            self._remote_file = None
+            self._last_updated = -float('inf')
+            raise
+
+    def _open_cached_copy(self) -> Connection:
+        while True:
+            self._update_db()
+            path = self.path
+
+            # copies are only removed under an exclusive lock (see _prune_cache),
+            # so the copy cannot disappear between checking for it and opening it
+            with _file_lock(f'{path}.lock', shared=True):
+                if not os.path.isfile(path):
+                    # outdated copy removed by another process, update and try again
+                    continue
+
+                # cached copies never change, so they can be opened immutable and their
+                # pages shared between all processes through memory mapping
+                connection = sqlite3.connect(
+                    f'file:{urlparse.quote(path)}?mode=ro&immutable=1', uri=True,
+                    timeout=self.DB_CONNECTION_TIMEOUT
+                )
+
+            connection.row_factory = sqlite3.Row
+            connection.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            return connection
+
+    def _open_connection(self) -> Connection:
+        if not self._range_requests:
+            return self._open_cached_copy()
+
+        from terracotta.drivers.sqlite_remote_vfs import connect
+
+        self._update_db()
+        assert self._remote_file is not None
+        # the adapter implements the parts of the sqlite3 interface used by the driver
+        return cast(Connection, connect(self.path, self._remote_file))
 
     def create(self, *args: Any, **kwargs: Any) -> None:
         raise NotImplementedError('Remote SQLite databases are read-only')
@@ -141,7 +423,3 @@ class RemoteSQLiteDriver(SQLiteDriver):
 
     def delete(self, *args: Any, **kwargs: Any) -> None:
         raise NotImplementedError('Remote SQLite databases are read-only')
-
-    def __del__(self) -> None:
-        """Clean up temporary database upon exit"""
-        self.__rm(self.path)
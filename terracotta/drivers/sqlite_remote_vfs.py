@@ -0,0 +1,257 @@
+"""drivers/sqlite_remote_vfs.py
+
+SQLite VFS that reads pages of a remote database on demand through range requests,
+backed by a block cache on disk. Requires APSW.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import sqlite3
+import tempfile
+import threading
+import urllib.parse
+
+import apsw
+
+#: Name under which the VFS is registered with SQLite
+VFS_NAME = 'terracotta-remote'
+
+#: Function fetching the given byte range [start, stop) of a remote file
+RangeFetcher = Callable[[int, int], bytes]
+
+
+class RemoteFile:
+    """A read-only remote file, fetched in blocks that are cached on disk.
+
+    Reads that span several missing blocks fetch all contiguous missing blocks with a
+    single request. Cached blocks are written atomically, so the cache directory can be
+    shared between threads and processes.
+    """
+
+    def __init__(self, fetch_range: RangeFetcher, size: int, cache_dir: str,
+                 block_size: int) -> None:
+        self.fetch_range = fetch_range
+        self.size = size
+        self.cache_dir = cache_dir
+        self.block_size = block_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _block_path(self, index: int) -> str:
+        return os.path.join(self.cache_dir, f'{index}.block')
+
+    def _read_cached_block(self, index: int) -> Optional[bytes]:
+        try:
+            with open(self._block_path(index), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_cached_block(self, index: int, data: bytes) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        except FileNotFoundError:
+            # cache of an outdated version, removed by another process
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._block_path(index))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _fetch_blocks(self, indices: Sequence[int]) -> Dict[int, bytes]:
+        start = indices[0] * self.block_size
+        stop = min((indices[-1] + 1) * self.block_size, self.size)
+        data = self.fetch_range(start, stop)
+
+        if len(data) != stop - start:
+            raise IOError(f'expected {stop - start} bytes from remote, got {len(data)}')
+
+        blocks = {}
+        for i, index in enumerate(indices):
+            block = data[i * self.block_size:(i + 1) * self.block_size]
+            self._write_cached_block(index, block)
+            blocks[index] = block
+
+        return blocks
+
+    def read(self, amount: int, offset: int) -> bytes:
+        """Read amount bytes starting at offset (may return less at the end of the file)"""
+        stop = min(offset + amount, self.size)
+        if stop <= offset:
+            return b''
+
+        first_block = offset // self.block_size
+        last_block = (stop - 1) // self.block_size
+
+        blocks: Dict[int, bytes] = {}
+        missing_runs: List[List[int]] = []
+
+        for index in range(first_block, last_block + 1):
+            block = self._read_cached_block(index)
+
+            if block is not None:
+                blocks[index] = block
+            elif missing_runs and missing_runs[-1][-1] == index - 1:
+                missing_runs[-1].append(index)
+            else:
+                missing_runs.append([index])
+
+        for run in missing_runs:
+            blocks.update(self._fetch_blocks(run))
+
+        data = b''.join(blocks[index] for index in range(first_block, last_block + 1))
+        start_in_data = offset - first_block * self.block_size
+        return data[start_in_data:start_in_data + stop - offset]
+
+
+class RemoteVFSFile:
+    """SQLite file object reading from a RemoteFile"""
+
+    def __init__(self, remote_file: RemoteFile) -> None:
+        self.remote_file = remote_file
+
+    def xRead(self, amount: int, offset: int) -> bytes:
+        return self.remote_file.read(amount, offset)
+
+    def xFileSize(self) -> int:
+        return self.remote_file.size
+
+    def xDeviceCharacteristics(self) -> int:
+        # the remote file never changes while it is open
+        return apsw.SQLITE_IOCAP_IMMUTABLE
+
+    def xSectorSize(self) -> int:
+        return 0
+
+    def xFileControl(self, op: int, pointer: int) -> bool:
+        return False
+
+    def xCheckReservedLock(self) -> bool:
+        return False
+
+    def xLock(self, level: int) -> None:
+        pass
+
+    def xUnlock(self, level: int) -> None:
+        pass
+
+    def xSync(self, flags: int) -> None:
+        pass
+
+    def xClose(self) -> None:
+        pass
+
+    def xWrite(self, data: bytes, offset: int) -> None:
+        raise apsw.ReadOnlyError('remote databases are read-only')
+
+    def xTruncate(self, size: int) -> None:
+        raise apsw.ReadOnlyError('remote databases are read-only')
+
+
+class RemoteVFS(apsw.VFS):
+    """SQLite VFS serving registered remote files by name"""
+
+    def __init__(self) -> None:
+        super().__init__(name=VFS_NAME, base='')
+        self._files: Dict[str, RemoteFile] = {}
+
+    def register(self, filename: str, remote_file: RemoteFile) -> None:
+        self._files[filename] = remote_file
+
+    # returns a duck-typed file object instead of an apsw.VFSFile, which would open a real file
+    def xOpen(self, name: Any, flags: List[int]) -> Any:
+        if isinstance(name, apsw.URIFilename):
+            name = name.filename()
+
+        try:
+            return RemoteVFSFile(self._files[name])
+        except KeyError:
+            # journals and other auxiliary files do not exist for read-only databases
+            raise apsw.CantOpenError(f'no remote file registered for {name}') from None
+
+    def xAccess(self, pathname: str, flags: int) -> bool:
+        return pathname in self._files
+
+    def xFullPathname(self, name: str) -> str:
+        return name
+
+    def xDelete(self, filename: str, syncdir: bool) -> None:
+        raise apsw.ReadOnlyError('remote databases are read-only')
+
+
+_vfs: Optional[RemoteVFS] = None
+_vfs_lock = threading.Lock()
+
+
+def get_vfs() -> RemoteVFS:
+    """Return the global VFS instance, registering it on first use"""
+    global _vfs
+
+    with _vfs_lock:
+        if _vfs is None:
+            _vfs = RemoteVFS()
+
+    return _vfs
+
+
+class Rows(list):
+    """Query results, with the cursor methods used by the SQLite driver"""
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        return self[0] if self else None
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+
+def _dict_row(cursor: apsw.Cursor, row: Tuple[Any, ...]) -> Dict[str, Any]:
+    return dict(zip((column for column, _ in cursor.get_description()), row))
+
+
+class Connection:
+    """Adapter exposing the subset of sqlite3.Connection used by the SQLite driver.
+
+    Rows are accessible by column name, and APSW errors are raised as
+    sqlite3.OperationalError.
+    """
+
+    def __init__(self, connection: apsw.Connection) -> None:
+        self._connection = connection
+        self._connection.row_trace = _dict_row
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()) -> Rows:
+        try:
+            # fetch all rows right away, so errors are raised (and converted) here
+            return Rows(self._connection.execute(sql, tuple(parameters)))
+        except apsw.Error as exc:
+            raise sqlite3.OperationalError(str(exc)) from exc
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        # only explicitly started transactions can be open
+        if not self._connection.getautocommit():
+            self._connection.execute('ROLLBACK')
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def connect(filename: str, remote_file: RemoteFile) -> Connection:
+    """Open a read-only connection to the given remote file"""
+    get_vfs().register(filename, remote_file)
+
+    try:
+        connection = apsw.Connection(
+            f'file:{urllib.parse.quote(filename)}?immutable=1',
+            flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI,
+            vfs=VFS_NAME
+        )
+    except apsw.Error as exc:
+        raise sqlite3.OperationalError(str(exc)) from exc
+
+    return Connection(connection)
@@ -3,13 +3,24 @@
 Safe execution of user-supplied math expressions
 """
 
-from typing import Mapping, Dict, Tuple, Callable, Type, Any
+from typing import (Mapping, Dict, Tuple, Callable, Type, Any, Set, Iterable, List, Sequence,
+                    Optional)
 import ast
 import operator
-import concurrent.futures
+import functools
+import time
 
 import numpy as np
 
+try:
+    import numexpr
+    has_numexpr = True
+except ImportError:  # pragma: no cover
+    has_numexpr = False
+
+
+#: Maximum number of compiled expressions to keep in memory
+EXPRESSION_CACHE_SIZE = 128
 
 EXTRA_CALLABLES: Dict[str, Tuple[Callable, int]] = {
     # 'name': (callable, nargs)
@@ -60,11 +71,78 @@ EXTRA_CONSTANTS = {
 }
 
 
+#: Number of elements evaluated at once by the fused evaluator (keeps temporaries in cache)
+FUSED_CHUNK_SIZE = 2 ** 16
+
+# Operations on plain arrays that can be fused (evaluated without masked-array temporaries).
+# np.ma masks results of domain errors (e.g. log(-1)) where NumPy returns nan / inf; this is
+# only equivalent as long as non-finite values survive until the final masked_invalid, so
+# operations with a domain may only be nested inside operations that preserve non-finite
+# values.
+FUSABLE_CALLABLES = frozenset({
+    'minimum', 'maximum', 'abs', 'sqrt', 'log', 'log10', 'exp', 'sin', 'cos', 'tan',
+    'sinh', 'cosh', 'tanh', 'arcsin', 'arccos', 'arctan', 'arcsinh', 'arccosh', 'arctanh'
+})
+DOMAIN_CALLABLES = frozenset({'sqrt', 'log', 'log10', 'arcsin', 'arccos', 'arccosh', 'arctanh'})
+NONFINITE_PRESERVING_CALLABLES = frozenset({
+    'abs', 'sqrt', 'log', 'log10', 'sin', 'cos', 'tan', 'sinh', 'cosh', 'arcsin', 'arccos',
+    'arcsinh', 'arccosh', 'arctanh'
+})
+DOMAIN_BINOPS = frozenset({ast.Div, ast.Mod, ast.Pow})
+NONFINITE_PRESERVING_OPS = frozenset({ast.Add, ast.Sub, ast.Mult, ast.USub})
+
+# numexpr is only used where it gives bit-identical results to NumPy: its transcendental
+# functions differ in the last digit, % follows C semantics, and float32 is upcast
+NUMEXPR_CALLABLES = frozenset({'abs', 'sqrt'})
+NUMEXPR_BINOPS = frozenset({ast.Add, ast.Sub, ast.Mult, ast.Div, ast.BitAnd, ast.BitOr})
+NUMEXPR_DTYPES = frozenset({np.dtype('float64')})
+
+
 class ParseException(Exception):
     pass
 
 
+class ExpressionTimeout(Exception):
+    pass
+
+
+class EvaluationContext:
+    """Operands and deadline of a single evaluation of a compiled expression.
+
+    In fused evaluation, invalid collects masks of elements that np.ma would mask but
+    that are not non-finite (integer modulo by zero).
+    """
+
+    __slots__ = ('operands', 'deadline', 'invalid')
+
+    def __init__(self, operands: Mapping[str, Any], deadline: float,
+                 invalid: Optional[List[Any]] = None) -> None:
+        self.operands = operands
+        self.deadline = deadline
+        self.invalid = invalid
+
+    def check_timeout(self) -> None:
+        if time.monotonic() >= self.deadline:
+            raise ExpressionTimeout()
+
+
+Evaluator = Callable[[EvaluationContext], Any]
+
+
+def _safe_pow(base: Any, exponent: Any) -> Any:
+    # exponentiation of Python integers is exact and can run (uninterruptibly) for ages
+    if isinstance(base, int) and isinstance(exponent, int):
+        return float(base) ** exponent
+    return operator.pow(base, exponent)
+
+
 class ExpressionParser(ast.NodeVisitor):
+    """Compiles a validated expression AST into a tree of evaluator closures.
+
+    All validation happens during compilation; evaluators only look up operands,
+    call whitelisted functions, and check the evaluation deadline before each operation.
+    """
+
     NODE_TO_BINOP: Dict[Type[ast.operator], Callable] = {
         # math
         ast.Add: operator.add,
@@ -72,7 +150,7 @@ class ExpressionParser(ast.NodeVisitor):
         ast.Mult: operator.mul,
         ast.Div: operator.truediv,
         ast.Mod: operator.mod,
-        ast.Pow: operator.pow,
+        ast.Pow: _safe_pow,
 
         # logic
         ast.BitAnd: operator.and_,
@@ -97,38 +175,88 @@ class ExpressionParser(ast.NodeVisitor):
                  callables: Mapping[str, Tuple[Callable, int]]) -> None:
         self.constants = constants
         self.callables = callables
+        self.operand_names: Set[str] = set()
+
+        # whether the expression can be evaluated on plain arrays, and by numexpr
+        self.fusable = True
+        self.numexpr_compatible = True
+        self._nonfinite_absorbing_depth = 0
 
-    def generic_visit(self, node: ast.AST) -> None:
+    def _visit_operands(self, nodes: Sequence[ast.AST], *, preserves_nonfinite: bool,
+                        has_domain: bool) -> List[Evaluator]:
+        if has_domain and self._nonfinite_absorbing_depth:
+            self.fusable = False
+
+        if preserves_nonfinite:
+            return [self.visit(node) for node in nodes]
+
+        self._nonfinite_absorbing_depth += 1
+        try:
+            return [self.visit(node) for node in nodes]
+        finally:
+            self._nonfinite_absorbing_depth -= 1
+
+    def generic_visit(self, node: ast.AST) -> Evaluator:
         # only visit allowed nodes
         raise ParseException(f'{type(node).__name__} not allowed in expressions')
 
-    def visit_Expression(self, node: ast.Expression) -> Any:
+    def visit_Expression(self, node: ast.Expression) -> Evaluator:
         return self.visit(node.body)
 
-    def visit_Name(self, node: ast.Name) -> Any:
-        if node.id in self.constants:
-            return self.constants[node.id]
+    def visit_Name(self, node: ast.Name) -> Evaluator:
+        name = node.id
+
+        if name in self.constants:
+            value = self.constants[name]
+            if value is np.ma.nomask:
+                self.fusable = False
+            return lambda ctx: value
 
-        if node.id in self.callables:
-            # return (function_name, callable, num_args)
-            return (node.id, *self.callables[node.id])
+        if name in self.callables:
+            raise ParseException(f'function \'{name}\' must be called')
 
-        raise ParseException(f'unrecognized name \'{node.id}\' in expression')
+        # anything else has to be supplied as operand
+        self.operand_names.add(name)
+        return lambda ctx: ctx.operands[name]
 
-    def visit_Call(self, node: ast.Call) -> Any:
-        funcname, func, nargs = self.visit(node.func)
+    def visit_Call(self, node: ast.Call) -> Evaluator:
+        if not isinstance(node.func, ast.Name):
+            return self.generic_visit(node.func)
+
+        funcname = node.func.id
+        if funcname not in self.callables:
+            raise ParseException(f'unrecognized name \'{funcname}\' in expression')
+
+        func, nargs = self.callables[funcname]
         got_nargs = len(node.args)
         if got_nargs != nargs:
             raise ParseException(
                 f'wrong number of arguments for function {funcname} '
                 f'(got {got_nargs}, expected {nargs})'
             )
-        return func(*map(self.visit, node.args))
 
-    def visit_Num(self, node: ast.Num) -> Any:
-        return node.n
+        if funcname not in FUSABLE_CALLABLES:
+            self.fusable = False
+        if funcname not in NUMEXPR_CALLABLES:
+            self.numexpr_compatible = False
+
+        args = self._visit_operands(
+            node.args,
+            preserves_nonfinite=funcname in NONFINITE_PRESERVING_CALLABLES,
+            has_domain=funcname in DOMAIN_CALLABLES
+        )
+
+        def evaluate_call(ctx: EvaluationContext) -> Any:
+            ctx.check_timeout()
+            return func(*[arg(ctx) for arg in args])
+
+        return evaluate_call
 
-    def visit_UnaryOp(self, node: ast.UnaryOp) -> Any:
+    def visit_Num(self, node: ast.Num) -> Evaluator:
+        value = node.n
+        return lambda ctx: value
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> Evaluator:
         op_type = type(node.op)
         if op_type not in ExpressionParser.NODE_TO_UNOP:
             raise ParseException(
@@ -136,19 +264,37 @@ class ExpressionParser(ast.NodeVisitor):
             )
 
         op_callable = ExpressionParser.NODE_TO_UNOP[op_type]
-        return op_callable(self.visit(node.operand))
+        operand, = self._visit_operands(
+            [node.operand],
+            preserves_nonfinite=op_type in NONFINITE_PRESERVING_OPS,
+            has_domain=False
+        )
+
+        def evaluate_unop(ctx: EvaluationContext) -> Any:
+            ctx.check_timeout()
+            return op_callable(operand(ctx))
+
+        return evaluate_unop
 
-    def visit_BinOp(self, node: ast.BinOp) -> Any:
+    def visit_BinOp(self, node: ast.BinOp) -> Evaluator:
         op_type = type(node.op)
         if op_type not in ExpressionParser.NODE_TO_BINOP:
             raise ParseException(
                 f'binary operator {op_type.__name__} not allowed in expressions'
             )
 
-        op_callable = ExpressionParser.NODE_TO_BINOP[op_type]
-        return op_callable(self.visit(node.left), self.visit(node.right))
+        if op_type not in NUMEXPR_BINOPS:
+            self.numexpr_compatible = False
 
-    def visit_Compare(self, node: ast.Compare) -> Any:
+        op_callable = ExpressionParser.NODE_TO_BINOP[op_type]
+        return self._compile_binary(
+            op_callable, node.left, node.right,
+            preserves_nonfinite=op_type in NONFINITE_PRESERVING_OPS,
+            has_domain=op_type in DOMAIN_BINOPS,
+            mask_zero_divisor=op_type is ast.Mod
+        )
+
+    def visit_Compare(self, node: ast.Compare) -> Evaluator:
         if len(node.ops) > 1:
             raise ParseException('chained comparisons are not supported')
 
@@ -159,40 +305,195 @@ class ExpressionParser(ast.NodeVisitor):
             )
 
         op_callable = ExpressionParser.NODE_TO_COMPOP[op_type]
-        return op_callable(self.visit(node.left), self.visit(node.comparators[0]))
+        return self._compile_binary(
+            op_callable, node.left, node.comparators[0],
+            preserves_nonfinite=False, has_domain=False
+        )
+
+    def _compile_binary(self, op_callable: Callable, left_node: ast.AST,
+                        right_node: ast.AST, *, preserves_nonfinite: bool,
+                        has_domain: bool, mask_zero_divisor: bool = False) -> Evaluator:
+        left, right = self._visit_operands(
+            [left_node, right_node],
+            preserves_nonfinite=preserves_nonfinite,
+            has_domain=has_domain
+        )
+
+        def evaluate_binop(ctx: EvaluationContext) -> Any:
+            ctx.check_timeout()
+            return op_callable(left(ctx), right(ctx))
+
+        if not mask_zero_divisor:
+            return evaluate_binop
+
+        def evaluate_masked_binop(ctx: EvaluationContext) -> Any:
+            ctx.check_timeout()
+            divisor = right(ctx)
+            result = op_callable(left(ctx), divisor)
+
+            # NumPy returns 0 for integer division by zero, where np.ma masks the result
+            if (
+                ctx.invalid is not None and isinstance(result, np.ndarray)
+                and result.dtype.kind in 'iu'
+            ):
+                ctx.invalid.append(np.equal(divisor, 0))
+
+            return result
+
+        return evaluate_masked_binop
+
+
+class CompiledExpression:
+    """A parsed and validated expression that can be evaluated many times.
+
+    Expressions that only use element-wise math are evaluated on plain arrays with a single
+    combined mask (via numexpr if available, otherwise in cache-sized chunks). All other
+    expressions are evaluated with masked array arithmetic.
+    """
+
+    def __init__(self, expr: str, evaluator: Evaluator, operand_names: Iterable[str],
+                 fusable: bool = False, numexpr_compatible: bool = False) -> None:
+        self.expr = expr
+        self.operand_names = frozenset(operand_names)
+        self.fusable = fusable and bool(self.operand_names)
+        self.numexpr_compatible = self.fusable and numexpr_compatible
+        self._evaluator = evaluator
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.expr!r})'
+
+    def __call__(self, operands: Mapping[str, np.ndarray], timeout: float = 1.) -> np.ndarray:
+        for name in sorted(self.operand_names):
+            if name not in operands:
+                raise ValueError(f'unrecognized name \'{name}\' in expression')
+
+        ctx = EvaluationContext(operands, time.monotonic() + timeout)
 
+        try:
+            if self.fusable:
+                result = self._evaluate_fused(ctx)
+            else:
+                result = self._evaluator(ctx)
 
-def evaluate_expression(expr: str,
-                        operands: Mapping[str, np.ndarray],
-                        timeout: float = 1.) -> np.ndarray:
-    try:
-        expr_ast = ast.parse(expr, filename='<expression>', mode='eval')
-    except SyntaxError as exc:
-        raise ValueError(f'given string {expr} is not a valid expression') from exc
+        except ExpressionTimeout:
+            raise RuntimeError('timeout during pattern evaluation') from None
 
-    eval_constants = dict(**operands, **EXTRA_CONSTANTS)
-    parser = ExpressionParser(eval_constants, EXTRA_CALLABLES)
+        except Exception as exc:
+            # pass only exception message to not leak traceback
+            raise ValueError(f'unexpected error while evaluating expression: {exc!s}') from None
 
-    with concurrent.futures.ThreadPoolExecutor(1) as executor:
-        future = executor.submit(parser.visit, expr_ast)
+        if not isinstance(result, np.ndarray):
+            raise ValueError('expression does not return an array')
 
-        try:
-            result = future.result(timeout=timeout)
+        # mask inf and nan values
+        result = np.ma.masked_invalid(result)
 
-        except concurrent.futures.TimeoutError:
-            raise RuntimeError('timeout during pattern evaluation')
+        return result
 
-        except ParseException as exc:
-            raise ValueError(str(exc)) from None
+    def _evaluate_fused(self, ctx: EvaluationContext) -> Any:
+        data = {}
+        masks = []
+        for name in self.operand_names:
+            operand = ctx.operands[name]
+            data[name] = np.ma.getdata(operand)
+            operand_mask = np.ma.getmask(operand)
+            if operand_mask is not np.ma.nomask:
+                masks.append(operand_mask)
 
-        except Exception as exc:
-            # pass only exception message to not leak traceback
-            raise ValueError(f'unexpected error while evaluating expression: {exc!s}') from None
+        ctx.invalid = []
+
+        with np.errstate(all='ignore'):
+            if (
+                has_numexpr and self.numexpr_compatible
+                and all(arr.dtype in NUMEXPR_DTYPES for arr in data.values())
+            ):
+                ctx.check_timeout()
+                out = numexpr.evaluate(
+                    self.expr.strip(), local_dict={**EXTRA_CONSTANTS, **data}, global_dict={}
+                )
+            else:
+                out = self._evaluate_chunked(ctx, data)
+
+        if not isinstance(out, np.ndarray):
+            return out
+
+        masks.extend(ctx.invalid)
+
+        if not masks:
+            return np.ma.masked_array(out)
+
+        mask = functools.reduce(np.logical_or, masks[1:], np.array(masks[0], dtype=bool))
+        if mask.shape != out.shape:
+            mask = np.broadcast_to(mask, out.shape).copy()
+
+        return np.ma.masked_array(out, mask=mask)
+
+    def _evaluate_chunked(self, ctx: EvaluationContext, data: Mapping[str, np.ndarray]) -> Any:
+        shapes = {arr.shape for arr in data.values()}
+        shape = shapes.pop()
+
+        if shapes or len(shape) == 0 or shape[0] == 0:
+            # cannot chunk arrays that need broadcasting
+            ctx.operands = data
+            return self._evaluator(ctx)
+
+        row_size = int(np.prod(shape[1:]))
+        rows_per_chunk = max(1, FUSED_CHUNK_SIZE // max(row_size, 1))
 
-    if not isinstance(result, np.ndarray):
-        raise ValueError('expression does not return an array')
+        out = None
+        invalid = None
+        for start in range(0, shape[0], rows_per_chunk):
+            chunk = slice(start, start + rows_per_chunk)
+            ctx.operands = {name: arr[chunk] for name, arr in data.items()}
+            ctx.invalid = []
+            chunk_result = self._evaluator(ctx)
 
-    # mask inf and nan values
-    result = np.ma.masked_invalid(result)
+            if out is None:
+                if not isinstance(chunk_result, np.ndarray) or chunk_result.ndim != len(shape):
+                    ctx.operands = data
+                    ctx.invalid = []
+                    return self._evaluator(ctx)
 
-    return result
+                out = np.empty(shape, dtype=chunk_result.dtype)
+
+            out[chunk] = chunk_result
+
+            for chunk_invalid in ctx.invalid:
+                if invalid is None:
+                    invalid = np.zeros(shape, dtype=bool)
+                invalid[chunk] |= chunk_invalid
+
+        ctx.invalid = [] if invalid is None else [invalid]
+        return out
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expr: str) -> CompiledExpression:
+    """Parse and validate an expression once, so it can be evaluated repeatedly.
+
+    Compiled expressions are cached by expression string.
+    """
+    try:
+        expr_ast = ast.parse(expr, filename='<expression>', mode='eval')
+    except SyntaxError as exc:
+        raise ValueError(f'given string {expr} is not a valid expression') from exc
+
+    parser = ExpressionParser(EXTRA_CONSTANTS, EXTRA_CALLABLES)
+
+    try:
+        evaluator = parser.visit(expr_ast)
+    except ParseException as exc:
+        raise ValueError(str(exc)) from None
+    except RecursionError:
+        raise ValueError('expression is too deeply nested') from None
+
+    return CompiledExpression(
+        expr, evaluator, parser.operand_names,
+        fusable=parser.fusable, numexpr_compatible=parser.numexpr_compatible
+    )
+
+
+def evaluate_expression(expr: str,
+                        operands: Mapping[str, np.ndarray],
+                        timeout: float = 1.) -> np.ndarray:
+    return compile_expression(expr)(operands, timeout=timeout)
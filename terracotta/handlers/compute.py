@@ -21,8 +21,10 @@ def compute(expression: str,
             stretch_range: Tuple[Number, Number],
             tile_xyz: Tuple[int, int, int] = None, *,
             colormap: str = None,
-            tile_size: Tuple[int, int] = None) -> BinaryIO:
-    """Return singleband image computed from one or more images as PNG
+            tile_size: Tuple[int, int] = None,
+            image_format: str = 'png') -> BinaryIO:
+    """Return singleband image computed from one or more images as PNG (or any other supported
+    image format)
 
     Expects a Python expression that returns a NumPy array. Operands in
     the expression are replaced by the images with keys as defined by
@@ -40,13 +42,19 @@ def compute(expression: str,
         <binary image containing product of bands 4 and 8>
 
     """
-    from terracotta.expressions import evaluate_expression
+    from terracotta.expressions import compile_expression
 
     if not stretch_range[1] > stretch_range[0]:
         raise exceptions.InvalidArgumentsError(
             'Upper stretch bounds must be larger than lower bounds'
         )
 
+    # fail early on invalid expressions, before reading any data
+    try:
+        compiled_expression = compile_expression(expression)
+    except ValueError as exc:
+        raise exceptions.InvalidArgumentsError(f'error while executing expression: {exc!s}')
+
     settings = get_settings()
 
     if tile_size is None:
@@ -71,7 +79,7 @@ def compute(expression: str,
         operand_data = {var: future.result() for var, future in futures.items()}
 
     try:
-        out = evaluate_expression(expression, operand_data)
+        out = compiled_expression(operand_data)
     except ValueError as exc:
         # make sure error message gets propagated
         raise exceptions.InvalidArgumentsError(f'error while executing expression: {exc!s}')
@@ -80,4 +88,4 @@ def compute(expression: str,
         out,
         *stretch_range
     )
-    return image.array_to_png(out, colormap=colormap)
+    return image.array_to_image(out, colormap=colormap, image_format=image_format)
@@ -0,0 +1,204 @@
+"""handlers/data.py
+
+Handle /data API endpoint.
+
+Tiles are returned with their raw values in a compact binary format, so clients can
+render them without further requests when changing stretch or colormap.
+All numbers are little-endian::
+
+    offset  size  content
+    0       4     magic bytes b'TCDT'
+    4       1     format version (1)
+    5       1     compression of the payload (0: none, 1: deflate, 2: zstd)
+    6       1     flags (bit 0: payload contains a mask)
+    7       1     reserved
+    8       8     NumPy dtype string of the data, padded with null bytes (e.g. b'<f4')
+    16      4     number of rows
+    20      4     number of columns
+    24      ...   payload
+
+The (decompressed) payload holds the data in row-major order, followed by the mask as
+packed bits (see ``numpy.packbits``, 1 means masked) if flag bit 0 is set. Masked values
+are set to 0.
+"""
+
+from typing import Sequence, Mapping, Union, Tuple
+from typing.io import BinaryIO
+
+from io import BytesIO
+import functools
+import struct
+import warnings
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+    has_zstd = True
+except ImportError:  # pragma: no cover
+    has_zstd = False
+
+from terracotta import get_settings, get_driver, xyz, exceptions
+from terracotta.profile import trace
+
+DATA_MIMETYPE = 'application/octet-stream'
+
+#: Supported compression methods, in order of their code in the header
+COMPRESSION_METHODS = ('none', 'deflate', 'zstd')
+
+#: Supported output data types, 'native' keeps the data type of the dataset
+DATA_TYPES = ('native', 'float32', 'float16')
+
+HEADER = struct.Struct('<4sBBBx8sII')
+MAGIC = b'TCDT'
+VERSION = 1
+FLAG_MASK = 1
+
+DEFLATE_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _compress(payload: bytes, compression: str) -> Tuple[bytes, str]:
+    if compression == 'zstd' and not has_zstd:
+        warnings.warn(
+            'zstd compression requested, but zstandard failed to import. '
+            'Falling back to deflate.', exceptions.PerformanceWarning
+        )
+        compression = 'deflate'
+
+    if compression == 'deflate':
+        return zlib.compress(payload, DEFLATE_LEVEL), compression
+
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload), compression
+
+    return payload, compression
+
+
+def _decompress(payload: bytes, compression: str) -> bytes:
+    if compression == 'deflate':
+        return zlib.decompress(payload)
+
+    if compression == 'zstd':
+        if not has_zstd:
+            raise ValueError('zstandard is required to decode zstd-compressed tiles')
+        return zstandard.ZstdDecompressor().decompress(payload)
+
+    return payload
+
+
+def encode_tile(tile_data: np.ndarray, compression: str = 'deflate',
+                dtype: str = 'native') -> bytes:
+    """Encode a (masked) 2D array in the binary /data format"""
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError(f'compression must be one of {COMPRESSION_METHODS}')
+
+    if dtype not in DATA_TYPES:
+        raise ValueError(f'dtype must be one of {DATA_TYPES}')
+
+    if tile_data.ndim != 2:
+        raise ValueError('only 2D arrays can be encoded')
+
+    values = np.ma.getdata(tile_data)
+    mask = np.ma.getmaskarray(tile_data)
+
+    out_dtype = values.dtype if dtype == 'native' else np.dtype(dtype)
+    out_dtype = out_dtype.newbyteorder('<')
+
+    # zero out masked values so they compress well and nodata values do not leak
+    values = np.where(mask, np.zeros((), dtype=out_dtype), values).astype(out_dtype, copy=False)
+
+    payload = values.tobytes()
+    flags = 0
+    if mask.any():
+        payload += np.packbits(mask).tobytes()
+        flags |= FLAG_MASK
+
+    payload, compression = _compress(payload, compression)
+
+    num_rows, num_cols = values.shape
+    header = HEADER.pack(
+        MAGIC, VERSION, COMPRESSION_METHODS.index(compression), flags,
+        out_dtype.str.encode('ascii'), num_rows, num_cols
+    )
+    return header + payload
+
+
+def decode_tile(buffer: bytes) -> np.ma.MaskedArray:
+    """Decode a tile in the binary /data format to a masked array"""
+    if len(buffer) < HEADER.size:
+        raise ValueError('buffer too short')
+
+    magic, version, compression_code, flags, dtype_str, num_rows, num_cols = (
+        HEADER.unpack_from(buffer)
+    )
+
+    if magic != MAGIC:
+        raise ValueError('buffer does not contain a Terracotta data tile')
+
+    if version != VERSION:
+        raise ValueError(f'unsupported data tile version {version}')
+
+    if compression_code >= len(COMPRESSION_METHODS):
+        raise ValueError(f'unsupported compression code {compression_code}')
+
+    try:
+        dtype = np.dtype(dtype_str.rstrip(b'\0').decode('ascii'))
+    except (TypeError, UnicodeDecodeError):
+        raise ValueError(f'unsupported data type {dtype_str!r}') from None
+
+    compression = COMPRESSION_METHODS[compression_code]
+    payload = _decompress(buffer[HEADER.size:], compression)
+
+    num_values = num_rows * num_cols
+    values = np.frombuffer(payload, dtype=dtype, count=num_values).reshape(num_rows, num_cols)
+
+    if flags & FLAG_MASK:
+        packed_mask = np.frombuffer(payload, dtype='uint8', offset=num_values * dtype.itemsize)
+        mask = np.unpackbits(packed_mask, count=num_values).astype(bool)
+        mask = mask.reshape(num_rows, num_cols)
+    else:
+        mask = np.zeros((num_rows, num_cols), dtype=bool)
+
+    return np.ma.masked_array(values, mask=mask)
+
+
+@functools.lru_cache(maxsize=32)
+def _empty_tile_bytes(tile_size: Tuple[int, int], compression: str) -> bytes:
+    empty_data = np.ma.masked_all(tile_size, dtype='uint8')
+    return encode_tile(empty_data, compression=compression)
+
+
+def empty_tile(tile_size: Tuple[int, int], compression: str = 'deflate') -> BinaryIO:
+    """Return a fully masked data tile of given size"""
+    return BytesIO(_empty_tile_bytes((tile_size[0], tile_size[1]), compression))
+
+
+@trace('data_handler')
+def data(keys: Union[Sequence[str], Mapping[str, str]],
+         tile_xyz: Tuple[int, int, int], *,
+         tile_size: Tuple[int, int] = None,
+         compression: str = 'deflate',
+         dtype: str = 'native') -> BinaryIO:
+    """Return raw tile data in the binary /data format"""
+    if compression not in COMPRESSION_METHODS:
+        raise exceptions.InvalidArgumentsError(
+            f'compression must be one of {COMPRESSION_METHODS}'
+        )
+
+    if dtype not in DATA_TYPES:
+        raise exceptions.InvalidArgumentsError(f'dtype must be one of {DATA_TYPES}')
+
+    settings = get_settings()
+    if tile_size is None:
+        tile_size = settings.DEFAULT_TILE_SIZE
+
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    with driver.connect():
+        tile_data = xyz.get_tile_data(
+            driver, keys, tile_xyz, tile_size=tile_size, preserve_values=True
+        )
+
+    return BytesIO(encode_tile(tile_data, compression=compression, dtype=dtype))
@@ -3,7 +3,7 @@
 Handle /datasets API endpoint.
 """
 
-from typing import Mapping, List, Union  # noqa: F401
+from typing import Mapping, List, Sequence, Union  # noqa: F401
 from collections import OrderedDict
 
 from terracotta import get_settings, get_driver
@@ -12,14 +12,15 @@ from terracotta.profile import trace
 
 @trace('datasets_handler')
 def datasets(some_keys: Mapping[str, Union[str, List[str]]] = None,
-             page: int = 0, limit: int = 500) -> 'List[OrderedDict[str, str]]':
-    """List all available key combinations"""
+             page: int = 0, limit: int = 500,
+             bbox: Sequence[float] = None) -> 'List[OrderedDict[str, str]]':
+    """List all available key combinations, optionally only those intersecting bbox"""
     settings = get_settings()
     driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
 
     with driver.connect():
         dataset_keys = driver.get_datasets(
-            where=some_keys, page=page, limit=limit
+            where=some_keys, page=page, limit=limit, where_bbox=bbox
         ).keys()
         key_names = driver.key_names
 
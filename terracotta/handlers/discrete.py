@@ -1,34 +1,62 @@
-"""handlers/hillshade.py
+"""handlers/discrete.py
 
-Handle /hillshade API endpoint.
+Handle /discrete API endpoint.
 """
 
-
 from typing import Sequence, Mapping, Union, Tuple, TypeVar
-
-from numpy.lib.shape_base import tile
 from typing.io import BinaryIO
 
-from io import BytesIO
-
-from PIL import Image
-
-from skimage.util import img_as_ubyte
-
-import matplotlib.pyplot as plt
-from matplotlib.colors import BoundaryNorm
-from matplotlib.pyplot import matshow
+import functools
 
 import numpy as np
 
-from terracotta import get_settings, get_driver, xyz, image
+from terracotta import get_settings, get_driver, xyz, image, exceptions
 from terracotta.profile import trace
 
 Number = TypeVar("Number", int, float)
+RGBA = Tuple[int, int, int, int]
+
+#: Maximum number of classes (palette index 0 is reserved for transparency)
+MAX_CLASSES = 255
+
+
+def _matplotlib_cmap(colormap: str) -> np.ndarray:
+    """Read a colormap that is not bundled with terracotta from matplotlib"""
+    from matplotlib import colormaps
+
+    cmap = colormaps[colormap]
+    return np.round(cmap(np.linspace(0, 1, 255)) * 255).astype("uint8")
+
+
+@functools.lru_cache(maxsize=128)
+def discrete_palette(colormap: str, n_classes: int) -> Tuple[RGBA, ...]:
+    """Sample n_classes evenly spaced colors from the given colormap.
 
+    Bundled colormaps are matched case-insensitively, other colormaps are read from
+    matplotlib.
+    """
+    from terracotta.cmaps import get_cmap
+
+    try:
+        cmap_vals = get_cmap(colormap.lower())
+    except ValueError:
+        try:
+            cmap_vals = _matplotlib_cmap(colormap)
+        except KeyError:
+            cmap_vals = get_cmap("viridis")  # defaults to viridis
+
+    sample_idx = np.round(np.linspace(0, len(cmap_vals) - 1, n_classes)).astype("int64")
+    return tuple(tuple(color) for color in cmap_vals[sample_idx].tolist())
 
-def scaler(data, vmin, vmax):
-    return (data - vmin) / (vmax - vmin)
+
+def classify(data: np.ndarray, vmin: Number, vmax: Number, n_classes: int) -> np.ndarray:
+    """Bin data into n_classes equally wide classes between vmin and vmax.
+
+    Returns uint8 class indices starting at 1, values outside [vmin, vmax] are assigned to
+    the first or last class, respectively.
+    """
+    class_edges = np.linspace(vmin, vmax, n_classes + 1)[1:-1]
+    return (np.digitize(data, class_edges) + 1).astype("uint8")
 
 
 @trace("discrete_handler")
@@ -38,11 +66,16 @@ def discrete(
     *,
     colormap: str,
     tile_size: Tuple[int, int] = None,
-    n_classes: Number = None,
+    n_classes: Number = 16,
     vmin: Number = None,
     vmax: Number = None,
+    image_format: str = "png",
 ) -> BinaryIO:
-    """Return singleband image rendered as discrete colors in PNG format"""
+    """Return singleband image rendered as discrete colors in PNG (or any other supported) format"""
+    if not 1 <= n_classes <= MAX_CLASSES:
+        raise exceptions.InvalidArgumentsError(
+            f"n_classes must be between 1 and {MAX_CLASSES}"
+        )
 
     settings = get_settings()
     if tile_size is None:
@@ -60,32 +93,13 @@ def discrete(
             preserve_values=False,
         )
 
-    try:
-        cmap = plt.get_cmap(colormap, n_classes)
-    except Exception:
-        cmap = plt.get_cmap("viridis", n_classes)  # defaults to viridis
-
-    if not vmin:
+    if vmin is None:
         vmin = metadata["range"][0]
-    if not vmax:
+    if vmax is None:
         vmax = metadata["range"][1]
 
-    # manipulate tile data
-    # print(tile_data)
-    data = tile_data.copy()
-    data[np.where(data <= vmin)] = vmin
-    data[np.where(data >= vmax)] = vmax
-    data = scaler(data, vmin, vmax)
-    rgb = cmap(data)
-
-    # encode for terracotta - 0-255
-    r = image.to_uint8(rgb[:, :, 0], 0, 1)
-    g = image.to_uint8(rgb[:, :, 1], 0, 1)
-    b = image.to_uint8(rgb[:, :, 2], 0, 1)
-
-    out = np.ma.stack([r, g, b], axis=-1)
-    out[np.ma.masked_invalid(tile_data).mask] = 0  # zero means transparent
-
-    # todo: pure white also means transparent
+    out = classify(np.ma.getdata(tile_data), vmin, vmax, int(n_classes))
+    out[np.ma.getmaskarray(np.ma.masked_invalid(tile_data))] = 0  # zero means transparent
 
-    return image.array_to_png(out[:, :, 0:3])
+    palette = discrete_palette(colormap, int(n_classes))
+    return image.array_to_image(out, colormap=palette, image_format=image_format)
@@ -6,47 +6,178 @@ Handle /hillshade API endpoint.
 from typing import Sequence, Mapping, Union, Tuple, TypeVar
 from typing.io import BinaryIO
 
-from io import BytesIO
+import functools
 
 from PIL import Image
 
-from matplotlib.pyplot import get_cmap
-from matplotlib.colors import LightSource, Normalize
-
-from skimage.util import img_as_ubyte
-
 import numpy as np
+import mercantile
 
-from terracotta import get_settings, get_driver, xyz
+from terracotta import get_settings, get_driver, image, xyz, exceptions
 from terracotta.profile import trace
 
 Number = TypeVar("Number", int, float)
-# RGBA = Tuple[Number, Number, Number, Number]
-
-# tile resolution for each level starting at level 0.
-TILE_RESOLUTION = [
-    156412,
-    78206,
-    39103,
-    19551,
-    9776,
-    4888,
-    2444,
-    1222,
-    610.984,
-    305.492,
-    152.746,
-    76.373,
-    38.187,
-    19.093,
-    9.547,
-    4.773,
-    2.387,
-    1.193,
-    0.596,
-    0.298,
-    0.149,
-]
+
+BLEND_MODES = ("hsv", "overlay", "soft")
+
+#: Radius of the sphere used by the Web Mercator projection (EPSG:3857), in meters
+EARTH_RADIUS = 6378137.0
+
+#: Web Mercator is undefined at the poles, so latitudes are clipped to this value
+MAX_LATITUDE = 85.0511287798
+
+
+def pixel_spacing(
+    bounds: Sequence[float], tile_size: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Ground distance (in meters) between neighboring pixels of a Web Mercator tile.
+
+    Bounds are (left, bottom, right, top) in EPSG:3857. Mercator distances are stretched
+    by 1 / cos(latitude), so the spacing is corrected once per tile row. Returns arrays
+    of shape (rows, 1) for x and y spacing, to be broadcast against the tile.
+    """
+    left, bottom, right, top = bounds
+    num_rows, num_cols = tile_size
+
+    mercator_dx = (right - left) / num_cols
+    mercator_dy = (top - bottom) / num_rows
+
+    # cos(latitude) == 1 / cosh(y / R) for Mercator northings y
+    row_y = top - (np.arange(num_rows) + 0.5) * mercator_dy
+    row_scale = 1 / np.cosh(row_y / EARTH_RADIUS)
+    row_scale = row_scale[:, np.newaxis]
+    return mercator_dx * row_scale, mercator_dy * row_scale
+
+
+def _mercator_bounds(wgs_bounds: Sequence[float]) -> Tuple[float, float, float, float]:
+    west, south, east, north = wgs_bounds
+    south, north = np.clip((south, north), -MAX_LATITUDE, MAX_LATITUDE)
+    left, bottom = mercantile.xy(west, south)
+    right, top = mercantile.xy(east, north)
+    return left, bottom, right, top
+
+
+@functools.lru_cache(maxsize=128)
+def light_vector(azimuth_degree: float, altitude_degree: float) -> Tuple[float, float, float]:
+    """Unit vector pointing towards the light source (east, north, up)"""
+    # azimuth is given clockwise from north
+    azimuth = np.radians(90 - azimuth_degree)
+    altitude = np.radians(altitude_degree)
+    return (
+        float(np.cos(azimuth) * np.cos(altitude)),
+        float(np.sin(azimuth) * np.cos(altitude)),
+        float(np.sin(altitude)),
+    )
+
+
+def illumination(
+    elevation: np.ndarray,
+    light: Tuple[float, float, float],
+    dx: Union[float, np.ndarray],
+    dy: Union[float, np.ndarray],
+    vertical_exaggeration: float = 1,
+) -> np.ndarray:
+    """Compute Lambertian illumination (0 - 1) of an elevation grid.
+
+    Expects elevation to be padded by one pixel on each side, so the output is two pixels
+    smaller along both axes. Pixel spacing dx and dy may be scalars or arrays that broadcast
+    against the output (e.g. one value per row). Gradients are central differences; pixels
+    whose neighbors are invalid are shaded as flat terrain.
+    """
+    elevation = np.asarray(elevation, dtype="float32")
+    light_x, light_y, light_z = light
+
+    # first row is north, so the northward gradient is top minus bottom
+    scale_x = np.asarray(vertical_exaggeration / (2 * np.asarray(dx)), dtype="float32")
+    scale_y = np.asarray(vertical_exaggeration / (2 * np.asarray(dy)), dtype="float32")
+    grad_x = (elevation[1:-1, 2:] - elevation[1:-1, :-2]) * scale_x
+    grad_y = (elevation[:-2, 1:-1] - elevation[2:, 1:-1]) * scale_y
+
+    # surface normal is (-grad_x, -grad_y, 1) / norm
+    norm = grad_x * grad_x
+    norm += grad_y * grad_y
+    norm += 1
+    np.sqrt(norm, out=norm)
+
+    grad_x *= -light_x
+    grad_y *= light_y
+    out = grad_x
+    out -= grad_y
+    out += light_z
+    out /= norm
+
+    np.clip(out, 0, 1, out=out)
+    out[~np.isfinite(out)] = light_z
+    return out
+
+
+def _rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    max_c = rgb.max(axis=-1)
+    delta = max_c - rgb.min(axis=-1)
+    safe_delta = np.where(delta > 0, delta, 1)
+
+    red, green, _ = np.moveaxis(rgb, -1, 0)
+    red_c, green_c, blue_c = np.moveaxis(
+        (max_c[..., np.newaxis] - rgb) / safe_delta[..., np.newaxis], -1, 0
+    )
+
+    hue = np.where(
+        red == max_c,
+        blue_c - green_c,
+        np.where(green == max_c, 2 + red_c - blue_c, 4 + green_c - red_c),
+    )
+    hue = np.where(delta > 0, (hue / 6) % 1, 0)
+    saturation = np.where(max_c > 0, delta / np.where(max_c > 0, max_c, 1), 0)
+    return np.stack((hue, saturation, max_c), axis=-1)
+
+
+def _hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    hue, saturation, value = np.moveaxis(hsv, -1, 0)
+    sector = np.floor(hue * 6)
+    frac = hue * 6 - sector
+    sector = sector.astype("int64") % 6
+
+    p = value * (1 - saturation)
+    q = value * (1 - saturation * frac)
+    t = value * (1 - saturation * (1 - frac))
+
+    red = np.choose(sector, (value, q, p, p, t, value))
+    green = np.choose(sector, (t, value, value, q, p, p))
+    blue = np.choose(sector, (p, p, t, value, value, q))
+    return np.stack((red, green, blue), axis=-1)
+
+
+def blend(rgb: np.ndarray, intensity: np.ndarray, blend_mode: str) -> np.ndarray:
+    """Shade RGB values (0 - 1) by illumination intensity (0 - 1)"""
+    intensity = intensity[..., np.newaxis]
+
+    if blend_mode == "soft":
+        return 2 * intensity * rgb + (1 - 2 * intensity) * rgb ** 2
+
+    if blend_mode == "overlay":
+        low = 2 * intensity * rgb
+        high = 1 - 2 * (1 - intensity) * (1 - rgb)
+        return np.where(rgb <= 0.5, low, high)
+
+    if blend_mode == "hsv":
+        # brighten and desaturate in light, darken and saturate in shadow
+        shade = 2 * intensity[..., 0] - 1
+        hue, saturation, value = np.moveaxis(_rgb_to_hsv(rgb), -1, 0)
+
+        has_sat = np.abs(saturation) > 1e-10
+        saturation = np.where(
+            has_sat & (shade < 0), (1 + shade) * saturation - shade, saturation
+        )
+        saturation = np.where(
+            has_sat & (shade > 0), (1 - shade) * saturation, saturation
+        )
+        value = np.where(shade > 0, (1 - shade) * value + shade, value)
+        value = np.where(shade < 0, (1 + shade) * value, value)
+
+        hsv = np.stack((hue, np.clip(saturation, 0, 1), np.clip(value, 0, 1)), axis=-1)
+        return _hsv_to_rgb(hsv)
+
+    raise ValueError(f"unknown blend mode {blend_mode}")
 
 
 @trace("hillshade_handler")
@@ -60,13 +191,18 @@ def hillshade(
     vertical_exaggeration: Number,
     blend_mode: str,
     tile_size: Tuple[int, int] = None,
+    image_format: str = "png",
 ) -> BinaryIO:
-    """Return singleband image rendered as hillshade PNG"""
+    """Return singleband image rendered as hillshade PNG (or any other supported image format)"""
+    from terracotta.cmaps import get_cmap
+
+    if blend_mode not in BLEND_MODES:
+        raise exceptions.InvalidArgumentsError(f"blend_mode must be one of {BLEND_MODES}")
 
     try:
         cmap = get_cmap(colormap)
-    except Exception:
-        cmap = get_cmap("Greys_r")  # defaults to grey
+    except ValueError:
+        cmap = get_cmap("greys_r")  # defaults to grey
 
     settings = get_settings()
     if tile_size is None:
@@ -76,54 +212,50 @@ def hillshade(
 
     with driver.connect():
         metadata = driver.get_metadata(keys)
-        tile_data = xyz.get_tile_data(
-            driver,
-            keys,
-            tile_xyz,
-            tile_size=tile_size,
-            preserve_values=False,
-        )
+
+        if tile_xyz is None:
+            tile_data = xyz.get_tile_data(driver, keys, tile_size=tile_size)
+            tile_bounds = _mercator_bounds(metadata["bounds"])
+            padded_data = np.pad(
+                np.ma.filled(tile_data.astype("float32"), np.nan), 1, mode="edge"
+            )
+        else:
+            # read one extra pixel on each side to get correct gradients at tile edges
+            padded_data = xyz.get_tile_data(
+                driver, keys, tile_xyz, tile_size=tile_size, padding=1
+            )
+            tile_data = padded_data[1:-1, 1:-1]
+            padded_data = np.ma.filled(padded_data.astype("float32"), np.nan)
+
+            tile_x, tile_y, tile_z = tile_xyz
+            tile_bounds = mercantile.xy_bounds(mercantile.Tile(x=tile_x, y=tile_y, z=tile_z))
 
     # compute the hillshade
-    try:
-        _, _, tile_z = tile_xyz
-        dx = TILE_RESOLUTION[tile_z]
-        dy = TILE_RESOLUTION[tile_z]
-    except Exception:
-        dx = 1
-        dy = 1
-
-    # compute the shadding
-    norm = Normalize(
-        vmin=metadata["range"][0],
-        vmax=metadata["range"][1],
-        clip=False,
+    dx, dy = pixel_spacing(tile_bounds, tile_data.shape)
+    intensity = illumination(
+        padded_data,
+        light_vector(azimuth_degree, altitude_degree),
+        dx,
+        dy,
+        vertical_exaggeration=vertical_exaggeration,
     )
 
-    ls = LightSource(azdeg=azimuth_degree, altdeg=altitude_degree)
-
-    rgb = ls.shade(
-        np.ma.masked_invalid(tile_data),
-        cmap=cmap,
-        blend_mode=blend_mode,
-        vert_exag=vertical_exaggeration,
-        dx=dx,
-        dy=dy,
-        norm=norm,
-        vmin=metadata["range"][0],
-        vmax=metadata["range"][1],
+    # apply colormap and shade
+    is_valid = ~np.ma.getmaskarray(np.ma.masked_invalid(tile_data))
+    cmap_idx = np.ma.getdata(
+        image.to_uint8(np.ma.masked_array(tile_data, mask=~is_valid), *metadata["range"])
     )
+    np.subtract(cmap_idx, 1, out=cmap_idx, where=is_valid)
+    base_rgb = cmap[cmap_idx, :3].astype("float32")
+    base_rgb /= 255
+    shaded_rgb = blend(base_rgb, intensity, blend_mode)
 
-    # Important - This by-passes terracotas strange encoding.
-
-    # rgb is between 0 and, scale it to 0-255. store as uint8.
-    rgb = img_as_ubyte(rgb)
-
-    # encode as png
-    img = Image.fromarray(rgb)
+    out = np.empty(shaded_rgb.shape[:2] + (4,), dtype="uint8")
+    np.multiply(np.clip(shaded_rgb, 0, 1), 255, out=shaded_rgb)
+    np.rint(shaded_rgb, out=shaded_rgb)
+    out[..., :3] = shaded_rgb
+    out[..., 3] = cmap[cmap_idx, 3]
 
-    sio = BytesIO()
-    img.save(sio, format="PNG", compress_level=settings.PNG_COMPRESS_LEVEL)
-    sio.seek(0)  # reset file pointer to start
+    out[~is_valid] = 0  # transparent
 
-    return sio
+    return image.save_image(Image.fromarray(out, mode="RGBA"), image_format)
@@ -0,0 +1,36 @@
+"""handlers/histogram.py
+
+Handle /histogram API endpoint.
+"""
+
+from typing import Mapping, Sequence, Dict, Any, Union
+from collections import OrderedDict
+
+import numpy as np
+
+from terracotta import get_settings, get_driver, exceptions
+from terracotta.profile import trace
+
+
+@trace('histogram_handler')
+def histogram(keys: Union[Sequence[str], Mapping[str, str]]) -> Dict[str, Any]:
+    """Returns the pre-computed histogram of a single dataset"""
+    settings = get_settings()
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+    metadata = driver.get_metadata(keys)
+
+    counts = metadata.get('histogram')
+    if counts is None:
+        raise exceptions.InvalidArgumentsError(
+            f'No histogram available for dataset with keys {keys}'
+        )
+
+    lower, upper = metadata['range']
+    bin_edges = np.linspace(lower, upper, len(counts) + 1)
+
+    return {
+        'keys': OrderedDict(zip(driver.key_names, keys)),
+        'range': metadata['range'],
+        'bin_edges': bin_edges.tolist(),
+        'counts': counts
+    }
@@ -0,0 +1,146 @@
+"""handlers/mosaic.py
+
+Handle /mosaic API endpoint. Tiles of all contributing datasets are read in parallel.
+"""
+
+from typing import Sequence, Tuple, List, Optional, TypeVar
+from typing.io import BinaryIO
+
+import numpy as np
+
+from terracotta import get_settings, get_driver, image, exceptions
+from terracotta.profile import trace
+
+Number = TypeVar('Number', int, float)
+
+MOSAIC_METHODS = ('first', 'last', 'mean')
+
+
+def composite(tiles: Sequence[np.ma.MaskedArray], method: str = 'first') -> np.ma.MaskedArray:
+    """Combine several tiles of the same shape into one.
+
+    Methods:
+
+        - ``first``: use the value of the first tile that has valid data in each pixel
+        - ``last``: use the value of the last tile that has valid data in each pixel
+        - ``mean``: use the mean of all valid values in each pixel
+
+    """
+    if method not in MOSAIC_METHODS:
+        raise ValueError(f'unknown mosaic method {method}')
+
+    if not tiles:
+        raise ValueError('at least one tile is required')
+
+    stack = np.ma.masked_invalid(np.ma.stack(tiles))
+
+    if method == 'mean':
+        return stack.mean(axis=0)
+
+    valid = ~np.ma.getmaskarray(stack)
+
+    if method == 'first':
+        idx = valid.argmax(axis=0)
+    else:
+        idx = len(tiles) - 1 - valid[::-1].argmax(axis=0)
+
+    out_data = np.take_along_axis(stack.data, idx[np.newaxis], axis=0)[0]
+    return np.ma.masked_array(out_data, mask=~valid.any(axis=0))
+
+
+@trace('mosaic_handler')
+def mosaic(some_keys: Sequence[str],
+           tile_xyz: Tuple[int, int, int], *,
+           method: str = 'first',
+           colormap: str = None,
+           stretch_range: Tuple[Optional[Number], Optional[Number]] = None,
+           tile_size: Tuple[int, int] = None,
+           image_format: str = 'png') -> BinaryIO:
+    """Return a singleband image combined from all datasets matching some_keys as PNG (or any
+    other supported image format)
+
+    Only datasets whose bounds intersect the requested tile are read (as determined by the
+    spatial index of the database), all of them in parallel.
+    """
+    import mercantile
+
+    if method not in MOSAIC_METHODS:
+        raise exceptions.InvalidArgumentsError(f'method must be one of {MOSAIC_METHODS}')
+
+    if stretch_range is None:
+        stretch_min, stretch_max = None, None
+    else:
+        stretch_min, stretch_max = stretch_range
+
+    settings = get_settings()
+
+    if tile_size is None:
+        tile_size_ = settings.DEFAULT_TILE_SIZE
+    else:
+        tile_size_ = tile_size
+
+    max_datasets = settings.MAX_MOSAIC_DATASETS
+
+    tile_x, tile_y, tile_z = tile_xyz
+    mercator_tile = mercantile.Tile(x=tile_x, y=tile_y, z=tile_z)
+    target_bounds = mercantile.xy_bounds(mercator_tile)
+
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    with driver.connect():
+        key_names = driver.key_names
+
+        if not some_keys or len(some_keys) >= len(key_names):
+            raise exceptions.InvalidArgumentsError(
+                'must specify at least one key, but not all of them'
+            )
+
+        datasets = driver.get_datasets(
+            where=dict(zip(key_names, some_keys)),
+            where_bbox=mercantile.bounds(mercator_tile),
+            limit=max_datasets + 1
+        )
+
+        if not datasets:
+            raise exceptions.TileOutOfBoundsError(
+                f'Tile {tile_z}/{tile_x}/{tile_y} does not intersect any dataset'
+            )
+
+        if len(datasets) > max_datasets:
+            raise exceptions.InvalidArgumentsError(
+                f'More than {max_datasets} datasets intersect tile '
+                f'{tile_z}/{tile_x}/{tile_y}, try a higher zoom level'
+            )
+
+        futures = [
+            driver.get_raster_tile(
+                keys, tile_bounds=target_bounds, tile_size=tile_size_, asynchronous=True
+            )
+            for keys in datasets.keys()
+        ]
+
+        if stretch_min is None or stretch_max is None:
+            dataset_ranges = np.array([driver.get_metadata(keys)['range'] for keys in datasets])
+
+            if stretch_min is None:
+                stretch_min = dataset_ranges[:, 0].min()
+
+            if stretch_max is None:
+                stretch_max = dataset_ranges[:, 1].max()
+
+        tiles: List[np.ma.MaskedArray] = []
+        for future in futures:
+            try:
+                tiles.append(future.result())
+            except exceptions.TileOutOfBoundsError:
+                # dataset covers only a negligible part of the tile
+                continue
+
+    if not tiles:
+        raise exceptions.TileOutOfBoundsError(
+            f'Tile {tile_z}/{tile_x}/{tile_y} does not intersect any dataset'
+        )
+
+    out = composite(tiles, method=method)
+    out_uint8 = image.to_uint8(out, stretch_min, stretch_max)
+    return image.array_to_image(out_uint8, colormap=colormap, image_format=image_format)
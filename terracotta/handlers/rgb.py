@@ -19,8 +19,9 @@ def rgb(some_keys: Sequence[str],
         rgb_values: Sequence[str],
         tile_xyz: Tuple[int, int, int] = None, *,
         stretch_ranges: ListOfRanges = None,
-        tile_size: Tuple[int, int] = None) -> BinaryIO:
-    """Return RGB image as PNG
+        tile_size: Tuple[int, int] = None,
+        image_format: str = 'png') -> BinaryIO:
+    """Return RGB image as PNG (or any other supported image format)
 
     Red, green, and blue channels correspond to the given values `rgb_values` of the key
     missing from `some_keys`.
@@ -62,7 +63,7 @@ def rgb(some_keys: Sequence[str],
         futures = [get_band_future(key) for key in rgb_values]
         band_items = zip(rgb_values, stretch_ranges_, futures)
 
-        out_arrays = []
+        out: Optional[np.ndarray] = None
 
         for i, (band_key, band_stretch_override, band_data_future) in enumerate(band_items):
             keys = (*some_keys, band_key)
@@ -83,7 +84,12 @@ def rgb(some_keys: Sequence[str],
                 )
 
             band_data = band_data_future.result()
-            out_arrays.append(image.to_uint8(band_data, *band_stretch_range))
 
-    out = np.ma.stack(out_arrays, axis=-1)
-    return image.array_to_png(out)
+            if out is None:
+                out = np.empty((*band_data.shape, len(rgb_values)), dtype='uint8')
+
+            stretch_min, stretch_max = band_stretch_range
+            image.to_uint8(band_data, stretch_min, stretch_max, out=out[..., i])
+
+    assert out is not None
+    return image.array_to_image(out, image_format=image_format)
@@ -20,8 +20,9 @@ def singleband(keys: Union[Sequence[str], Mapping[str, str]],
                tile_xyz: Tuple[int, int, int] = None, *,
                colormap: Union[str, Mapping[Number, RGBA], None] = None,
                stretch_range: Tuple[Number, Number] = None,
-               tile_size: Tuple[int, int] = None) -> BinaryIO:
-    """Return singleband image as PNG"""
+               tile_size: Tuple[int, int] = None,
+               image_format: str = 'png') -> BinaryIO:
+    """Return singleband image as PNG (or any other supported image format)"""
 
     cmap_or_palette: Union[str, Sequence[RGBA], None]
 
@@ -66,4 +67,4 @@ def singleband(keys: Union[Sequence[str], Mapping[str, str]],
         cmap_or_palette = cast(Optional[str], colormap)
         out = image.to_uint8(tile_data, *stretch_range_)
 
-    return image.array_to_png(out, colormap=cmap_or_palette)
+    return image.array_to_image(out, colormap=cmap_or_palette, image_format=image_format)
@@ -0,0 +1,101 @@
+"""handlers/statistics.py
+
+Handle /statistics API endpoint.
+"""
+
+from typing import Sequence, Mapping, Union, Tuple, Dict, Any
+from collections import OrderedDict
+
+import numpy as np
+
+from terracotta import get_settings, get_driver, xyz, exceptions
+from terracotta.drivers.base import Driver
+from terracotta.profile import trace
+
+# statistics do not need full resolution, so read a coarse overview by default
+DEFAULT_STATISTICS_TILE_SIZE = (128, 128)
+
+
+def _get_clipped_data(driver: Driver,
+                      keys: Union[Sequence[str], Mapping[str, str]],
+                      wgs_bounds: Sequence[float],
+                      tile_size: Tuple[int, int]) -> Tuple[np.ma.MaskedArray, float]:
+    """Read data within the part of the given bounds that is covered by the dataset.
+
+    Returns the data and the fraction of the (Web Mercator) area of the given bounds it covers.
+    """
+    clipped_bounds = xyz.clip_to_dataset(driver, keys, wgs_bounds)
+    clipped_data = xyz.get_bounds_data(driver, keys, clipped_bounds, tile_size=tile_size)
+
+    def mercator_area(bounds: Sequence[float]) -> float:
+        left, bottom, right, top = xyz.mercator_bounds(bounds)
+        return (right - left) * (top - bottom)
+
+    return clipped_data, mercator_area(clipped_bounds) / mercator_area(wgs_bounds)
+
+
+@trace('statistics_handler')
+def statistics(keys: Union[Sequence[str], Mapping[str, str]],
+               tile_xyz: Tuple[int, int, int] = None, *,
+               bounds: Sequence[float] = None,
+               tile_size: Tuple[int, int] = None) -> Dict[str, Any]:
+    """Returns statistics of a dataset within an XYZ tile or latitude-longitude bounds.
+
+    Reads the data at a reduced resolution (``tile_size``), so GDAL can serve it from
+    an overview. Repeated requests are served from the raster cache.
+    Returns the whole dataset statistics if neither a tile nor bounds are given.
+    """
+    if tile_xyz is not None and bounds is not None:
+        raise exceptions.InvalidArgumentsError('Cannot use both tile and bounds arguments')
+
+    if tile_size is None:
+        tile_size = DEFAULT_STATISTICS_TILE_SIZE
+
+    settings = get_settings()
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    if bounds is not None:
+        west, south, east, north = bounds
+        if not west < east or not south < north:
+            raise exceptions.InvalidArgumentsError(
+                'Bounding box must be given as (west, south, east, north)'
+            )
+
+    with driver.connect():
+        key_names = driver.key_names
+
+        if tile_xyz is None and bounds is None:
+            tile_data = xyz.get_tile_data(driver, keys, tile_size=tile_size)
+            coverage = 1.
+        else:
+            try:
+                if tile_xyz is not None:
+                    bounds = xyz.get_tile_bounds(*tile_xyz)
+
+                assert bounds is not None
+
+                # only read the part covered by the dataset, so partial overlaps
+                # are not discarded as too sparse
+                tile_data, coverage = _get_clipped_data(driver, keys, bounds, tile_size)
+            except exceptions.TileOutOfBoundsError:
+                tile_data, coverage = np.ma.masked_all(tile_size), 0.
+
+    tile_data = np.ma.masked_invalid(tile_data)
+    valid_data = tile_data.compressed()
+
+    response: Dict[str, Any] = {
+        'keys': OrderedDict(zip(key_names, keys)),
+        'valid_percentage': valid_data.size / tile_data.size * coverage * 100
+    }
+
+    if valid_data.size == 0:
+        response.update(range=None, mean=None, stdev=None, percentiles=None)
+        return response
+
+    response.update(
+        range=(float(valid_data.min()), float(valid_data.max())),
+        mean=float(valid_data.mean()),
+        stdev=float(valid_data.std()),
+        percentiles=np.percentile(valid_data, np.arange(1, 100)).tolist()
+    )
+    return response
@@ -0,0 +1,76 @@
+"""handlers/terrain.py
+
+Handle /terrain API endpoint.
+"""
+
+from typing import Sequence, Mapping, Union, Tuple, Dict
+from typing.io import BinaryIO
+
+import numpy as np
+from PIL import Image
+
+from terracotta import get_settings, get_driver, image, xyz, exceptions
+from terracotta.profile import trace
+
+#: Supported elevation encodings as (offset, scale), so that
+#: R * 256 * 256 + G * 256 + B == (elevation + offset) * scale
+TERRAIN_ENCODINGS: Dict[str, Tuple[float, float]] = {
+    # https://docs.mapbox.com/data/tilesets/reference/mapbox-terrain-rgb-v1/
+    'mapbox': (10000., 10.),
+    # https://github.com/tilezen/joerd/blob/master/docs/formats.md#terrarium
+    'terrarium': (32768., 256.),
+}
+
+MAX_ENCODED_VALUE = 2 ** 24 - 1
+
+
+def encode_elevation(elevation: np.ndarray, encoding: str = 'mapbox') -> np.ndarray:
+    """Encode elevation (in meters) as RGBA values.
+
+    Masked or invalid pixels are fully transparent (alpha 0), so clients can tell them
+    apart from valid elevations; valid pixels are opaque and clipped to the range that
+    can be represented.
+    """
+    try:
+        offset, scale = TERRAIN_ENCODINGS[encoding]
+    except KeyError:
+        raise ValueError(f'encoding must be one of {tuple(TERRAIN_ENCODINGS)}') from None
+
+    mask = np.ma.getmaskarray(np.ma.masked_invalid(elevation))
+
+    encoded = np.asarray(np.ma.getdata(elevation), dtype='float64') + offset
+    encoded *= scale
+    np.rint(encoded, out=encoded)
+    np.clip(encoded, 0, MAX_ENCODED_VALUE, out=encoded)
+    encoded[mask] = 0
+    # alpha goes into the high byte, which is unused by the encoding
+    encoded += np.where(mask, 0, 255 << 24)
+
+    # the bytes of a little-endian uint32 are B, G, R, A
+    encoded_bytes = encoded.astype('<u4').view('uint8').reshape(*elevation.shape, 4)
+    return np.ascontiguousarray(encoded_bytes[..., [2, 1, 0, 3]])
+
+
+@trace('terrain_handler')
+def terrain(keys: Union[Sequence[str], Mapping[str, str]],
+            tile_xyz: Tuple[int, int, int] = None, *,
+            encoding: str = 'mapbox',
+            tile_size: Tuple[int, int] = None) -> BinaryIO:
+    """Return elevation tile encoded as Terrain-RGB or Terrarium PNG"""
+    if encoding not in TERRAIN_ENCODINGS:
+        raise exceptions.InvalidArgumentsError(
+            f'encoding must be one of {tuple(TERRAIN_ENCODINGS)}'
+        )
+
+    settings = get_settings()
+    if tile_size is None:
+        tile_size = settings.DEFAULT_TILE_SIZE
+
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    with driver.connect():
+        tile_data = xyz.get_tile_data(driver, keys, tile_xyz, tile_size=tile_size)
+
+    # PNG is the only lossless output format
+    img = Image.fromarray(encode_elevation(tile_data, encoding), mode='RGBA')
+    return image.save_image(img, image_format='png')
@@ -3,14 +3,26 @@
 Utilities to create and manipulate images.
 """
 
-from typing import Sequence, Tuple, TypeVar, Union
+from typing import Any, Sequence, Tuple, TypeVar, Union, Dict, Optional, Callable
 from typing.io import BinaryIO
 
 from io import BytesIO
+import functools
+import struct
+import threading
+import warnings
+import zlib
 
 import numpy as np
 from PIL import Image
 
+try:
+    import pyspng
+    # encoding support was added to pyspng after its first releases
+    has_spng = hasattr(pyspng, 'encode')
+except ImportError:  # pragma: no cover
+    has_spng = False
+
 from terracotta.profile import trace
 from terracotta import exceptions, get_settings
 
@@ -18,18 +30,243 @@ Number = TypeVar('Number', int, float)
 RGBA = Tuple[Number, Number, Number, Number]
 Palette = Sequence[RGBA]
 Array = Union[np.ndarray, np.ma.MaskedArray]
+Transparency = Union[Tuple[int, int, int], int, bytes]
+PNGEncoder = Callable[[np.ndarray, Optional[np.ndarray], Transparency, int], bytes]
+
+_SCRATCH = threading.local()
+
+
+def _encode_png_pil(img_data: np.ndarray, palette: Optional[np.ndarray],
+                    transparency: Transparency, compress_level: int) -> bytes:
+    mode = 'RGB' if img_data.ndim == 3 else 'L'
+    img = Image.fromarray(img_data, mode=mode)
+
+    if palette is not None:
+        img.putpalette(palette.tobytes())
+
+    sio = BytesIO()
+    img.save(sio, 'png', compress_level=compress_level, transparency=transparency)
+    return sio.getvalue()
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack('>I', len(data)) + tag + data
+        + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def _encode_png_fast(img_data: np.ndarray, palette: Optional[np.ndarray],
+                     transparency: Transparency, compress_level: int) -> bytes:
+    """Write PNG directly, without row filters and with plain zlib compression
+
+    Compress level 0 skips deflate entirely (stored blocks).
+    """
+    height, width = img_data.shape[:2]
+
+    if img_data.ndim == 3:
+        color_type = 2
+        trns = struct.pack('>HHH', *transparency)  # type: ignore
+    elif palette is None:
+        color_type = 0
+        trns = struct.pack('>H', transparency)
+    else:
+        color_type = 3
+        assert isinstance(transparency, bytes)
+        trns = transparency
+
+    # every scanline is prefixed by its filter type (0 = none)
+    scanlines = np.zeros((height, 1 + img_data[0].size), dtype='uint8')
+    scanlines[:, 1:] = img_data.reshape(height, -1)
+
+    chunks = [
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+    ]
+    if palette is not None:
+        chunks.append(_png_chunk(b'PLTE', palette.tobytes()))
+    chunks.extend([
+        _png_chunk(b'tRNS', trns),
+        _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compress_level)),
+        _png_chunk(b'IEND', b'')
+    ])
+    return b'\x89PNG\r\n\x1a\n' + b''.join(chunks)
+
+
+def _expand_transparency(img_data: np.ndarray, palette: Optional[np.ndarray],
+                         transparency: Transparency) -> np.ndarray:
+    """Resolve palette and transparency into an explicit alpha channel (LA or RGBA)"""
+    if img_data.ndim == 3:
+        alpha = np.any(img_data != np.asarray(transparency, dtype='uint8'), axis=-1)
+        return np.concatenate((img_data, 255 * alpha[..., np.newaxis].astype('uint8')), axis=-1)
+
+    if palette is None:
+        alpha = img_data != transparency
+        return np.stack((img_data, 255 * alpha.astype('uint8')), axis=-1)
+
+    assert isinstance(transparency, bytes)
+    rgba_table = np.concatenate((
+        palette.reshape(256, 3),
+        np.frombuffer(transparency, dtype='uint8')[:, np.newaxis]
+    ), axis=-1)
+    return rgba_table[img_data]
+
+
+def _encode_png_spng(img_data: np.ndarray, palette: Optional[np.ndarray],
+                     transparency: Transparency, compress_level: int) -> bytes:
+    """Encode via libspng, which does not support palettes or tRNS (so we use alpha instead)"""
+    out = _expand_transparency(img_data, palette, transparency)
+    return pyspng.encode(np.ascontiguousarray(out), compress_level=compress_level)
+
+
+#: Available PNG encoders, selectable via the PNG_ENCODER setting
+PNG_ENCODERS: Dict[str, PNGEncoder] = {
+    'pil': _encode_png_pil,
+    'spng': _encode_png_spng,
+    'fast': _encode_png_fast,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _warn_spng_fallback() -> None:
+    # the encoder is looked up for every tile, but one warning per process is enough
+    warnings.warn(
+        'PNG encoder spng requested, but pyspng failed to import. '
+        'Falling back to PIL.', exceptions.PerformanceWarning
+    )
+
+
+def get_png_encoder(name: str) -> PNGEncoder:
+    """Return PNG encoder of given name, falling back to PIL if it is not available"""
+    if name not in PNG_ENCODERS:
+        raise ValueError(f'Unknown PNG encoder {name}')
+
+    if name == 'spng' and not has_spng:
+        _warn_spng_fallback()
+        return _encode_png_pil
+
+    return PNG_ENCODERS[name]
+
+
+#: Supported output image formats and their MIME types
+IMAGE_FORMATS: Dict[str, str] = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+def _check_image_format(image_format: str) -> None:
+    if image_format not in IMAGE_FORMATS:
+        raise exceptions.InvalidArgumentsError(
+            f'Unknown image format {image_format} (must be one of {list(IMAGE_FORMATS)})'
+        )
+
+
+def _save_options(image_format: str) -> Dict[str, Any]:
+    """Return the encoder options for the given format from the current settings"""
+    settings = get_settings()
+
+    if image_format == 'png':
+        return dict(compress_level=settings.PNG_COMPRESS_LEVEL)
+
+    if image_format == 'webp':
+        return dict(quality=settings.WEBP_QUALITY)
+
+    return dict(quality=settings.JPEG_QUALITY)
+
+
+def save_image(img: Image.Image, image_format: str = 'png') -> BinaryIO:
+    """Encode a PIL image in the given format, using the compression settings"""
+    _check_image_format(image_format)
+
+    if image_format == 'jpeg' and img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+
+    sio = BytesIO()
+    img.save(sio, image_format, **_save_options(image_format))
+    sio.seek(0)
+    return sio
+
+
+def _encode_lossy(img_data: np.ndarray, palette: Optional[np.ndarray],
+                  transparency: Transparency, image_format: str) -> BinaryIO:
+    """Encode as WebP (with alpha channel) or JPEG (without transparency)"""
+    if image_format == 'jpeg':
+        if palette is not None:
+            img_data = palette.reshape(256, 3)[img_data]
+        return save_image(Image.fromarray(img_data), image_format)
+
+    img_data = _expand_transparency(img_data, palette, transparency)
+    img = Image.fromarray(img_data, mode='LA' if img_data.shape[-1] == 2 else 'RGBA')
+    return save_image(img.convert('RGBA'), image_format)
 
 
-@trace('array_to_png')
 def array_to_png(img_data: Array,
                  colormap: Union[str, Palette, None] = None) -> BinaryIO:
     """Encode an 8bit array as PNG"""
+    return array_to_image(img_data, colormap=colormap, image_format='png')
+
+
+def _palette_from_rgba(rgba: np.ndarray) -> Tuple[np.ndarray, bytes]:
+    """Build a PIL palette and transparency bytes from RGBA values, with index 0 transparent"""
+    num_values = len(rgba)
+
+    palette = np.concatenate((
+        np.zeros(3, dtype='uint8'),
+        rgba[:, :-1].flatten(),
+        np.zeros(3 * (256 - num_values - 1), dtype='uint8')
+    ))
+
+    # PIL expects paletted transparency as raw bytes
+    transparency_arr = np.concatenate((
+        np.zeros(1, dtype='uint8'),
+        rgba[:, -1],
+        np.zeros(256 - num_values - 1, dtype='uint8')
+    ))
+
+    assert transparency_arr.shape == (256,)
+    assert transparency_arr.dtype == 'uint8'
+    assert palette.shape == (3 * 256,), palette.shape
+
+    palette.flags.writeable = False
+    return palette, transparency_arr.tobytes()
+
+
+@functools.lru_cache(maxsize=64)
+def _named_colormap_palette(name: str) -> Tuple[np.ndarray, bytes]:
     from terracotta.cmaps import get_cmap
 
-    transparency: Union[Tuple[int, int, int], int, bytes]
+    try:
+        cmap_vals = get_cmap(name)
+    except ValueError as exc:
+        raise exceptions.InvalidArgumentsError(
+            f'Encountered invalid color map {name}') from exc
 
-    settings = get_settings()
-    compress_level = settings.PNG_COMPRESS_LEVEL
+    return _palette_from_rgba(cmap_vals)
+
+
+@functools.lru_cache(maxsize=64)
+def _explicit_colormap_palette(colormap: Tuple[Tuple[Number, ...], ...]
+                               ) -> Tuple[np.ndarray, bytes]:
+    colormap_array = np.asarray(colormap, dtype='uint8')
+    if colormap_array.ndim != 2 or colormap_array.shape[1] != 4:
+        raise ValueError('Explicit color mapping must have shape (n, 4)')
+
+    return _palette_from_rgba(colormap_array)
+
+
+@trace('array_to_image')
+def array_to_image(img_data: Array,
+                   colormap: Union[str, Palette, None] = None,
+                   image_format: str = 'png') -> BinaryIO:
+    """Encode an 8bit array as image of given format (png, webp, jpeg)
+
+    Value 0 is encoded as transparent in PNG and WebP images, and as black in JPEG images.
+    """
+    transparency: Transparency
+    palette: Optional[np.ndarray]
+
+    _check_image_format(image_format)
 
     if img_data.ndim == 3:  # encode RGB image
         if img_data.shape[-1] != 3:
@@ -38,103 +275,94 @@ def array_to_png(img_data: Array,
         if colormap is not None:
             raise ValueError('Colormap argument cannot be given for multi-band data')
 
-        mode = 'RGB'
         transparency = (0, 0, 0)
         palette = None
 
     elif img_data.ndim == 2:  # encode paletted image
-        mode = 'L'
-
         if colormap is None:
             palette = None
             transparency = 0
+        elif isinstance(colormap, str):
+            # get and apply colormap by name
+            palette, transparency = _named_colormap_palette(colormap)
         else:
-            if isinstance(colormap, str):
-                # get and apply colormap by name
-                try:
-                    cmap_vals = get_cmap(colormap)
-                except ValueError as exc:
-                    raise exceptions.InvalidArgumentsError(
-                        f'Encountered invalid color map {colormap}') from exc
-                palette = np.concatenate((
-                    np.zeros(3, dtype='uint8'),
-                    cmap_vals[:, :-1].flatten()
-                ))
-                transparency_arr = np.concatenate((
-                    np.zeros(1, dtype='uint8'),
-                    cmap_vals[:, -1]
-                ))
-            else:
-                # explicit mapping
-                if len(colormap) > 255:
-                    raise exceptions.InvalidArgumentsError(
-                        'Explicit color map must contain less than 256 values'
-                    )
-
-                colormap_array = np.asarray(colormap, dtype='uint8')
-                if colormap_array.ndim != 2 or colormap_array.shape[1] != 4:
-                    raise ValueError('Explicit color mapping must have shape (n, 4)')
-
-                rgb, alpha = colormap_array[:, :-1], colormap_array[:, -1]
-                palette = np.concatenate((
-                    np.zeros(3, dtype='uint8'),
-                    rgb.flatten(),
-                    np.zeros(3 * (256 - len(colormap) - 1), dtype='uint8')
-                ))
-
-                # PIL expects paletted transparency as raw bytes
-                transparency_arr = np.concatenate((
-                    np.zeros(1, dtype='uint8'),
-                    alpha,
-                    np.zeros(256 - len(colormap) - 1, dtype='uint8')
-                ))
-
-            assert transparency_arr.shape == (256,)
-            assert transparency_arr.dtype == 'uint8'
-            transparency = transparency_arr.tobytes()
-
-            assert palette.shape == (3 * 256,), palette.shape
+            # explicit mapping
+            if len(colormap) > 255:
+                raise exceptions.InvalidArgumentsError(
+                    'Explicit color map must contain less than 256 values'
+                )
+
+            try:
+                colormap_key = tuple(tuple(color) for color in colormap)
+            except TypeError:
+                raise ValueError('Explicit color mapping must have shape (n, 4)') from None
+
+            palette, transparency = _explicit_colormap_palette(colormap_key)
     else:
         raise ValueError('Input array must have 2 or 3 dimensions')
 
     if isinstance(img_data, np.ma.MaskedArray):
         img_data = img_data.filled(0)
 
-    img = Image.fromarray(img_data, mode=mode)
+    img_data = np.ascontiguousarray(img_data, dtype='uint8')
 
-    if palette is not None:
-        img.putpalette(palette)
+    if image_format != 'png':
+        return _encode_lossy(img_data, palette, transparency, image_format)
 
-    sio = BytesIO()
-    img.save(sio, 'png', compress_level=compress_level, transparency=transparency)
-    sio.seek(0)
-    return sio
+    settings = get_settings()
+    encoder = get_png_encoder(settings.PNG_ENCODER)
+    return BytesIO(encoder(img_data, palette, transparency, settings.PNG_COMPRESS_LEVEL))
 
 
-def empty_image(size: Tuple[int, int]) -> BinaryIO:
-    """Return a fully transparent PNG image of given size"""
-    settings = get_settings()
-    compress_level = settings.PNG_COMPRESS_LEVEL
+@functools.lru_cache(maxsize=32)
+def _empty_image_bytes(size: Tuple[int, int], image_format: str,
+                       save_options: Tuple[Tuple[str, Any], ...]) -> bytes:
+    if image_format == 'png':
+        img = Image.new(mode='P', size=size, color=0)
+        sio = BytesIO()
+        img.save(sio, 'png', transparency=0, **dict(save_options))
+        return sio.getvalue()
 
-    img = Image.new(mode='P', size=size, color=0)
+    img = Image.new(mode='RGBA', size=size, color=(0, 0, 0, 0))
+    if image_format == 'jpeg':
+        img = img.convert('RGB')
 
     sio = BytesIO()
-    img.save(sio, 'png', compress_level=compress_level, transparency=0)
-    sio.seek(0)
-    return sio
+    img.save(sio, image_format, **dict(save_options))
+    return sio.getvalue()
+
+
+def empty_image(size: Tuple[int, int], image_format: str = 'png') -> BinaryIO:
+    """Return a fully transparent image of given size and format (black for JPEG)
+
+    Encoded images are cached, so repeated calls are cheap.
+    """
+    _check_image_format(image_format)
+    save_options = tuple(sorted(_save_options(image_format).items()))
+    return BytesIO(_empty_image_bytes((size[0], size[1]), image_format, save_options))
 
 
 @trace('contrast_stretch')
 def contrast_stretch(data: Array,
                      in_range: Sequence[Number],
                      out_range: Sequence[Number],
-                     clip: bool = True) -> Array:
-    """Normalize input array from in_range to out_range"""
+                     clip: bool = True,
+                     out: Optional[np.ndarray] = None) -> Array:
+    """Normalize input array from in_range to out_range
+
+    If out is given, the result is computed in place in that (floating point) array,
+    ignoring any mask of data.
+    """
     lower_bound_in, upper_bound_in = in_range
     lower_bound_out, upper_bound_out = out_range
 
-    out_data = data.astype('float64', copy=True)
-    out_data -= lower_bound_in
+    if out is None:
+        out_data = data.astype('float64', copy=True)
+        out_data -= lower_bound_in
+    else:
+        out_data = out
+        np.subtract(np.ma.getdata(data), lower_bound_in, out=out_data, casting='unsafe')
+
     norm = upper_bound_in - lower_bound_in
     if abs(norm) > 1e-8:  # prevent division by 0
         out_data *= (upper_bound_out - lower_bound_out) / norm
@@ -146,10 +374,73 @@ def contrast_stretch(data: Array,
     return out_data
 
 
-def to_uint8(data: Array, lower_bound: Number, upper_bound: Number) -> Array:
-    """Re-scale an array to [1, 255] and cast to uint8 (0 is used for transparency)"""
-    rescaled = contrast_stretch(data, (lower_bound, upper_bound), (1, 255), clip=True)
-    return rescaled.astype(np.uint8)
+def _get_scratch_buffer(shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+    """Return an uninitialized array of given shape, re-using memory within each thread"""
+    buffers: Dict[str, np.ndarray] = _SCRATCH.__dict__.setdefault('buffers', {})
+    size = int(np.prod(shape))
+
+    buf = buffers.get(dtype.str)
+    if buf is None or buf.size < size:
+        buf = buffers[dtype.str] = np.empty(size, dtype=dtype)
+
+    return buf[:size].reshape(shape)
+
+
+@functools.lru_cache(maxsize=128)
+def _uint8_lookup_table(dtype_str: str, lower_bound: float, upper_bound: float) -> np.ndarray:
+    """Return to_uint8 applied to every representable value of a small integer dtype.
+
+    The table is ordered by the unsigned view of each value, so it can be indexed directly
+    with ``data.view(unsigned_dtype)``.
+    """
+    dtype = np.dtype(dtype_str)
+    index_dtype = np.dtype(f'u{dtype.itemsize}')
+    all_values = np.arange(2 ** (8 * dtype.itemsize), dtype=index_dtype).view(dtype)
+    lut = contrast_stretch(all_values, (lower_bound, upper_bound), (1, 255), clip=True)
+    lut = lut.astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def _supports_lookup_table(dtype: np.dtype) -> bool:
+    return dtype.kind in 'iu' and dtype.itemsize <= 2 and dtype.isnative
+
+
+def to_uint8(data: Array, lower_bound: Number, upper_bound: Number,
+             out: Optional[np.ndarray] = None) -> Array:
+    """Re-scale an array to [1, 255] and cast to uint8 (0 is used for transparency)
+
+    (U)Int8 and (U)Int16 data is mapped through a precomputed lookup table, all other data
+    is stretched in a per-thread float32 scratch buffer. Masked values are set to 0.
+    If out is given, the result is written to it.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=np.uint8)
+    elif out.shape != data.shape or out.dtype != np.uint8:
+        raise ValueError('out must be a uint8 array of the same shape as data')
+
+    raw_data = np.ma.getdata(data)
+    mask = np.ma.getmask(data)
+
+    if _supports_lookup_table(data.dtype):
+        lut = _uint8_lookup_table(data.dtype.str, float(lower_bound), float(upper_bound))
+        np.take(lut, raw_data.view(f'u{data.dtype.itemsize}'), out=out)
+        if mask is not np.ma.nomask:
+            np.copyto(out, 0, where=mask)
+    else:
+        # the lower bound is subtracted at input precision before casting to float32,
+        # so large offsets do not lose precision
+        scratch = _get_scratch_buffer(data.shape, np.dtype('float32'))
+        contrast_stretch(raw_data, (lower_bound, upper_bound), (1, 255), clip=True, out=scratch)
+        if mask is not np.ma.nomask:
+            # fill before casting so masked NaNs never reach the integer conversion
+            np.copyto(scratch, 0, where=mask)
+        np.copyto(out, scratch, casting='unsafe')
+
+    if isinstance(data, np.ma.MaskedArray):
+        return np.ma.masked_array(out, mask=np.ma.getmaskarray(data))
+
+    return out
 
 
 def label(data: Array, labels: Sequence[Number]) -> Array:
@@ -167,8 +458,35 @@ def label(data: Array, labels: Sequence[Number]) -> Array:
     if len(labels) > 255:
         raise ValueError('Cannot fit more than 255 labels')
 
-    out_data = np.zeros(data.shape, dtype='uint8')
-    for i, label in enumerate(labels, 1):
-        out_data[data == label] = i
+    raw_data = np.ma.getdata(data)
 
-    return out_data
+    # later occurrences of duplicate labels take precedence
+    label_values = {label: i for i, label in enumerate(labels, 1)}
+
+    if not label_values:
+        return np.zeros(raw_data.shape, dtype='uint8')
+
+    if _supports_lookup_table(raw_data.dtype):
+        # map every representable value through a dense table
+        info = np.iinfo(raw_data.dtype)
+        index_dtype = np.dtype(f'u{raw_data.dtype.itemsize}')
+        lut = np.zeros(2 ** (8 * raw_data.dtype.itemsize), dtype='uint8')
+
+        for label, i in label_values.items():
+            if not float(label).is_integer() or not info.min <= label <= info.max:
+                # label cannot occur in data
+                continue
+            index = np.array(int(label), dtype=raw_data.dtype).view(index_dtype)
+            lut[index] = i
+
+        return np.take(lut, raw_data.view(index_dtype))
+
+    sorted_labels = np.array(list(label_values.keys()))
+    sorted_values = np.array(list(label_values.values()), dtype='uint8')
+    sort_idx = np.argsort(sorted_labels)
+    sorted_labels, sorted_values = sorted_labels[sort_idx], sorted_values[sort_idx]
+
+    idx = np.searchsorted(sorted_labels, raw_data)
+    np.clip(idx, 0, len(sorted_labels) - 1, out=idx)
+    is_label = sorted_labels[idx] == raw_data
+    return np.where(is_label, sorted_values[idx], 0).astype('uint8')
@@ -1,6 +1,7 @@
 """scripts/serve.py
 
-Use Flask development server to serve up raster files or database locally.
+Use Flask development server or a multi-process WSGI server to serve up raster files or
+database locally.
 """
 
 from typing import Any, Tuple, Sequence
@@ -17,7 +18,8 @@ from terracotta.scripts.http_utils import find_open_port
 logger = logging.getLogger(__name__)
 
 
-@click.command('serve', short_help='Serve rasters through a local Flask development server.')
+@click.command('serve', short_help='Serve rasters through a local Flask development server '
+                                   'or a multi-process WSGI server.')
 @click.option('-d', '--database', required=False, default=None, help='Database to serve from.')
 @click.option('-r', '--raster-pattern', type=RasterPattern(), required=False, default=None,
               help='A format pattern defining paths and keys of the raster files to serve.')
@@ -32,6 +34,10 @@ logger = logging.getLogger(__name__)
               help='Allow connections from outside IP addresses. Use with care!')
 @click.option('--port', type=click.INT, default=None,
               help='Port to use [default: first free port between 5000 and 5099].')
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Number of worker processes. Enables production mode if given.')
+@click.option('--threads', type=click.IntRange(min=1), default=None,
+              help='Number of threads per worker process. Enables production mode if given.')
 def serve(database: str = None,
           raster_pattern: RasterPatternType = None,
           debug: bool = False,
@@ -39,7 +45,9 @@ def serve(database: str = None,
           database_provider: str = None,
           allow_all_ips: bool = False,
           port: int = None,
-          rgb_key: str = None) -> None:
+          rgb_key: str = None,
+          workers: int = None,
+          threads: int = None) -> None:
     """Serve rasters through a local Flask development server.
 
     Either -d/--database or -r/--raster-pattern must be given.
@@ -50,8 +58,13 @@ def serve(database: str = None,
 
     The empty group {} is replaced by a wildcard matching anything (similar to * in glob patterns).
 
-    This command is a data exploration tool and not meant for production use. Deploy Terracotta as
-    a WSGI or serverless app instead.
+    By default, this command runs a single-threaded development server meant for data
+    exploration. Pass --workers and/or --threads to serve requests concurrently through
+    gunicorn (if installed) or an embedded pre-forking server instead, e.g.
+
+        $ terracotta serve -d tc.sqlite --workers 4 --threads 2
+
+    For larger deployments, deploy Terracotta as a WSGI or serverless app.
     """
     from terracotta import get_driver, update_settings
     from terracotta.server import create_app
@@ -59,6 +72,14 @@ def serve(database: str = None,
     if (database is None) == (raster_pattern is None):
         raise click.UsageError('Either --database or --raster-pattern must be given')
 
+    production_mode = workers is not None or threads is not None
+
+    if production_mode and (debug or profile):
+        raise click.UsageError(
+            '--debug and --profile are only supported by the development server, '
+            'and cannot be combined with --workers or --threads'
+        )
+
     if raster_pattern is not None:
         dbfile = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
         dbfile.close()
@@ -103,6 +124,18 @@ def serve(database: str = None,
 
     server_app = create_app(debug=debug, profile=profile)
 
+    if production_mode:
+        from terracotta.scripts.wsgi_server import preload, run_server
+
+        if os.environ.get('TC_TESTING'):
+            preload()
+            return
+
+        run_server(  # pragma: no cover
+            server_app, host, port, workers=workers or 1, threads=threads or 1
+        )
+        return  # pragma: no cover
+
     if os.environ.get('TC_TESTING'):
         return
 
@@ -0,0 +1,281 @@
+"""scripts/wsgi_server.py
+
+Multi-process WSGI servers for production use of terracotta serve.
+"""
+
+from typing import Any, Callable, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import signal
+import logging
+import warnings
+
+from werkzeug.serving import BaseWSGIServer
+
+from terracotta import exceptions
+
+try:
+    from gunicorn.app.base import BaseApplication
+    has_gunicorn = True
+except ImportError:  # pragma: no cover
+    has_gunicorn = False
+
+WSGIApplication = Callable[..., Any]
+
+logger = logging.getLogger(__name__)
+
+#: Number of datasets to read when warming up the database index before forking
+PRELOAD_DATASETS = 100
+
+#: Minimum lifetime in seconds of a worker process before it is respawned right away
+MIN_WORKER_LIFETIME = 1
+
+
+def preload() -> None:
+    """Load everything that can be shared between worker processes.
+
+    This is called in the master process before forking, so all workers inherit
+    handlers, colormaps, and an initialized GDAL, and find the metadata index of the
+    database warm in the OS page cache.
+    """
+    import importlib
+    import pkgutil
+
+    import rasterio
+
+    from terracotta import get_settings, get_driver, handlers
+    from terracotta.cmaps import AVAILABLE_CMAPS, get_cmap
+
+    # handlers are imported lazily by their routes
+    for module in pkgutil.iter_modules(handlers.__path__):
+        importlib.import_module(f'{handlers.__name__}.{module.name}')
+
+    for cmap in AVAILABLE_CMAPS:
+        get_cmap(cmap)
+
+    # registers all GDAL drivers
+    with rasterio.Env():
+        pass
+
+    settings = get_settings()
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    # connections are closed on exit, so no connection is shared between workers;
+    # only a bounded page is read, the master process does not need all datasets
+    with driver.connect():
+        driver.get_keys()
+        driver.get_datasets(limit=PRELOAD_DATASETS)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles requests in a fixed-size thread pool"""
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app: WSGIApplication, threads: int = 1,
+                 **kwargs: Any) -> None:
+        super().__init__(host, port, app, **kwargs)
+        self.threads = threads
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        if self._pool is None:
+            # created lazily so every forked worker gets its own threads
+            self._pool = ThreadPoolExecutor(max_workers=self.threads)
+
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request: Any, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+class _Shutdown(Exception):
+    pass
+
+
+def _raise_shutdown(signum: int, frame: Any) -> None:
+    raise _Shutdown()
+
+
+def serve_worker(server: PooledWSGIServer) -> None:
+    """Accept connections on the (shared) server socket until SIGTERM or SIGINT.
+
+    Connections are accepted by blocking calls, so the kernel hands each connection to
+    exactly one waiting worker. On shutdown, requests in flight are completed first.
+    """
+    accepting = False
+    stopping = False
+
+    def request_shutdown(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        # interrupt waiting for a connection, but never a connection that is being handed off
+        if accepting:
+            raise _Shutdown()
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    try:
+        while not stopping:
+            try:
+                accepting = True
+                request, client_address = server.get_request()
+            except _Shutdown:
+                break
+            except OSError:
+                continue
+            finally:
+                accepting = False
+
+            if server.verify_request(request, client_address):
+                server.process_request(request, client_address)
+            else:
+                server.shutdown_request(request)
+    finally:
+        server.server_close()
+
+
+def _spawn_worker(server: PooledWSGIServer) -> int:
+    pid = os.fork()
+
+    if pid == 0:  # pragma: no cover
+        exit_code = 1
+        try:
+            serve_worker(server)
+            exit_code = 0
+        finally:
+            # never return into the code of the master process
+            os._exit(exit_code)
+
+    return pid
+
+
+def run_embedded(app: WSGIApplication, host: str, port: int, workers: int = 1,
+                 threads: int = 1) -> None:
+    """Serve app from workers pre-forked processes with threads threads each
+
+    The master process respawns workers that die, and forwards SIGTERM and SIGINT to
+    them for a graceful shutdown.
+    """
+    server = PooledWSGIServer(host, port, app, threads=threads)
+
+    if not hasattr(os, 'fork'):  # pragma: no cover
+        if workers > 1:
+            warnings.warn(
+                'Multiple worker processes are not supported on this platform. '
+                'Falling back to a single process.', exceptions.PerformanceWarning
+            )
+        workers = 1
+
+    if workers == 1:
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return
+
+    server.multiprocess = True
+
+    children: Dict[int, float] = {}
+
+    def spawn() -> None:
+        children[_spawn_worker(server)] = time.monotonic()
+
+    previous_handlers = {
+        signum: signal.signal(signum, _raise_shutdown)
+        for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+
+    try:
+        for _ in range(workers):
+            spawn()
+
+        while True:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+
+            logger.warning('Worker %d exited with status %d, respawning', pid, status)
+
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                # do not fork in a tight loop if workers die on startup
+                time.sleep(MIN_WORKER_LIFETIME)
+
+            spawn()
+
+    except _Shutdown:
+        pass
+
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+        _stop_workers(set(children))
+        server.socket.close()
+
+
+def _stop_workers(pids: Set[int]) -> None:
+    """Ask workers to shut down gracefully, and wait until they have"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+def run_gunicorn(app: WSGIApplication, host: str, port: int, workers: int = 1,
+                 threads: int = 1) -> None:
+    """Serve app through gunicorn from workers pre-forked processes"""
+    options: Dict[str, Any] = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        # app is already loaded, so this just prevents gunicorn from re-importing it
+        'preload_app': True,
+    }
+
+    class TerracottaApplication(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self) -> WSGIApplication:
+            return app
+
+    TerracottaApplication().run()
+
+
+def run_server(app: WSGIApplication, host: str, port: int, workers: int = 1,
+               threads: int = 1) -> None:
+    """Preload shared state, then serve app through gunicorn or the embedded server"""
+    preload()
+
+    if has_gunicorn:
+        run_gunicorn(app, host, port, workers=workers, threads=threads)
+        return
+
+    warnings.warn(
+        'gunicorn is not installed, falling back to embedded WSGI server. '
+        'Consider installing gunicorn for more robust worker management.',
+        exceptions.PerformanceWarning
+    )
+    run_embedded(app, host, port, workers=workers, threads=threads)
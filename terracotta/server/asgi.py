@@ -0,0 +1,371 @@
+"""server/asgi.py
+
+ASGI version of the Terracotta API.
+
+Requests are answered by the regular Flask app (same routes, schemas, error handling, and
+CORS configuration), which runs in a thread pool. Before that, raster reads of tile
+requests are submitted to the raster executor and awaited on the event loop via
+``asyncio.wrap_future``, so no thread is blocked while data is fetched. Fetched tiles end
+up in the raster cache, where the Flask handlers pick them up.
+
+All routes that read raster data (tiles, previews, and statistics) are prefetched, see
+``TILE_READS``. Prefetching requires a raster cache (``RASTER_CACHE_SIZE > 0``); without
+one, handlers read data themselves in the thread pool.
+
+Run e.g. with ``uvicorn --factory terracotta.server.asgi:create_asgi_app``.
+"""
+
+from typing import (Any, Awaitable, Callable, Dict, List, Mapping, MutableMapping, Optional,
+                    Sequence, Tuple, TYPE_CHECKING)
+from concurrent.futures import Future
+from io import BytesIO
+import asyncio
+import logging
+import sys
+import urllib.parse
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+
+if TYPE_CHECKING:  # pragma: no cover
+    from terracotta.drivers.base import Driver
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_keys(view_args: Mapping[str, Any]) -> List[str]:
+    return [key for key in view_args.get('keys', '').split('/') if key]
+
+
+def _parse_tile_xyz(view_args: Mapping[str, Any]) -> Optional[Tuple[int, int, int]]:
+    if 'tile_z' not in view_args:
+        return None
+    return (view_args['tile_x'], view_args['tile_y'], view_args['tile_z'])
+
+
+def _read_tile(driver: 'Driver', keys: Sequence[str], view_args: Mapping[str, Any],
+               options: Mapping[str, Any], **kwargs: Any) -> Future:
+    from terracotta import get_settings, xyz
+    return xyz.get_tile_data(
+        driver, keys, _parse_tile_xyz(view_args),
+        tile_size=options.get('tile_size') or get_settings().DEFAULT_TILE_SIZE,
+        asynchronous=True, **kwargs
+    )
+
+
+def _singleband_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                      args: MultiDict) -> List[Future]:
+    from terracotta.server.singleband import SinglebandOptionSchema
+    options = SinglebandOptionSchema().load(args)
+    return [_read_tile(
+        driver, _parse_keys(view_args), view_args, options,
+        preserve_values=options.get('colormap') == 'explicit'
+    )]
+
+
+def _rgb_reads(driver: 'Driver', view_args: Mapping[str, Any],
+               args: MultiDict) -> List[Future]:
+    from terracotta.server.rgb import RGBOptionSchema
+    options = RGBOptionSchema().load(args)
+    some_keys = _parse_keys(view_args)
+    return [
+        _read_tile(driver, [*some_keys, options[band]], view_args, options)
+        for band in ('r', 'g', 'b')
+    ]
+
+
+def _compute_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                   args: MultiDict) -> List[Future]:
+    from terracotta.server.compute import ComputeOptionSchema
+    options = ComputeOptionSchema().load(args)
+    some_keys = _parse_keys(view_args)
+    return [
+        _read_tile(driver, [*some_keys, options[f'v{i}']], view_args, options)
+        for i in range(1, 6) if f'v{i}' in options
+    ]
+
+
+def _hillshade_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                     args: MultiDict) -> List[Future]:
+    from terracotta.server.hillshade import HillshadeOptionSchema
+    options = HillshadeOptionSchema().load(args)
+    # tiles are read with a 1px border to compute slopes at the edges
+    padding = 0 if _parse_tile_xyz(view_args) is None else 1
+    return [_read_tile(driver, _parse_keys(view_args), view_args, options, padding=padding)]
+
+
+def _discrete_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                    args: MultiDict) -> List[Future]:
+    from terracotta.server.discrete import DiscreteOptionSchema
+    options = DiscreteOptionSchema().load(args)
+    return [_read_tile(driver, _parse_keys(view_args), view_args, options)]
+
+
+def _data_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                args: MultiDict) -> List[Future]:
+    from terracotta.server.data import DataOptionSchema
+    options = DataOptionSchema().load(args)
+    return [_read_tile(driver, _parse_keys(view_args), view_args, options,
+                       preserve_values=True)]
+
+
+def _terrain_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                   args: MultiDict) -> List[Future]:
+    from terracotta.server.terrain import TerrainOptionSchema
+    options = TerrainOptionSchema().load(args)
+    return [_read_tile(driver, _parse_keys(view_args), view_args, options)]
+
+
+def _mosaic_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                  args: MultiDict) -> List[Future]:
+    import mercantile
+    from terracotta import get_settings
+    from terracotta.server.mosaic import MosaicOptionSchema
+
+    options = MosaicOptionSchema().load(args)
+    settings = get_settings()
+    some_keys = _parse_keys(view_args)
+
+    if not some_keys or len(some_keys) >= len(driver.key_names):
+        return []
+
+    tile_x, tile_y, tile_z = view_args['tile_x'], view_args['tile_y'], view_args['tile_z']
+    mercator_tile = mercantile.Tile(x=tile_x, y=tile_y, z=tile_z)
+
+    datasets = driver.get_datasets(
+        where=dict(zip(driver.key_names, some_keys)),
+        where_bbox=mercantile.bounds(mercator_tile),
+        limit=settings.MAX_MOSAIC_DATASETS + 1
+    )
+
+    if len(datasets) > settings.MAX_MOSAIC_DATASETS:
+        # the handler rejects the request
+        return []
+
+    return [
+        driver.get_raster_tile(
+            keys, tile_bounds=mercantile.xy_bounds(mercator_tile),
+            tile_size=options.get('tile_size') or settings.DEFAULT_TILE_SIZE,
+            asynchronous=True
+        )
+        for keys in datasets
+    ]
+
+
+def _statistics_reads(driver: 'Driver', view_args: Mapping[str, Any],
+                      args: MultiDict) -> List[Future]:
+    from terracotta import xyz
+    from terracotta.handlers.statistics import DEFAULT_STATISTICS_TILE_SIZE
+    from terracotta.server.statistics import (StatisticsOptionSchema,
+                                              StatisticsBoundsOptionSchema)
+
+    keys = _parse_keys(view_args)
+    tile_xyz = _parse_tile_xyz(view_args)
+
+    if tile_xyz is None:
+        options = StatisticsBoundsOptionSchema().load(args)
+        bounds = options['bbox']
+    else:
+        options = StatisticsOptionSchema().load(args)
+        bounds = xyz.get_tile_bounds(*tile_xyz)
+
+    tile_size = options.get('tile_size') or DEFAULT_STATISTICS_TILE_SIZE
+
+    if bounds is None:
+        return [xyz.get_tile_data(driver, keys, tile_size=tile_size, asynchronous=True)]
+
+    # the handler only reads the part of the bounds covered by the dataset
+    clipped_bounds = xyz.clip_to_dataset(driver, keys, bounds)
+    return [xyz.get_bounds_data(
+        driver, keys, clipped_bounds, tile_size=tile_size, asynchronous=True
+    )]
+
+
+ReadFunction = Callable[['Driver', Mapping[str, Any], MultiDict], List[Future]]
+
+#: Functions submitting the raster reads needed to answer a request to the given endpoint.
+#: They mirror the reads of the respective handler, so the handler finds them in the cache.
+TILE_READS: Dict[str, ReadFunction] = {
+    'tile_api.get_singleband': _singleband_reads,
+    'tile_api.get_singleband_preview': _singleband_reads,
+    'tile_api.get_rgb': _rgb_reads,
+    'tile_api.get_rgb_preview': _rgb_reads,
+    'tile_api.get_compute': _compute_reads,
+    'tile_api.get_compute_preview': _compute_reads,
+    'tile_api.get_hillshade': _hillshade_reads,
+    'tile_api.get_hillshade_preview': _hillshade_reads,
+    'tile_api.get_discrete': _discrete_reads,
+    'tile_api.get_discrete_preview': _discrete_reads,
+    'tile_api.get_mosaic': _mosaic_reads,
+    'tile_api.get_data': _data_reads,
+    'tile_api.get_terrain': _terrain_reads,
+    'metadata_api.get_statistics': _statistics_reads,
+    'metadata_api.get_statistics_bounds': _statistics_reads,
+}
+
+
+def _submit_reads(get_reads: ReadFunction, view_args: Mapping[str, Any],
+                  args: MultiDict) -> List[Future]:
+    from terracotta import get_settings, get_driver
+
+    settings = get_settings()
+    driver = get_driver(settings.DRIVER_PATH, provider=settings.DRIVER_PROVIDER)
+
+    with driver.connect():
+        return get_reads(driver, view_args, args)
+
+
+def _build_environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+
+        if key in environ:
+            value = f'{environ[key]},{value}'
+
+        environ[key] = value
+
+    return environ
+
+
+def _call_wsgi(wsgi_app: Callable, environ: Dict[str, Any]
+               ) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    response_start: List[Any] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]],
+                       exc_info: Any = None) -> Callable:
+        response_start[:] = [status, headers]
+        return lambda data: None
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    status, headers = response_start
+    raw_headers = [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in headers
+    ]
+    return int(status.split(' ', 1)[0]), raw_headers, body
+
+
+class TerracottaASGIApp:
+    """ASGI application serving the Terracotta API"""
+
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._handle_lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError(f'unsupported ASGI scope type {scope["type"]}')
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+
+        environ = _build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+
+        await self.prefetch(environ)
+
+        status, headers, response_body = await loop.run_in_executor(
+            None, _call_wsgi, self.flask_app.wsgi_app, environ
+        )
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response_body})
+
+    async def prefetch(self, environ: Dict[str, Any]) -> None:
+        """Fetch all raster tiles needed by the request without blocking a thread"""
+        from terracotta import get_settings
+
+        if get_settings().RASTER_CACHE_SIZE <= 0:
+            # fetched tiles would not be kept until the handler needs them
+            return
+
+        try:
+            endpoint, view_args = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return
+
+        get_reads = TILE_READS.get(endpoint)
+        if get_reads is None:
+            return
+
+        args = MultiDict(urllib.parse.parse_qsl(environ['QUERY_STRING']))
+        loop = asyncio.get_running_loop()
+
+        try:
+            # reading metadata may block, so submit reads from a worker thread
+            futures = await loop.run_in_executor(
+                None, _submit_reads, get_reads, view_args, args
+            )
+        except Exception as exc:
+            # prefetching is best-effort, the Flask app produces the appropriate response
+            logger.debug('Could not prefetch tiles: %s', exc)
+            return
+
+        results = await asyncio.gather(
+            *map(asyncio.wrap_future, futures), return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.debug('Prefetching tile failed: %s', result)
+
+    async def _handle_lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(debug: bool = False, profile: bool = False) -> TerracottaASGIApp:
+    """Returns an ASGI app"""
+    from terracotta.server import create_app
+    return TerracottaASGIApp(create_app(debug=debug, profile=profile))
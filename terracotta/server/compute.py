@@ -19,6 +19,7 @@ class ComputeQuerySchema(Schema):
     tile_z = fields.Int(required=True, description='Requested zoom level')
     tile_y = fields.Int(required=True, description='y coordinate')
     tile_x = fields.Int(required=True, description='x coordinate')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
 def _operator_field(i: int) -> fields.String:
@@ -72,10 +73,12 @@ class ComputeOptionSchema(Schema):
         return data
 
 
-@TILE_API.route('/compute/<int:tile_z>/<int:tile_x>/<int:tile_y>.png', methods=['GET'])
-@TILE_API.route('/compute/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png',
+@TILE_API.route('/compute/<int:tile_z>/<int:tile_x>/<int:tile_y>.<image_format:image_format>',
                 methods=['GET'])
-def get_compute(tile_z: int, tile_y: int, tile_x: int, keys: str = '') -> Response:
+@TILE_API.route('/compute/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>'
+                '.<image_format:image_format>', methods=['GET'])
+def get_compute(tile_z: int, tile_y: int, tile_x: int, keys: str = '',
+                image_format: str = 'png') -> Response:
     """Combine datasets into a single-band PNG image through a given mathematical expression
     ---
     get:
@@ -99,16 +102,17 @@ def get_compute(tile_z: int, tile_y: int, tile_x: int, keys: str = '') -> Respon
                     No dataset found for given key combination
     """
     tile_xyz = (tile_x, tile_y, tile_z)
-    return _get_compute_image(keys, tile_xyz)
+    return _get_compute_image(keys, tile_xyz, image_format=image_format)
 
 
 class ComputePreviewSchema(Schema):
     keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
-@TILE_API.route('/compute/preview.png', methods=['GET'])
-@TILE_API.route('/compute/<path:keys>/preview.png', methods=['GET'])
-def get_compute_preview(keys: str = '') -> Response:
+@TILE_API.route('/compute/preview.<image_format:image_format>', methods=['GET'])
+@TILE_API.route('/compute/<path:keys>/preview.<image_format:image_format>', methods=['GET'])
+def get_compute_preview(keys: str = '', image_format: str = 'png') -> Response:
     """Combine datasets into a single-band PNG image through a given mathematical expression
     ---
     get:
@@ -131,11 +135,13 @@ def get_compute_preview(keys: str = '') -> Response:
                 description:
                     No dataset found for given key combination
     """
-    return _get_compute_image(keys)
+    return _get_compute_image(keys, image_format=image_format)
 
 
-def _get_compute_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Any:
+def _get_compute_image(keys: str, tile_xyz: Tuple[int, int, int] = None,
+                       image_format: str = 'png') -> Any:
     from terracotta.handlers.compute import compute
+    from terracotta.image import IMAGE_FORMATS
 
     parsed_keys = [key for key in keys.split('/') if key]
 
@@ -152,6 +158,7 @@ def _get_compute_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Any:
 
     expression = options.pop('expression')
 
-    image = compute(expression, parsed_keys, operand_keys, tile_xyz=tile_xyz, **options)
+    image = compute(expression, parsed_keys, operand_keys, tile_xyz=tile_xyz,
+                    image_format=image_format, **options)
 
-    return send_file(image, mimetype='image/png')
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
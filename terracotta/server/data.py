@@ -0,0 +1,92 @@
+"""server/data.py
+
+Flask route to handle /data calls.
+"""
+
+from typing import Any, Mapping, Dict
+import json
+
+from marshmallow import Schema, fields, validate, pre_load, ValidationError, EXCLUDE
+from flask import request, send_file, Response
+
+from terracotta.server.flask_api import TILE_API
+
+
+class DataQuerySchema(Schema):
+    keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    tile_z = fields.Int(required=True, description='Requested zoom level')
+    tile_y = fields.Int(required=True, description='y coordinate')
+    tile_x = fields.Int(required=True, description='x coordinate')
+
+
+class DataOptionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    compression = fields.String(
+        description='Compression of the returned data (none, deflate, or zstd)',
+        validate=validate.OneOf(('none', 'deflate', 'zstd')), missing='deflate'
+    )
+
+    dtype = fields.String(
+        description='Data type of the returned data. native keeps the data type of the '
+                    'dataset, float16 trades precision for size.',
+        validate=validate.OneOf(('native', 'float32', 'float16')), missing='native'
+    )
+
+    tile_size = fields.List(
+        fields.Integer(), validate=validate.Length(equal=2), example='[256,256]',
+        description='Pixel dimensions of the returned data as JSON list.'
+    )
+
+    @pre_load
+    def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        data = dict(data.items())
+        for var in ('tile_size',):
+            val = data.get(var)
+            if val:
+                try:
+                    data[var] = json.loads(val)
+                except json.decoder.JSONDecodeError as exc:
+                    msg = f'Could not decode value {val} for {var} as JSON'
+                    raise ValidationError(msg) from exc
+
+        return data
+
+
+@TILE_API.route('/data/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>', methods=['GET'])
+def get_data(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+    """Return raw data of requested tile for client-side rendering
+    ---
+    get:
+        summary: /data
+        description:
+            Return raw values of requested XYZ tile in a compact binary format
+            (header, typed array, and packed mask; see terracotta.handlers.data).
+        parameters:
+            - in: path
+              schema: DataQuerySchema
+            - in: query
+              schema: DataOptionSchema
+        responses:
+            200:
+                description:
+                    Binary data of requested tile
+            400:
+                description:
+                    Invalid query parameters
+            404:
+                description:
+                    No dataset found for given key combination
+    """
+    from terracotta.handlers.data import data, DATA_MIMETYPE
+
+    parsed_keys = [key for key in keys.split('/') if key]
+
+    option_schema = DataOptionSchema()
+    options = option_schema.load(request.args)
+
+    tile_xyz = (tile_x, tile_y, tile_z)
+    tile = data(parsed_keys, tile_xyz, **options)
+
+    return send_file(tile, mimetype=DATA_MIMETYPE)
@@ -3,9 +3,10 @@
 Flask route to handle /datasets calls.
 """
 
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Mapping, Union
 from flask import request, jsonify, Response
-from marshmallow import Schema, fields, validate, INCLUDE, post_load
+from marshmallow import Schema, fields, validate, INCLUDE, pre_load, post_load, ValidationError
+import json
 import re
 
 from terracotta.server.flask_api import METADATA_API
@@ -27,6 +28,24 @@ class DatasetOptionSchema(Schema):
     page = fields.Integer(
         missing=0, description='Current dataset page', validate=validate.Range(min=0)
     )
+    bbox = fields.List(
+        fields.Number(), validate=validate.Length(equal=4), missing=None,
+        example='[10.5,55.2,11.0,55.7]',
+        description='Only return datasets intersecting this bounding box, given as JSON list '
+                    'in the form [west, south, east, north] (in WGS84)'
+    )
+
+    @pre_load
+    def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        data = dict(data.items())
+        val = data.get('bbox')
+        if val:
+            try:
+                data['bbox'] = json.loads(val)
+            except json.decoder.JSONDecodeError as exc:
+                msg = f'Could not decode value {val} for bbox as JSON'
+                raise ValidationError(msg) from exc
+        return data
 
     @post_load
     def list_items(self, data: Dict[str, Any], **kwargs: Any) -> Dict[str, Union[str, List[str]]]:
@@ -79,12 +98,13 @@ def get_datasets() -> Response:
 
     limit = options.pop('limit')
     page = options.pop('page')
+    bbox = options.pop('bbox')
     keys = options or None
 
     payload = {
         'limit': limit,
         'page': page,
-        'datasets': datasets(keys, page=page, limit=limit)
+        'datasets': datasets(keys, page=page, limit=limit, bbox=bbox)
     }
 
     schema = DatasetSchema()
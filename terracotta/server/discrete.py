@@ -17,11 +17,8 @@ from marshmallow import (
 )
 from flask import request, send_file, Response
 
-from matplotlib.pyplot import colormaps
-
 from terracotta.server.flask_api import TILE_API
-
-# from terracotta.cmaps import AVAILABLE_CMAPS
+from terracotta.cmaps import AVAILABLE_CMAPS
 
 
 class DiscreteQuerySchema(Schema):
@@ -29,21 +26,33 @@ class DiscreteQuerySchema(Schema):
     tile_z = fields.Int(required=True, description="Requested zoom level")
     tile_y = fields.Int(required=True, description="y coordinate")
     tile_x = fields.Int(required=True, description="x coordinate")
+    image_format = fields.String(required=True, description="Image format (png, webp or jpg)")
+
+
+def _validate_colormap(colormap: str) -> None:
+    if colormap.lower() in AVAILABLE_CMAPS:
+        return
+
+    from matplotlib import colormaps
+
+    if colormap not in colormaps:
+        raise ValidationError(f"Unknown colormap {colormap}")
 
 
 class DiscreteOptionSchema(Schema):
     class Meta:
         unknown = EXCLUDE
 
-    # only matplotlib colormaps are allowed
     colormap = fields.String(
-        description="Colormap to apply to image (see /colormap)",
-        validate=validate.OneOf(colormaps()),
+        description="Colormap to apply to image (see /colormap). Also accepts the names of "
+        "all other matplotlib colormaps.",
+        validate=_validate_colormap,
         missing="viridis",
     )
 
-    n_classes = fields.Number(
-        description="Number of classes to use. Defaults to 16.",
+    n_classes = fields.Integer(
+        description="Number of classes to use (at most 255). Defaults to 16.",
+        validate=validate.Range(min=1, max=255),
         missing=16,
     )
 
@@ -67,7 +76,17 @@ class DiscreteOptionSchema(Schema):
     @pre_load
     def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
         data = dict(data.items())
-        for var in ("colormap", "n_classes", "vmin", "vmax"):
+
+        colormap = data.get("colormap")
+        if colormap and colormap.startswith('"'):
+            # colormap names used to be passed as JSON strings
+            try:
+                data["colormap"] = json.loads(colormap)
+            except json.decoder.JSONDecodeError as exc:
+                msg = f"Could not decode value {colormap} for colormap as JSON"
+                raise ValidationError(msg) from exc
+
+        for var in ("n_classes", "vmin", "vmax"):
             val = data.get(var)
             if val:
                 try:
@@ -80,10 +99,12 @@ class DiscreteOptionSchema(Schema):
 
 
 @TILE_API.route(
-    "/discrete/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png",
+    "/discrete/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.<image_format:image_format>",
     methods=["GET"],
 )
-def get_discrete(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+def get_discrete(
+    tile_z: int, tile_y: int, tile_x: int, keys: str, image_format: str = "png"
+) -> Response:
     """Return multi-band PNG image of requested tile
     ---
     get:
@@ -106,15 +127,16 @@ def get_discrete(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
                     No dataset found for given key combination
     """
     tile_xyz = (tile_x, tile_y, tile_z)
-    return _get_discrete(keys, tile_xyz)
+    return _get_discrete(keys, tile_xyz, image_format=image_format)
 
 
 class DiscretePreviewSchema(Schema):
     keys = fields.String(required=True, description="Keys identifying dataset, in order")
+    image_format = fields.String(required=True, description="Image format (png, webp or jpg)")
 
 
-@TILE_API.route("/discrete/<path:keys>/preview.png", methods=["GET"])
-def get_discrete_preview(keys: str) -> Response:
+@TILE_API.route("/discrete/<path:keys>/preview.<image_format:image_format>", methods=["GET"])
+def get_discrete_preview(keys: str, image_format: str = "png") -> Response:
     """Return multi-band PNG preview image of requested dataset
     ---
     get:
@@ -136,17 +158,20 @@ def get_discrete_preview(keys: str) -> Response:
                 description:
                     No dataset found for given key combination
     """
-    return _get_discrete(keys)
+    return _get_discrete(keys, image_format=image_format)
 
 
-def _get_discrete(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Response:
+def _get_discrete(
+    keys: str, tile_xyz: Tuple[int, int, int] = None, image_format: str = "png"
+) -> Response:
     from terracotta.handlers.discrete import discrete
+    from terracotta.image import IMAGE_FORMATS
 
     parsed_keys = [key for key in keys.split("/") if key]
 
     option_schema = DiscreteOptionSchema()
     options = option_schema.load(request.args)
 
-    image = discrete(parsed_keys, tile_xyz=tile_xyz, **options)
+    image = discrete(parsed_keys, tile_xyz=tile_xyz, image_format=image_format, **options)
 
-    return send_file(image, mimetype="image/png")
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
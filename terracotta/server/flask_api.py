@@ -1,12 +1,10 @@
 from typing import Any, cast, Callable, Type, TYPE_CHECKING
 import copy
 
-from apispec import APISpec
-from apispec.ext.marshmallow import MarshmallowPlugin
-from apispec_webframeworks.flask import FlaskPlugin
-
-from flask import Flask, Blueprint, current_app, send_file, jsonify
+from flask import Flask, Blueprint, current_app, send_file, jsonify, request
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
+from werkzeug.routing import BaseConverter
 
 import marshmallow
 
@@ -17,14 +15,19 @@ TILE_API = Blueprint("tile_api", "terracotta.server")
 METADATA_API = Blueprint("metadata_api", "terracotta.server")
 SPEC_API = Blueprint("spec_api", "terracotta.server")
 
-# create an APISpec
-SPEC = APISpec(
-    title="Terracotta",
-    version=__version__,
-    openapi_version="2.0",
-    info=dict(description="A modern XYZ Tile Server in Python"),
-    plugins=[FlaskPlugin(), MarshmallowPlugin()],
-)
+if TYPE_CHECKING:  # pragma: no cover
+    from apispec import APISpec
+
+
+class ImageFormatConverter(BaseConverter):
+    """Matches the file extension of tile routes and returns the corresponding image format"""
+
+    regex = r"(?:png|webp|jpe?g)"
+
+    def to_python(self, value: str) -> str:
+        if value == "jpg":
+            return "jpeg"
+        return value
 
 
 def _abort(status_code: int, message: str = "") -> Any:
@@ -48,7 +51,27 @@ def _setup_error_handlers(app: Flask) -> None:
         from terracotta import get_settings, image
 
         settings = get_settings()
-        return send_file(image.empty_image(settings.DEFAULT_TILE_SIZE), mimetype="image/png")
+
+        if settings.EMPTY_TILE_RESPONSE == "no-content":
+            response = current_app.response_class(status=204)
+        elif request.endpoint == "tile_api.get_data":
+            from terracotta.handlers.data import empty_tile, DATA_MIMETYPE
+
+            response = send_file(
+                empty_tile(settings.DEFAULT_TILE_SIZE), mimetype=DATA_MIMETYPE
+            )
+        else:
+            image_format = (request.view_args or {}).get("image_format", "png")
+            response = send_file(
+                image.empty_image(settings.DEFAULT_TILE_SIZE, image_format),
+                mimetype=image.IMAGE_FORMATS[image_format],
+            )
+
+        if settings.EMPTY_TILE_MAX_AGE > 0:
+            response.cache_control.public = True
+            response.cache_control.max_age = settings.EMPTY_TILE_MAX_AGE
+
+        return response
 
     register_error_handler(exceptions.TileOutOfBoundsError, handle_tile_out_of_bounds_error)
 
@@ -72,6 +95,74 @@ def _setup_error_handlers(app: Flask) -> None:
         register_error_handler(err, handle_marshmallow_validation_error)
 
 
+def _create_spec() -> "APISpec":
+    # apispec is slow to import and only needed to serve the spec,
+    # so this is deferred until the spec is first requested
+    from apispec import APISpec
+    from apispec.ext.marshmallow import MarshmallowPlugin
+    from apispec_webframeworks.flask import FlaskPlugin
+
+    import terracotta.server.datasets
+    import terracotta.server.keys
+    import terracotta.server.colormap
+    import terracotta.server.metadata
+    import terracotta.server.histogram
+    import terracotta.server.statistics
+    import terracotta.server.rgb
+    import terracotta.server.singleband
+    import terracotta.server.compute
+    import terracotta.server.hillshade
+    import terracotta.server.discrete
+    import terracotta.server.mosaic
+    import terracotta.server.data
+    import terracotta.server.terrain
+
+    spec = APISpec(
+        title="Terracotta",
+        version=__version__,
+        openapi_version="2.0",
+        info=dict(description="A modern XYZ Tile Server in Python"),
+        plugins=[FlaskPlugin(), MarshmallowPlugin()],
+    )
+
+    # register routes on API spec
+    spec.path(view=terracotta.server.datasets.get_datasets)
+    spec.path(view=terracotta.server.keys.get_keys)
+    spec.path(view=terracotta.server.colormap.get_colormap)
+    spec.path(view=terracotta.server.metadata.get_metadata)
+    spec.path(view=terracotta.server.histogram.get_histogram)
+    spec.path(view=terracotta.server.statistics.get_statistics)
+    spec.path(view=terracotta.server.statistics.get_statistics_bounds)
+    spec.path(view=terracotta.server.rgb.get_rgb)
+    spec.path(view=terracotta.server.rgb.get_rgb_preview)
+    spec.path(view=terracotta.server.hillshade.get_hillshade)
+    spec.path(view=terracotta.server.hillshade.get_hillshade_preview)
+    spec.path(view=terracotta.server.compute.get_compute)
+    spec.path(view=terracotta.server.compute.get_compute_preview)
+    spec.path(view=terracotta.server.discrete.get_discrete)
+    spec.path(view=terracotta.server.discrete.get_discrete_preview)
+    spec.path(view=terracotta.server.mosaic.get_mosaic)
+    spec.path(view=terracotta.server.data.get_data)
+    spec.path(view=terracotta.server.terrain.get_terrain)
+
+    return spec
+
+
+def get_spec() -> "APISpec":
+    """Returns the API spec of the current app, generating it on first use"""
+    spec = current_app.extensions.get("terracotta_spec")
+
+    if spec is None:
+        # must be called within an app context, so routes can be resolved from the URL map
+        spec = current_app.extensions["terracotta_spec"] = _create_spec()
+
+    return spec
+
+
+#: API spec of the current app (for backwards compatibility, prefer get_spec)
+SPEC = cast("APISpec", LocalProxy(get_spec))
+
+
 def create_app(debug: bool = False, profile: bool = False) -> Flask:
     """Returns a Flask app"""
     from terracotta import get_settings
@@ -79,14 +170,20 @@ def create_app(debug: bool = False, profile: bool = False) -> Flask:
     import terracotta.server.keys
     import terracotta.server.colormap
     import terracotta.server.metadata
+    import terracotta.server.histogram
+    import terracotta.server.statistics
     import terracotta.server.rgb
     import terracotta.server.singleband
     import terracotta.server.compute
     import terracotta.server.hillshade
     import terracotta.server.discrete
+    import terracotta.server.mosaic
+    import terracotta.server.data
+    import terracotta.server.terrain
 
     new_app = Flask("terracotta.server")
     new_app.debug = debug
+    new_app.url_map.converters["image_format"] = ImageFormatConverter
 
     # extensions might modify the global blueprints, so copy before use
     new_tile_api = copy.deepcopy(TILE_API)
@@ -103,22 +200,7 @@ def create_app(debug: bool = False, profile: bool = False) -> Flask:
     new_app.register_blueprint(new_tile_api, url_prefix="")
     new_app.register_blueprint(new_metadata_api, url_prefix="")
 
-    # register routes on API spec
-    with new_app.test_request_context():
-        SPEC.path(view=terracotta.server.datasets.get_datasets)
-        SPEC.path(view=terracotta.server.keys.get_keys)
-        SPEC.path(view=terracotta.server.colormap.get_colormap)
-        SPEC.path(view=terracotta.server.metadata.get_metadata)
-        SPEC.path(view=terracotta.server.rgb.get_rgb)
-        SPEC.path(view=terracotta.server.rgb.get_rgb_preview)
-        SPEC.path(view=terracotta.server.hillshade.get_hillshade)
-        SPEC.path(view=terracotta.server.hillshade.get_hillshade_preview)
-        SPEC.path(view=terracotta.server.compute.get_compute)
-        SPEC.path(view=terracotta.server.compute.get_compute_preview)
-        SPEC.path(view=terracotta.server.discrete.get_discrete)
-        SPEC.path(view=terracotta.server.discrete.get_discrete_preview)
-
-    import terracotta.server.spec
+    import terracotta.server.spec  # noqa: F401
 
     new_app.register_blueprint(SPEC_API, url_prefix="")
 
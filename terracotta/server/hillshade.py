@@ -17,11 +17,8 @@ from marshmallow import (
 )
 from flask import request, send_file, Response
 
-from matplotlib.pyplot import colormaps
-
 from terracotta.server.flask_api import TILE_API
-
-# from terracotta.cmaps import AVAILABLE_CMAPS
+from terracotta.cmaps import AVAILABLE_CMAPS
 
 
 class HillshadeQuerySchema(Schema):
@@ -29,17 +26,17 @@ class HillshadeQuerySchema(Schema):
     tile_z = fields.Int(required=True, description="Requested zoom level")
     tile_y = fields.Int(required=True, description="y coordinate")
     tile_x = fields.Int(required=True, description="x coordinate")
+    image_format = fields.String(required=True, description="Image format (png, webp or jpg)")
 
 
 class HillshadeOptionSchema(Schema):
     class Meta:
         unknown = EXCLUDE
 
-    # only matplotlib colormaps are allowed
     colormap = fields.String(
         description="Colormap to apply to image (see /colormap)",
-        validate=validate.OneOf(colormaps()),
-        missing="Greys_r",
+        validate=validate.OneOf(AVAILABLE_CMAPS),
+        missing="greys_r",
     )
 
     azimuth_degree = fields.Number(
@@ -73,7 +70,11 @@ class HillshadeOptionSchema(Schema):
     @pre_load
     def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
         data = dict(data.items())
-        for var in ("colormap", "azimuth_degree", "altitude_degree", "vertical_exaggeration", "blend_mode"):
+
+        if data.get("colormap"):
+            data["colormap"] = data["colormap"].lower()
+
+        for var in ("azimuth_degree", "altitude_degree", "vertical_exaggeration"):
             val = data.get(var)
             if val:
                 try:
@@ -86,10 +87,12 @@ class HillshadeOptionSchema(Schema):
 
 
 @TILE_API.route(
-    "/hillshade/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png",
+    "/hillshade/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.<image_format:image_format>",
     methods=["GET"],
 )
-def get_hillshade(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+def get_hillshade(
+    tile_z: int, tile_y: int, tile_x: int, keys: str, image_format: str = "png"
+) -> Response:
     """Return multi-band PNG image of requested tile
     ---
     get:
@@ -112,15 +115,16 @@ def get_hillshade(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
                     No dataset found for given key combination
     """
     tile_xyz = (tile_x, tile_y, tile_z)
-    return _get_hillshade(keys, tile_xyz)
+    return _get_hillshade(keys, tile_xyz, image_format=image_format)
 
 
 class HillshadePreviewSchema(Schema):
     keys = fields.String(required=True, description="Keys identifying dataset, in order")
+    image_format = fields.String(required=True, description="Image format (png, webp or jpg)")
 
 
-@TILE_API.route("/hillshade/<path:keys>/preview.png", methods=["GET"])
-def get_hillshade_preview(keys: str) -> Response:
+@TILE_API.route("/hillshade/<path:keys>/preview.<image_format:image_format>", methods=["GET"])
+def get_hillshade_preview(keys: str, image_format: str = "png") -> Response:
     """Return multi-band PNG preview image of requested dataset
     ---
     get:
@@ -142,17 +146,20 @@ def get_hillshade_preview(keys: str) -> Response:
                 description:
                     No dataset found for given key combination
     """
-    return _get_hillshade(keys)
+    return _get_hillshade(keys, image_format=image_format)
 
 
-def _get_hillshade(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Response:
+def _get_hillshade(
+    keys: str, tile_xyz: Tuple[int, int, int] = None, image_format: str = "png"
+) -> Response:
     from terracotta.handlers.hillshade import hillshade
+    from terracotta.image import IMAGE_FORMATS
 
     parsed_keys = [key for key in keys.split("/") if key]
 
     option_schema = HillshadeOptionSchema()
     options = option_schema.load(request.args)
 
-    image = hillshade(parsed_keys, tile_xyz=tile_xyz, **options)
+    image = hillshade(parsed_keys, tile_xyz=tile_xyz, image_format=image_format, **options)
 
-    return send_file(image, mimetype="image/png")
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
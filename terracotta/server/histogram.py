@@ -0,0 +1,54 @@
+"""server/histogram.py
+
+Flask route to handle /histogram calls.
+"""
+
+from marshmallow import Schema, fields, validate
+from flask import jsonify, Response
+
+from terracotta.server.flask_api import METADATA_API
+
+
+class HistogramSchema(Schema):
+    class Meta:
+        ordered = True
+
+    keys = fields.Dict(keys=fields.String(), values=fields.String(),
+                       description='Keys identifying dataset', required=True)
+    range = fields.List(fields.Number(), validate=validate.Length(equal=2), required=True,
+                        description='Minimum and maximum data value')
+    bin_edges = fields.List(fields.Number(), required=True,
+                            description='Edges of all histogram bins (one more than counts)')
+    counts = fields.List(fields.Integer(), required=True,
+                         description='Number of valid pixels in each histogram bin')
+
+
+@METADATA_API.route('/histogram/<path:keys>', methods=['GET'])
+def get_histogram(keys: str) -> Response:
+    """Get pre-computed histogram for given dataset
+    ---
+    get:
+        summary: /histogram
+        description:
+            Retrieve histogram of valid pixel values for given dataset (identified by keys).
+            The histogram is computed during ingestion, so no raster data is read.
+        parameters:
+          - name: keys
+            in: path
+            description: Keys of dataset to retrieve histogram for (e.g. 'value1/value2')
+            type: path
+            required: true
+        responses:
+            200:
+                description: Histogram of given dataset
+                schema: HistogramSchema
+            400:
+                description: Dataset does not have a stored histogram
+            404:
+                description: No dataset found for given key combination
+    """
+    from terracotta.handlers.histogram import histogram
+    parsed_keys = [key for key in keys.split('/') if key]
+    payload = histogram(parsed_keys)
+    schema = HistogramSchema()
+    return jsonify(schema.load(payload))
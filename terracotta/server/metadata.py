@@ -3,7 +3,7 @@
 Flask route to handle /metadata calls.
 """
 
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, fields, validate, EXCLUDE
 from flask import jsonify, Response
 
 from terracotta.server.flask_api import METADATA_API
@@ -12,6 +12,8 @@ from terracotta.server.flask_api import METADATA_API
 class MetadataSchema(Schema):
     class Meta:
         ordered = True
+        # histograms are served through /histogram
+        unknown = EXCLUDE
 
     keys = fields.Dict(keys=fields.String(), values=fields.String(),
                        description='Keys identifying dataset', required=True)
@@ -0,0 +1,105 @@
+"""server/mosaic.py
+
+Flask route to handle /mosaic calls.
+"""
+
+from typing import Any, Mapping, Dict
+import json
+
+from marshmallow import Schema, fields, validate, pre_load, ValidationError, EXCLUDE
+from flask import request, send_file, Response
+
+from terracotta.server.flask_api import TILE_API
+from terracotta.cmaps import AVAILABLE_CMAPS
+
+
+class MosaicQuerySchema(Schema):
+    keys = fields.String(required=True,
+                         description='Leading keys identifying the datasets to mosaic, in order')
+    tile_z = fields.Int(required=True, description='Requested zoom level')
+    tile_y = fields.Int(required=True, description='y coordinate')
+    tile_x = fields.Int(required=True, description='x coordinate')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
+
+
+class MosaicOptionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    method = fields.String(
+        description='How to combine overlapping datasets: use the first or last valid value '
+                    '(in key order), or the mean of all valid values',
+        validate=validate.OneOf(('first', 'last', 'mean')), missing='first'
+    )
+
+    stretch_range = fields.List(
+        fields.Number(allow_none=True), validate=validate.Length(equal=2), example='[0,1]',
+        description='Stretch range to use as JSON array, uses full range of all contributing '
+                    'datasets by default. Null values indicate global minimum / maximum.',
+        missing=None
+    )
+
+    colormap = fields.String(
+        description='Colormap to apply to image (see /colormap)',
+        validate=validate.OneOf(AVAILABLE_CMAPS), missing=None
+    )
+
+    tile_size = fields.List(
+        fields.Integer(), validate=validate.Length(equal=2), example='[256,256]',
+        description='Pixel dimensions of the returned PNG image as JSON list.'
+    )
+
+    @pre_load
+    def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        data = dict(data.items())
+        for var in ('stretch_range', 'tile_size'):
+            val = data.get(var)
+            if val:
+                try:
+                    data[var] = json.loads(val)
+                except json.decoder.JSONDecodeError as exc:
+                    msg = f'Could not decode value {val} for {var} as JSON'
+                    raise ValidationError(msg) from exc
+
+        return data
+
+
+@TILE_API.route('/mosaic/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>'
+                '.<image_format:image_format>', methods=['GET'])
+def get_mosaic(tile_z: int, tile_y: int, tile_x: int, keys: str,
+               image_format: str = 'png') -> Response:
+    """Combine all datasets matching the given keys into a single-band PNG image
+    ---
+    get:
+        summary: /mosaic (tile)
+        description:
+            Combine all datasets whose leading keys match the given keys and that intersect
+            the requested XYZ tile into a single-band PNG image.
+        parameters:
+            - in: path
+              schema: MosaicQuerySchema
+            - in: query
+              schema: MosaicOptionSchema
+        responses:
+            200:
+                description:
+                    PNG image of requested tile
+            400:
+                description:
+                    Invalid query parameters, or too many datasets intersect the tile
+            404:
+                description:
+                    No dataset found for given key combination
+    """
+    from terracotta.handlers.mosaic import mosaic
+    from terracotta.image import IMAGE_FORMATS
+
+    tile_xyz = (tile_x, tile_y, tile_z)
+    parsed_keys = [key for key in keys.split('/') if key]
+
+    option_schema = MosaicOptionSchema()
+    options = option_schema.load(request.args)
+
+    image = mosaic(parsed_keys, tile_xyz, image_format=image_format, **options)
+
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
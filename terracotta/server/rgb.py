@@ -17,6 +17,7 @@ class RGBQuerySchema(Schema):
     tile_z = fields.Int(required=True, description='Requested zoom level')
     tile_y = fields.Int(required=True, description='y coordinate')
     tile_x = fields.Int(required=True, description='x coordinate')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
 class RGBOptionSchema(Schema):
@@ -56,9 +57,12 @@ class RGBOptionSchema(Schema):
         return data
 
 
-@TILE_API.route('/rgb/<int:tile_z>/<int:tile_x>/<int:tile_y>.png', methods=['GET'])
-@TILE_API.route('/rgb/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png', methods=['GET'])
-def get_rgb(tile_z: int, tile_y: int, tile_x: int, keys: str = '') -> Response:
+@TILE_API.route('/rgb/<int:tile_z>/<int:tile_x>/<int:tile_y>.<image_format:image_format>',
+                methods=['GET'])
+@TILE_API.route('/rgb/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>'
+                '.<image_format:image_format>', methods=['GET'])
+def get_rgb(tile_z: int, tile_y: int, tile_x: int, keys: str = '',
+            image_format: str = 'png') -> Response:
     """Return the requested RGB tile as a PNG image.
     ---
     get:
@@ -81,16 +85,17 @@ def get_rgb(tile_z: int, tile_y: int, tile_x: int, keys: str = '') -> Response:
                     No dataset found for given key combination
     """
     tile_xyz = (tile_x, tile_y, tile_z)
-    return _get_rgb_image(keys, tile_xyz=tile_xyz)
+    return _get_rgb_image(keys, tile_xyz=tile_xyz, image_format=image_format)
 
 
 class RGBPreviewQuerySchema(Schema):
     keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
-@TILE_API.route('/rgb/preview.png', methods=['GET'])
-@TILE_API.route('/rgb/<path:keys>/preview.png', methods=['GET'])
-def get_rgb_preview(keys: str = '') -> Response:
+@TILE_API.route('/rgb/preview.<image_format:image_format>', methods=['GET'])
+@TILE_API.route('/rgb/<path:keys>/preview.<image_format:image_format>', methods=['GET'])
+def get_rgb_preview(keys: str = '', image_format: str = 'png') -> Response:
     """Return the requested RGB dataset preview as a PNG image.
     ---
     get:
@@ -112,11 +117,13 @@ def get_rgb_preview(keys: str = '') -> Response:
                 description:
                     No dataset found for given key combination
     """
-    return _get_rgb_image(keys)
+    return _get_rgb_image(keys, image_format=image_format)
 
 
-def _get_rgb_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Response:
+def _get_rgb_image(keys: str, tile_xyz: Tuple[int, int, int] = None,
+                   image_format: str = 'png') -> Response:
     from terracotta.handlers.rgb import rgb
+    from terracotta.image import IMAGE_FORMATS
 
     option_schema = RGBOptionSchema()
     options = option_schema.load(request.args)
@@ -127,7 +134,8 @@ def _get_rgb_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Response
     stretch_ranges = tuple(options.pop(k) for k in ('r_range', 'g_range', 'b_range'))
 
     image = rgb(
-        some_keys, rgb_values, stretch_ranges=stretch_ranges, tile_xyz=tile_xyz, **options
+        some_keys, rgb_values, stretch_ranges=stretch_ranges, tile_xyz=tile_xyz,
+        image_format=image_format, **options
     )
 
-    return send_file(image, mimetype='image/png')
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
@@ -19,6 +19,7 @@ class SinglebandQuerySchema(Schema):
     tile_z = fields.Int(required=True, description='Requested zoom level')
     tile_y = fields.Int(required=True, description='y coordinate')
     tile_x = fields.Int(required=True, description='x coordinate')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
 class SinglebandOptionSchema(Schema):
@@ -92,9 +93,10 @@ class SinglebandOptionSchema(Schema):
         return data
 
 
-@TILE_API.route('/singleband/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png',
-                methods=['GET'])
-def get_singleband(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+@TILE_API.route('/singleband/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>'
+                '.<image_format:image_format>', methods=['GET'])
+def get_singleband(tile_z: int, tile_y: int, tile_x: int, keys: str,
+                   image_format: str = 'png') -> Response:
     """Return single-band PNG image of requested tile
     ---
     get:
@@ -117,15 +119,16 @@ def get_singleband(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response
                     No dataset found for given key combination
     """
     tile_xyz = (tile_x, tile_y, tile_z)
-    return _get_singleband_image(keys, tile_xyz)
+    return _get_singleband_image(keys, tile_xyz, image_format=image_format)
 
 
 class SinglebandPreviewSchema(Schema):
     keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    image_format = fields.String(required=True, description='Image format (png, webp or jpg)')
 
 
-@TILE_API.route('/singleband/<path:keys>/preview.png', methods=['GET'])
-def get_singleband_preview(keys: str) -> Response:
+@TILE_API.route('/singleband/<path:keys>/preview.<image_format:image_format>', methods=['GET'])
+def get_singleband_preview(keys: str, image_format: str = 'png') -> Response:
     """Return single-band PNG preview image of requested dataset
     ---
     get:
@@ -147,11 +150,13 @@ def get_singleband_preview(keys: str) -> Response:
                 description:
                     No dataset found for given key combination
     """
-    return _get_singleband_image(keys)
+    return _get_singleband_image(keys, image_format=image_format)
 
 
-def _get_singleband_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> Response:
+def _get_singleband_image(keys: str, tile_xyz: Tuple[int, int, int] = None,
+                          image_format: str = 'png') -> Response:
     from terracotta.handlers.singleband import singleband
+    from terracotta.image import IMAGE_FORMATS
 
     parsed_keys = [key for key in keys.split('/') if key]
 
@@ -161,6 +166,6 @@ def _get_singleband_image(keys: str, tile_xyz: Tuple[int, int, int] = None) -> R
     if options.get('colormap', '') == 'explicit':
         options['colormap'] = options.pop('explicit_color_map')
 
-    image = singleband(parsed_keys, tile_xyz=tile_xyz, **options)
+    image = singleband(parsed_keys, tile_xyz=tile_xyz, image_format=image_format, **options)
 
-    return send_file(image, mimetype='image/png')
+    return send_file(image, mimetype=IMAGE_FORMATS[image_format])
@@ -5,12 +5,12 @@ Flask routes to serve API spec
 
 from flask import jsonify, render_template, Response
 
-from terracotta.server.flask_api import SPEC_API, SPEC
+from terracotta.server.flask_api import SPEC_API, get_spec
 
 
 @SPEC_API.route('/swagger.json', methods=['GET'])
 def specification() -> Response:
-    return jsonify(SPEC.to_dict())
+    return jsonify(get_spec().to_dict())
 
 
 @SPEC_API.route('/apidoc', methods=['GET'])
@@ -0,0 +1,146 @@
+"""server/statistics.py
+
+Flask route to handle /statistics calls.
+"""
+
+from typing import Any, Mapping, Dict, Tuple
+import json
+
+from marshmallow import Schema, fields, validate, pre_load, ValidationError, EXCLUDE
+from flask import request, jsonify, Response
+
+from terracotta.server.flask_api import METADATA_API
+
+
+class StatisticsQuerySchema(Schema):
+    keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    tile_z = fields.Int(required=True, description='Requested zoom level')
+    tile_y = fields.Int(required=True, description='y coordinate')
+    tile_x = fields.Int(required=True, description='x coordinate')
+
+
+class StatisticsOptionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    tile_size = fields.List(
+        fields.Integer(validate=validate.Range(min=1)), validate=validate.Length(equal=2),
+        example='[128,128]',
+        description='Resolution at which statistics are computed as JSON list. '
+                    'Smaller is faster but less accurate.'
+    )
+
+    @pre_load
+    def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        data = dict(data.items())
+        for var in ('tile_size', 'bbox'):
+            val = data.get(var)
+            if val:
+                try:
+                    data[var] = json.loads(val)
+                except json.decoder.JSONDecodeError as exc:
+                    msg = f'Could not decode value {val} for {var} as JSON'
+                    raise ValidationError(msg) from exc
+
+        return data
+
+
+class StatisticsBoundsOptionSchema(StatisticsOptionSchema):
+    bbox = fields.List(
+        fields.Number(), validate=validate.Length(equal=4), example='[10.5,55.2,11.0,55.7]',
+        description='Bounding box as JSON list in the form [west, south, east, north] '
+                    '(in WGS84). Uses the whole dataset if not given.', missing=None
+    )
+
+
+class StatisticsSchema(Schema):
+    class Meta:
+        ordered = True
+
+    keys = fields.Dict(keys=fields.String(), values=fields.String(),
+                       description='Keys identifying dataset', required=True)
+    valid_percentage = fields.Number(description='Percentage of valid data in the requested area',
+                                     required=True)
+    range = fields.List(fields.Number(), validate=validate.Length(equal=2), allow_none=True,
+                        required=True, description='Minimum and maximum data value')
+    mean = fields.Number(description='Data mean', allow_none=True, required=True)
+    stdev = fields.Number(description='Data standard deviation', allow_none=True, required=True)
+    percentiles = fields.List(fields.Number(), validate=validate.Length(equal=99),
+                              allow_none=True, required=True,
+                              description='1st, 2nd, 3rd, ..., 99th data percentile')
+
+
+@METADATA_API.route('/statistics/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>',
+                    methods=['GET'])
+def get_statistics(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+    """Get statistics of a dataset within an XYZ tile
+    ---
+    get:
+        summary: /statistics (tile)
+        description:
+            Compute data range, mean, standard deviation, and percentiles of a dataset within
+            the requested XYZ tile, e.g. to determine a stretch range for the current viewport.
+            All values are null if the tile does not contain any valid data.
+        parameters:
+            - in: path
+              schema: StatisticsQuerySchema
+            - in: query
+              schema: StatisticsOptionSchema
+        responses:
+            200:
+                description: Statistics of the given dataset within the tile
+                schema: StatisticsSchema
+            400:
+                description: Invalid query parameters
+            404:
+                description: No dataset found for given key combination
+    """
+    tile_xyz = (tile_x, tile_y, tile_z)
+    option_schema = StatisticsOptionSchema()
+    options = option_schema.load(request.args)
+    return _get_statistics(keys, tile_xyz=tile_xyz, **options)
+
+
+class StatisticsBoundsQuerySchema(Schema):
+    keys = fields.String(required=True, description='Keys identifying dataset, in order')
+
+
+@METADATA_API.route('/statistics/<path:keys>', methods=['GET'])
+def get_statistics_bounds(keys: str) -> Response:
+    """Get statistics of a dataset within a bounding box
+    ---
+    get:
+        summary: /statistics (bounding box)
+        description:
+            Compute data range, mean, standard deviation, and percentiles of a dataset within
+            the given bounding box. All values are null if the bounding box does not contain any
+            valid data.
+        parameters:
+            - in: path
+              schema: StatisticsBoundsQuerySchema
+            - in: query
+              schema: StatisticsBoundsOptionSchema
+        responses:
+            200:
+                description: Statistics of the given dataset within the bounding box
+                schema: StatisticsSchema
+            400:
+                description: Invalid query parameters
+            404:
+                description: No dataset found for given key combination
+    """
+    option_schema = StatisticsBoundsOptionSchema()
+    options = option_schema.load(request.args)
+    bounds = options.pop('bbox')
+    return _get_statistics(keys, bounds=bounds, **options)
+
+
+def _get_statistics(keys: str, tile_xyz: Tuple[int, int, int] = None,
+                    **options: Any) -> Response:
+    from terracotta.handlers.statistics import statistics
+
+    parsed_keys = [key for key in keys.split('/') if key]
+    payload = statistics(parsed_keys, tile_xyz=tile_xyz, **options)
+
+    schema = StatisticsSchema()
+    return jsonify(schema.load(payload))
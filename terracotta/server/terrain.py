@@ -0,0 +1,88 @@
+"""server/terrain.py
+
+Flask route to handle /terrain calls.
+"""
+
+from typing import Any, Mapping, Dict
+import json
+
+from marshmallow import Schema, fields, validate, pre_load, ValidationError, EXCLUDE
+from flask import request, send_file, Response
+
+from terracotta.server.flask_api import TILE_API
+
+
+class TerrainQuerySchema(Schema):
+    keys = fields.String(required=True, description='Keys identifying dataset, in order')
+    tile_z = fields.Int(required=True, description='Requested zoom level')
+    tile_y = fields.Int(required=True, description='y coordinate')
+    tile_x = fields.Int(required=True, description='x coordinate')
+
+
+class TerrainOptionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    encoding = fields.String(
+        description='Elevation encoding (mapbox for Terrain-RGB, or terrarium)',
+        validate=validate.OneOf(('mapbox', 'terrarium')), missing='mapbox'
+    )
+
+    tile_size = fields.List(
+        fields.Integer(), validate=validate.Length(equal=2), example='[256,256]',
+        description='Pixel dimensions of the returned PNG image as JSON list.'
+    )
+
+    @pre_load
+    def decode_json(self, data: Mapping[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        data = dict(data.items())
+        for var in ('tile_size',):
+            val = data.get(var)
+            if val:
+                try:
+                    data[var] = json.loads(val)
+                except json.decoder.JSONDecodeError as exc:
+                    msg = f'Could not decode value {val} for {var} as JSON'
+                    raise ValidationError(msg) from exc
+
+        return data
+
+
+@TILE_API.route('/terrain/<path:keys>/<int:tile_z>/<int:tile_x>/<int:tile_y>.png',
+                methods=['GET'])
+def get_terrain(tile_z: int, tile_y: int, tile_x: int, keys: str) -> Response:
+    """Return elevation-encoded PNG image of requested tile
+    ---
+    get:
+        summary: /terrain
+        description:
+            Return elevation of requested XYZ tile encoded as Mapbox Terrain-RGB or
+            Terrarium PNG image, for use as terrain source in 3D map clients.
+            Images have an alpha channel, in which nodata pixels are transparent.
+        parameters:
+            - in: path
+              schema: TerrainQuerySchema
+            - in: query
+              schema: TerrainOptionSchema
+        responses:
+            200:
+                description:
+                    PNG image of requested tile
+            400:
+                description:
+                    Invalid query parameters
+            404:
+                description:
+                    No dataset found for given key combination
+    """
+    from terracotta.handlers.terrain import terrain
+
+    parsed_keys = [key for key in keys.split('/') if key]
+
+    option_schema = TerrainOptionSchema()
+    options = option_schema.load(request.args)
+
+    tile_xyz = (tile_x, tile_y, tile_z)
+    image = terrain(parsed_keys, tile_xyz, **options)
+
+    return send_file(image, mimetype='image/png')
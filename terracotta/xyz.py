@@ -3,13 +3,16 @@
 Utilities to work with XYZ Mercator tiles.
 """
 
-from typing import Sequence, Union, Mapping, Tuple, Any
+from typing import Sequence, Union, Mapping, Tuple, Any, Optional
 
 import mercantile
 
 from terracotta import exceptions
 from terracotta.drivers.base import Driver
 
+#: Highest latitude covered by Web Mercator tiles
+MAX_LATITUDE = 85.0511287798066
+
 
 # TODO: add accurate signature if mypy ever supports conditional return types
 def get_tile_data(driver: Driver,
@@ -17,23 +20,27 @@ def get_tile_data(driver: Driver,
                   tile_xyz: Tuple[int, int, int] = None,
                   *, tile_size: Tuple[int, int] = (256, 256),
                   preserve_values: bool = False,
-                  asynchronous: bool = False) -> Any:
-    """Retrieve raster image from driver for given XYZ tile and keys"""
+                  asynchronous: bool = False,
+                  padding: int = 0) -> Any:
+    """Retrieve raster image from driver for given XYZ tile and keys
+
+    If padding is given, that many additional pixels are read on every side of the tile
+    (for example to compute derivatives at tile edges).
+    """
 
     if tile_xyz is None:
+        if padding:
+            raise ValueError('padding is only supported when reading XYZ tiles')
+
         # read whole dataset
         return driver.get_raster_tile(
             keys, tile_size=tile_size, preserve_values=preserve_values,
             asynchronous=asynchronous
         )
 
-    # determine bounds for given tile
-    metadata = driver.get_metadata(keys)
-    wgs_bounds = metadata['bounds']
-
     tile_x, tile_y, tile_z = tile_xyz
 
-    if not tile_exists(wgs_bounds, tile_x, tile_y, tile_z):
+    if not dataset_intersects(driver, keys, get_tile_bounds(*tile_xyz)):
         raise exceptions.TileOutOfBoundsError(
             f'Tile {tile_z}/{tile_x}/{tile_y} is outside image bounds'
         )
@@ -41,12 +48,141 @@ def get_tile_data(driver: Driver,
     mercator_tile = mercantile.Tile(x=tile_x, y=tile_y, z=tile_z)
     target_bounds = mercantile.xy_bounds(mercator_tile)
 
+    if padding:
+        target_bounds, tile_size = pad_bounds(target_bounds, tile_size, padding)
+
+    return driver.get_raster_tile(
+        keys, tile_bounds=target_bounds, tile_size=tile_size,
+        preserve_values=preserve_values, asynchronous=asynchronous
+    )
+
+
+def pad_bounds(bounds: Sequence[float], tile_size: Tuple[int, int],
+               padding: int) -> Tuple[Tuple[float, float, float, float], Tuple[int, int]]:
+    """Grow (left, bottom, right, top) bounds of a tile with given size by some pixels.
+
+    Returns new bounds and tile size, at the same resolution as the input.
+    """
+    left, bottom, right, top = bounds
+    num_rows, num_cols = tile_size
+
+    pad_x = padding * (right - left) / num_cols
+    pad_y = padding * (top - bottom) / num_rows
+
+    return (
+        (left - pad_x, bottom - pad_y, right + pad_x, top + pad_y),
+        (num_rows + 2 * padding, num_cols + 2 * padding)
+    )
+
+
+def get_bounds_data(driver: Driver,
+                    keys: Union[Sequence[str], Mapping[str, str]],
+                    wgs_bounds: Sequence[float],
+                    *, tile_size: Tuple[int, int] = (256, 256),
+                    preserve_values: bool = False,
+                    asynchronous: bool = False) -> Any:
+    """Retrieve raster image from driver for given latitude-longitude bounding box and keys"""
+    west, south, east, north = wgs_bounds
+
+    if not west < east or not south < north:
+        raise exceptions.InvalidArgumentsError(
+            'Bounding box must be given as (west, south, east, north)'
+        )
+
+    dataset_bounds = driver.get_metadata(keys)['bounds']
+    target_bounds = mercator_bounds(wgs_bounds)
+
+    # bounding boxes beyond the latitude limits collapse to a line in Web Mercator
+    if not bounds_intersect(dataset_bounds, wgs_bounds) or target_bounds[1] == target_bounds[3]:
+        raise exceptions.TileOutOfBoundsError(
+            f'Bounding box {tuple(wgs_bounds)} is outside image bounds'
+        )
+
     return driver.get_raster_tile(
         keys, tile_bounds=target_bounds, tile_size=tile_size,
         preserve_values=preserve_values, asynchronous=asynchronous
     )
 
 
+def get_tile_bounds(tile_x: int, tile_y: int, tile_z: int) -> Tuple[float, ...]:
+    """Latitude-longitude bounds of an XYZ tile, as (west, south, east, north)."""
+    num_tiles = 2 ** tile_z
+
+    if not (0 <= tile_x < num_tiles and 0 <= tile_y < num_tiles):
+        raise exceptions.TileOutOfBoundsError(f'Tile {tile_z}/{tile_x}/{tile_y} does not exist')
+
+    return tuple(mercantile.bounds(tile_x, tile_y, tile_z))
+
+
+def mercator_bounds(wgs_bounds: Sequence[float]) -> Tuple[float, ...]:
+    """Project (west, south, east, north) bounds to Web Mercator.
+
+    Latitudes are clamped to the range covered by Web Mercator.
+    """
+    west, south, east, north = wgs_bounds
+    south, north = (max(-MAX_LATITUDE, min(lat, MAX_LATITUDE)) for lat in (south, north))
+    return (*mercantile.xy(west, south), *mercantile.xy(east, north))
+
+
+def intersect_bounds(bounds: Sequence[float],
+                     other_bounds: Sequence[float]) -> Optional[Tuple[float, ...]]:
+    """Intersection of two (west, south, east, north) bounding boxes.
+
+    Returns None if the bounding boxes do not overlap (touching is not enough).
+    """
+    west, south = max(bounds[0], other_bounds[0]), max(bounds[1], other_bounds[1])
+    east, north = min(bounds[2], other_bounds[2]), min(bounds[3], other_bounds[3])
+
+    if not west < east or not south < north:
+        return None
+
+    return (west, south, east, north)
+
+
+def clip_to_dataset(driver: Driver,
+                    keys: Union[Sequence[str], Mapping[str, str]],
+                    wgs_bounds: Sequence[float]) -> Tuple[float, ...]:
+    """Intersection of a (west, south, east, north) bounding box with the dataset bounds."""
+    clipped_bounds = intersect_bounds(wgs_bounds, driver.get_metadata(keys)['bounds'])
+
+    if clipped_bounds is None:
+        raise exceptions.TileOutOfBoundsError(
+            f'Bounding box {tuple(wgs_bounds)} is outside image bounds'
+        )
+
+    return clipped_bounds
+
+
+def bounds_intersect(bounds: Sequence[float], other_bounds: Sequence[float]) -> bool:
+    """Check if two (west, south, east, north) bounding boxes intersect."""
+    return (
+        bounds[0] <= other_bounds[2] and other_bounds[0] <= bounds[2]
+        and bounds[1] <= other_bounds[3] and other_bounds[1] <= bounds[3]
+    )
+
+
+def dataset_intersects(driver: Driver,
+                       keys: Union[Sequence[str], Mapping[str, str]],
+                       wgs_bounds: Sequence[float]) -> bool:
+    """Check if a dataset intersects the given (west, south, east, north) bounding box.
+
+    Uses the spatial index of the driver, metadata is only fetched for datasets outside
+    the bounding box or without metadata.
+    """
+    key_names = driver.key_names
+
+    if isinstance(keys, Mapping):
+        key_dict = dict(keys)
+    else:
+        key_dict = dict(zip(key_names, keys))
+
+    if len(key_dict) == len(key_names) and driver.get_datasets(key_dict, where_bbox=wgs_bounds):
+        return True
+
+    # datasets without metadata are not indexed yet
+    return bounds_intersect(driver.get_metadata(keys)['bounds'], wgs_bounds)
+
+
 def tile_exists(bounds: Sequence[float], tile_x: int, tile_y: int, tile_z: int) -> bool:
     """Check if an XYZ tile is inside the given physical bounds."""
     mintile = mercantile.tile(bounds[0], bounds[3], tile_z)
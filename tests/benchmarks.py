@@ -13,6 +13,14 @@ ZOOM_XYZ = {
     'preview': None
 }
 
+# maximum time in seconds to import the server and create an app (cold start)
+COLD_START_BUDGET = 1.0
+
+# modules that must not be imported before the first request
+COLD_START_DEFERRED_MODULES = (
+    'apispec', 'matplotlib', 'numpy', 'pkg_resources', 'rasterio', 'skimage'
+)
+
 
 @pytest.fixture(scope='session')
 def benchmark_database(big_raster_file_nodata, big_raster_file_mask, tmpdir_factory):
@@ -132,6 +140,95 @@ def test_bench_singleband_out_of_bounds(benchmark, benchmark_database):
     assert rv.status_code == 200
 
 
+@pytest.mark.parametrize('tile_type', ['singleband', 'paletted', 'rgb'])
+@pytest.mark.parametrize('compress_level', [0, 1, 6])
+@pytest.mark.parametrize('encoder', ['pil', 'spng', 'fast'])
+def test_bench_png_encode(benchmark, encoder, compress_level, tile_type):
+    import numpy as np
+    from terracotta import update_settings, image
+
+    if encoder == 'spng' and not image.has_spng:
+        pytest.skip('pyspng encoder not available')
+
+    update_settings(PNG_ENCODER=encoder, PNG_COMPRESS_LEVEL=compress_level)
+
+    # smooth gradient plus noise, to mimic real imagery
+    np.random.seed(0)
+    gradient = np.linspace(0, 200, 256)
+    base = gradient[:, np.newaxis] + gradient[np.newaxis, :] / 4
+    noise = np.random.randint(0, 10, size=(256, 256))
+    tile = (base + noise).clip(1, 255).astype('uint8')
+
+    if tile_type == 'rgb':
+        tile = np.stack([tile, tile[::-1], tile[:, ::-1]], axis=-1)
+
+    colormap = 'viridis' if tile_type == 'paletted' else None
+
+    out = benchmark(image.array_to_png, tile, colormap=colormap)
+    benchmark.extra_info['size'] = len(out.getvalue())
+
+
+@pytest.mark.parametrize('dtype', ['uint8', 'int32', 'float32'])
+def test_bench_label(benchmark, dtype):
+    import numpy as np
+    from terracotta import image
+
+    # land cover tile with 200 classes
+    np.random.seed(0)
+    num_classes = 200
+    tile = np.random.randint(0, num_classes, size=(256, 256)).astype(dtype)
+    labels = list(range(num_classes))
+
+    out = benchmark(image.label, tile, labels)
+    assert out.max() == num_classes
+
+
+@pytest.mark.parametrize('expression', [
+    '(v1 - v2) / (v1 + v2)',
+    'where(v1 > v2, sqrt(v1 * v2), maximum(v1 - v2, 0) ** 2)',
+])
+def test_bench_expression(benchmark, expression):
+    import numpy as np
+    from terracotta.expressions import evaluate_expression
+
+    np.random.seed(0)
+    operands = {
+        'v1': np.ma.masked_less(np.random.rand(512, 512), 0.1),
+        'v2': np.ma.masked_less(np.random.rand(512, 512), 0.1),
+    }
+
+    out = benchmark(evaluate_expression, expression, operands)
+    assert out.shape == (512, 512)
+
+
+def test_bench_cold_start(benchmark):
+    import json
+    import subprocess
+    import sys
+
+    script = (
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        'from terracotta.server import create_app\n'
+        'create_app()\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'deferred = [m for m in {COLD_START_DEFERRED_MODULES!r} if m in sys.modules]\n'
+        'print(json.dumps({"elapsed": elapsed, "imported": deferred}))\n'
+    )
+
+    results = []
+
+    def cold_start():
+        # run in a fresh interpreter, since imports are cached
+        output = subprocess.check_output([sys.executable, '-c', script])
+        results.append(json.loads(output))
+
+    benchmark.pedantic(cold_start, rounds=5)
+
+    assert not any(result['imported'] for result in results)
+    assert min(result['elapsed'] for result in results) < COLD_START_BUDGET
+
+
 @pytest.mark.parametrize('chunks', [False, True])
 @pytest.mark.parametrize('raster_type', ['nodata', 'masked'])
 def test_bench_compute_metadata(benchmark, big_raster_file_nodata, big_raster_file_mask,
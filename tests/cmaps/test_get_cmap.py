@@ -21,6 +21,20 @@ def test_get_cmap():
         assert cmap.dtype == np.uint8
 
 
+def test_get_cmap_cached(monkeypatch):
+    import terracotta.cmaps.get_cmaps
+    from terracotta.cmaps.get_cmaps import get_cmap
+
+    first = get_cmap('viridis')
+    assert not first.flags.writeable
+
+    def fail(*args, **kwargs):
+        raise AssertionError('colormap should be read from registry')
+
+    monkeypatch.setattr(terracotta.cmaps.get_cmaps, '_read_cmap', fail)
+    assert get_cmap('Viridis') is first
+
+
 def test_get_cmap_filesystem(monkeypatch):
     import pkg_resources
     import importlib
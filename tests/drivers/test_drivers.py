@@ -170,6 +170,32 @@ def test_broken_connection(driver_path, provider):
         db.get_keys()
 
 
+@pytest.mark.parametrize('provider', TESTABLE_DRIVERS)
+def test_connect_threads(driver_path, provider):
+    """Test whether a single driver instance can be used from several threads"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+    db.create(keys)
+
+    barrier = threading.Barrier(4)
+
+    def get_keys():
+        with db.connect():
+            # make sure all threads are connected at the same time
+            barrier.wait(timeout=10)
+            return tuple(db.get_keys())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: get_keys(), range(4)))
+
+    assert results == [keys] * 4
+    assert not db._connected
+
+
 @pytest.mark.parametrize('provider', TESTABLE_DRIVERS)
 def test_repr(driver_path, provider):
     from terracotta import drivers
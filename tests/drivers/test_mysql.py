@@ -43,3 +43,126 @@ def test_invalid_paths(case):
 
     with pytest.raises(ValueError):
         drivers.get_driver(case, provider='mysql')
+
+
+class FakeCursor:
+    """Cursor returning scripted rows for statements starting with given prefixes"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.executed = []
+        self._rows = []
+
+    def execute(self, sql, args=None):
+        self.executed.append((sql, args))
+        for prefix, response in self.responses.items():
+            if sql.startswith(prefix):
+                if isinstance(response, Exception):
+                    raise response
+                self._rows = list(response)
+                return
+        self._rows = []
+
+    def executemany(self, sql, args):
+        self.execute(sql, args)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, *args):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def fake_mysql(monkeypatch):
+    import pymysql
+    from terracotta import __version__, drivers
+
+    def make_driver(responses):
+        responses = {
+            'SELECT version from terracotta': [{'version': __version__}],
+            'SELECT * FROM key_names': [{'key_name': 'key1', 'description': ''}],
+            "SHOW COLUMNS FROM metadata LIKE 'histogram'": [{'Field': 'histogram'}],
+            "SHOW TABLES LIKE 'dataset_bounds'": [{'table': 'dataset_bounds'}],
+            **responses
+        }
+        cursor = FakeCursor(responses)
+        monkeypatch.setattr(pymysql, 'connect', lambda **kwargs: FakeConnection(cursor))
+
+        drivers._DRIVER_CACHE = {}
+        return drivers.get_driver('mysql://localhost/test', provider='mysql'), cursor
+
+    return make_driver
+
+
+@pytest.mark.parametrize('server_version,has_srid', [
+    ('8.0.33', True),
+    ('5.7.42-log', False),
+    ('10.6.12-MariaDB', False),
+])
+def test_bounds_table_srid(fake_mysql, server_version, has_srid):
+    driver, cursor = fake_mysql({
+        "SHOW TABLES LIKE 'dataset_bounds'": [],
+        'SELECT VERSION()': [{'version': server_version}],
+    })
+
+    with driver.connect():
+        pass
+
+    create_statement, = [sql for sql, _ in cursor.executed if sql.startswith('CREATE TABLE')]
+    assert 'SPATIAL INDEX (bounds)' in create_statement
+    assert ('SRID 0' in create_statement) is has_srid
+    assert any(sql.startswith('RENAME TABLE dataset_bounds_new TO dataset_bounds')
+               for sql, _ in cursor.executed)
+
+
+def test_where_bbox_spatial_index(fake_mysql):
+    driver, cursor = fake_mysql({})
+    driver.get_datasets(where_bbox=(1, 2, 3, 4))
+
+    sql, args = cursor.executed[-1]
+    assert 'MBRIntersects(bounds, ST_GeomFromText(%s))' in sql
+    assert args == ['POLYGON((1 2, 3 2, 3 4, 1 4, 1 2))']
+
+
+def test_read_only_upgrade(fake_mysql):
+    import pymysql
+
+    denied = pymysql.err.OperationalError(1142, 'command denied to user')
+    driver, cursor = fake_mysql({
+        "SHOW COLUMNS FROM metadata LIKE 'histogram'": [],
+        "SHOW TABLES LIKE 'dataset_bounds'": [],
+        'ALTER TABLE': denied,
+        'CREATE TABLE': denied,
+    })
+
+    # reading still works, without spatial index
+    driver.get_datasets(where_bbox=(1, 2, 3, 4))
+
+    sql, args = cursor.executed[-1]
+    assert 'dataset_bounds' not in sql
+    assert 'FROM metadata' in sql
+    assert args == [3, 1, 4, 2]
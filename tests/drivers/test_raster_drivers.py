@@ -1,5 +1,6 @@
 import pytest
 
+import os
 import platform
 import time
 
@@ -9,7 +10,7 @@ from shapely.geometry import shape, MultiPolygon
 import numpy as np
 
 DRIVERS = ['sqlite', 'mysql']
-METADATA_KEYS = ('bounds', 'range', 'mean', 'stdev', 'percentiles', 'metadata')
+METADATA_KEYS = ('bounds', 'range', 'mean', 'stdev', 'percentiles', 'histogram', 'metadata')
 
 
 @pytest.mark.parametrize('provider', DRIVERS)
@@ -76,6 +77,41 @@ def test_where(driver_path, provider, raster_file):
     assert 'unrecognized keys' in str(exc.value)
 
 
+@pytest.mark.parametrize('provider', DRIVERS)
+def test_where_bbox(driver_path, provider, raster_file):
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+    db.insert(['some', 'value'], str(raster_file))
+    db.insert(['some', 'other_value'], str(raster_file))
+    db.insert(['some', 'lazy_value'], str(raster_file), skip_metadata=True)
+
+    west, south, east, north = db.get_metadata(['some', 'value'])['bounds']
+    center_x, center_y = (west + east) / 2, (south + north) / 2
+
+    data = db.get_datasets(where_bbox=(center_x, center_y, east + 1, north + 1))
+    assert list(data.keys()) == [('some', 'other_value'), ('some', 'value')]
+
+    data = db.get_datasets(where={'keynames': 'value'}, where_bbox=(west, south, east, north))
+    assert list(data.keys()) == [('some', 'value')]
+
+    data = db.get_datasets(where_bbox=(east + 1, north + 1, east + 2, north + 2))
+    assert data == {}
+
+    # lazily loaded datasets are indexed after computing metadata
+    db.get_metadata(['some', 'lazy_value'])
+    data = db.get_datasets(where_bbox=(west, south, east, north))
+    assert len(data) == 3
+
+    # index stays consistent after re-insertion and deletion
+    db.insert(['some', 'value'], str(raster_file))
+    db.delete(['some', 'other_value'])
+    data = db.get_datasets(where_bbox=(west, south, east, north))
+    assert list(data.keys()) == [('some', 'lazy_value'), ('some', 'value')]
+
+
 @pytest.mark.parametrize('provider', DRIVERS)
 def test_where_with_multiquery(driver_path, provider, raster_file):
     from terracotta import drivers
@@ -540,6 +576,15 @@ def test_compute_metadata(big_raster_file_nodata, big_raster_file_nomask,
         rtol=2e-2, atol=valid_data.max() / 100
     )
 
+    # histogram is approximate when computed in chunks
+    expected_histogram, _ = np.histogram(
+        valid_data, bins=256, range=(valid_data.min(), valid_data.max())
+    )
+    assert len(mtd['histogram']) == 256
+    assert np.sum(mtd['histogram']) == valid_data.size
+    if not use_chunks:
+        np.testing.assert_array_equal(mtd['histogram'], expected_histogram)
+
     assert geometry_mismatch(shape(mtd['convex_hull']), convex_hull) < 1e-6
 
 
@@ -707,3 +752,221 @@ def test_no_multiprocessing():
 
     executor = create_executor()
     assert isinstance(executor, concurrent.futures.ThreadPoolExecutor)
+
+
+def test_monotone_chain_hull():
+    from shapely.geometry import MultiPoint, Polygon
+    from terracotta.drivers.raster_base import RasterDriver
+
+    np.random.seed(42)
+    points = np.random.randint(0, 100, size=(1000, 2))
+
+    hull = RasterDriver._monotone_chain_hull(points)
+    expected_hull = MultiPoint(points.tolist()).convex_hull
+
+    assert Polygon(hull.tolist()).is_valid
+    assert geometry_mismatch(Polygon(hull.tolist()), expected_hull) < 1e-12
+    # vertices are given in counter-clockwise order
+    assert Polygon(hull.tolist()).exterior.is_ccw
+
+
+def test_hull_candidate_corners():
+    from terracotta.drivers.raster_base import RasterDriver
+
+    mask = np.zeros((4, 4), dtype='bool')
+    mask[1:3, 1:3] = True
+
+    corners = RasterDriver._hull_candidate_corners(mask)
+    hull = RasterDriver._monotone_chain_hull(corners)
+    assert sorted(map(tuple, hull.tolist())) == [(1, 1), (1, 3), (3, 1), (3, 3)]
+
+
+@pytest.mark.parametrize('provider', DRIVERS)
+def test_insert_without_histogram(driver_path, provider, raster_file):
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+
+    metadata = db.compute_metadata(str(raster_file))
+    del metadata['histogram']
+    db.insert(['some', 'value'], str(raster_file), metadata=metadata)
+
+    assert db.get_metadata(['some', 'value'])['histogram'] is None
+
+
+@pytest.mark.parametrize('provider', DRIVERS)
+def test_histogram_schema_upgrade(driver_path, provider, raster_file):
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+    db.insert(['some', 'value'], str(raster_file))
+
+    # simulate a database created before histograms were stored
+    with db._connect(check=False):
+        if provider == 'mysql':
+            db._cursor.execute('ALTER TABLE metadata DROP COLUMN histogram')
+            db._version_checked = False
+        else:
+            db._connection.execute('ALTER TABLE metadata DROP COLUMN histogram')
+            db._spatial_index_available = None
+
+    assert db.get_metadata(['some', 'value'])['histogram'] is None
+
+    db.insert(['some', 'other_value'], str(raster_file))
+    assert db.get_metadata(['some', 'other_value'])['histogram'] is not None
+
+
+@pytest.mark.parametrize('provider', ['sqlite'])
+def test_where_bbox_row_ids(driver_path, provider, raster_file):
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+
+    metadata = db.compute_metadata(str(raster_file))
+    for i, key in enumerate(('a', 'b', 'c')):
+        metadata['bounds'] = (10 * i, 10 * i, 10 * i + 1, 10 * i + 1)
+        db.insert(['some', key], str(raster_file), metadata=metadata)
+
+    db.delete(['some', 'a'])
+
+    # VACUUM may renumber implicit row IDs, simulate this by re-inserting all rows
+    with db.connect():
+        conn = db._connection
+        conn.execute('CREATE TEMPORARY TABLE metadata_copy AS SELECT * FROM metadata')
+        conn.execute('DELETE FROM metadata')
+        conn.execute('INSERT INTO metadata SELECT * FROM metadata_copy')
+
+    assert list(db.get_datasets(where_bbox=(10, 10, 11, 11))) == [('some', 'b')]
+    assert list(db.get_datasets(where_bbox=(20, 20, 21, 21))) == [('some', 'c')]
+
+
+@pytest.mark.parametrize('provider', DRIVERS)
+def test_where_bbox_schema_upgrade(driver_path, provider, raster_file):
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+    db.insert(['some', 'value'], str(raster_file))
+    bounds = db.get_metadata(['some', 'value'])['bounds']
+
+    # simulate a database created before the spatial index existed
+    with db._connect(check=False):
+        if provider == 'mysql':
+            db._cursor.execute('DROP TABLE dataset_bounds')
+            db._version_checked = False
+        else:
+            conn = db._connection
+            conn.execute('DROP TABLE dataset_bounds')
+            conn.execute('ALTER TABLE metadata RENAME TO metadata_new')
+            columns = ', '.join((*keys, *(col for col, _ in db._METADATA_COLUMNS)))
+            conn.execute(f'CREATE TABLE metadata AS SELECT {columns} FROM metadata_new')
+            conn.execute('DROP TABLE metadata_new')
+            db._spatial_index_available = None
+
+    assert list(db.get_datasets(where_bbox=bounds)) == [('some', 'value')]
+
+    db.insert(['some', 'other_value'], str(raster_file))
+    assert list(db.get_datasets(where_bbox=bounds)) == [('some', 'other_value'), ('some', 'value')]
+
+
+@pytest.mark.parametrize('provider', ['sqlite'])
+def test_schema_checked_once(driver_path, provider, raster_file, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+
+    db.create(('some', 'keynames'))
+    db.insert(['some', 'value'], str(raster_file))
+
+    inspections = []
+    inspect_schema = db._inspect_schema
+
+    def counting_inspect_schema():
+        inspections.append(1)
+        return inspect_schema()
+
+    monkeypatch.setattr(db, '_inspect_schema', counting_inspect_schema)
+    db._spatial_index_available = None
+
+    def get_datasets(_):
+        with db.connect():
+            return db.get_datasets()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(get_datasets, range(8)))
+
+    with db.connect():
+        pass
+
+    assert len(inspections) <= 4
+
+
+@pytest.mark.parametrize('provider', ['sqlite'])
+def test_schema_upgrade_atomic(driver_path, provider, raster_file, monkeypatch):
+    import sqlite3
+    from terracotta import drivers
+    db = drivers.get_driver(driver_path, provider=provider)
+    keys = ('some', 'keynames')
+
+    db.create(keys)
+    db.insert(['some', 'value'], str(raster_file))
+
+    # simulate a database created before the spatial index existed
+    with db._connect(check=False):
+        conn = db._connection
+        conn.execute('DROP TABLE dataset_bounds')
+        conn.execute('ALTER TABLE metadata RENAME TO metadata_new')
+        columns = ', '.join((*keys, *(col for col, _ in db._METADATA_COLUMNS)))
+        conn.execute(f'CREATE TABLE metadata AS SELECT {columns} FROM metadata_new')
+        conn.execute('DROP TABLE metadata_new')
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    # fail after metadata has been re-created
+    monkeypatch.setattr(db, '_create_spatial_index', fail)
+    db._spatial_index_available = None
+
+    with db.connect():
+        tables = {row['name'] for row in db._connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        )}
+        metadata_columns, _ = db._inspect_schema()
+
+    assert 'metadata_old' not in tables
+    assert 'id' not in metadata_columns
+    assert db.get_metadata(['some', 'value'])['bounds']
+
+
+def test_executor_shared_between_threads(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from terracotta.drivers import raster_base
+
+    monkeypatch.setattr(raster_base.context, 'executor', None)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        executors = list(pool.map(lambda _: raster_base.get_executor(), range(16)))
+
+    assert all(executor is executors[0] for executor in executors)
+
+
+@pytest.mark.skipif(not hasattr(os, 'register_at_fork'), reason='requires os.register_at_fork')
+def test_executor_reset_after_fork():
+    from terracotta.drivers import raster_base
+
+    raster_base.get_executor()
+
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        os._exit(0 if raster_base.context.executor is None else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert raster_base.context.executor is not None
@@ -43,7 +43,8 @@ class Timer:
 def s3_db_factory(tmpdir):
     bucketname = str(uuid.uuid4())
 
-    def _s3_db_factory(keys, datasets=None):
+    def _s3_db_factory(keys, datasets=None, sql=()):
+        import sqlite3
         from terracotta import get_driver
 
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -55,6 +56,10 @@ def s3_db_factory(tmpdir):
                 for keys, path in datasets.items():
                     driver.insert(keys, path)
 
+            with sqlite3.connect(dbfile) as conn:
+                for statement in sql:
+                    conn.execute(statement)
+
             with open(dbfile, 'rb') as f:
                 db_bytes = f.read()
 
@@ -128,11 +133,98 @@ def test_remote_database_cache(s3_db_factory, raster_file, monkeypatch):
     # invalidate cache
     driver._last_updated = -float('inf')
 
+    with driver.connect():  # db is updated in the background, current copy is used
+        assert driver.get_datasets() == {}
+
+    driver._update_thread.join()
+
     with driver.connect():  # now db is updated on reconnect
         assert list(driver.get_datasets().keys()) == [('some', 'value')]
         assert os.path.getmtime(driver.path) != modification_date
 
 
+@moto.mock_s3
+def test_remote_database_unchanged(s3_db_factory, monkeypatch):
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(keys)
+
+    from terracotta import get_driver
+    from terracotta.drivers import sqlite_remote
+
+    driver = get_driver(dbpath)
+
+    with driver.connect():
+        assert driver.key_names == keys
+
+    db_path = driver.path
+    modification_date = os.path.getmtime(db_path)
+    etag = driver._etag
+    assert etag is not None
+
+    downloads = []
+    download_from_s3 = sqlite_remote._download_from_s3
+
+    def counting_download_from_s3(*args, **kwargs):
+        downloads.append(args)
+        return download_from_s3(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite_remote, '_download_from_s3', counting_download_from_s3)
+
+    # unchanged database is not downloaded again
+    driver._last_updated = -float('inf')
+    with driver.connect():
+        pass
+
+    driver._update_thread.join()
+
+    assert not downloads
+    assert driver._etag == etag
+    assert driver.path == db_path
+    assert os.path.getmtime(db_path) == modification_date
+    assert driver._last_updated > -float('inf')
+
+
+@moto.mock_s3
+def test_remote_database_update_does_not_block(s3_db_factory, monkeypatch):
+    import threading
+
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(keys)
+
+    from terracotta import get_driver
+    from terracotta.drivers import sqlite_remote
+
+    driver = get_driver(dbpath)
+
+    with driver.connect():
+        pass
+
+    release_update = threading.Event()
+    get_s3_etag = sqlite_remote._get_s3_etag
+
+    def slow_get_s3_etag(*args, **kwargs):
+        release_update.wait(timeout=10)
+        return get_s3_etag(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite_remote, '_get_s3_etag', slow_get_s3_etag)
+    driver._last_updated = -float('inf')
+
+    try:
+        # connections are served from the current copy while the update is in progress
+        for _ in range(3):
+            with driver.connect():
+                assert driver.key_names == keys
+
+        update_thread = driver._update_thread
+        assert update_thread.is_alive()
+    finally:
+        release_update.set()
+
+    update_thread.join()
+    # only one update is started at a time
+    assert driver._update_thread is update_thread
+
+
 @moto.mock_s3
 def test_immutability(s3_db_factory, raster_file):
     keys = ('some', 'keys')
@@ -153,21 +245,296 @@ def test_immutability(s3_db_factory, raster_file):
 
 
 @moto.mock_s3
-def test_destructor(s3_db_factory, raster_file, capsys):
+@pytest.mark.parametrize('range_requests', [False, True])
+def test_old_schema(s3_db_factory, raster_file, tmpdir, range_requests):
+    if range_requests:
+        pytest.importorskip('apsw')
+
+    from terracotta import get_driver, update_settings
+
+    update_settings(REMOTE_DB_RANGE_REQUESTS=range_requests, REMOTE_DB_CACHE_DIR=str(tmpdir))
+
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(
+        keys, datasets={('some', 'value'): str(raster_file)},
+        sql=['ALTER TABLE metadata DROP COLUMN histogram', 'DROP TABLE dataset_bounds']
+    )
+
+    driver = get_driver(dbpath)
+
+    # read-only databases cannot be upgraded, but are still usable
+    metadata = driver.get_metadata(('some', 'value'))
+    assert metadata['histogram'] is None
+    assert metadata['range']
+
+    west, south, east, north = metadata['bounds']
+    assert list(driver.get_datasets(where_bbox=(west, south, east, north))) == [('some', 'value')]
+    assert driver.get_datasets(where_bbox=(east + 1, north + 1, east + 2, north + 2)) == {}
+
+
+@moto.mock_s3
+def test_shared_cache(s3_db_factory, raster_file, monkeypatch, tmpdir):
+    import sqlite3
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from terracotta import update_settings
+    from terracotta.drivers import sqlite_remote
+    from terracotta.drivers.sqlite_remote import RemoteSQLiteDriver
+
+    update_settings(REMOTE_DB_CACHE_DIR=str(tmpdir))
+
     keys = ('some', 'keys')
     dbpath = s3_db_factory(keys, datasets={('some', 'value'): str(raster_file)})
 
-    from terracotta import get_driver
+    downloads = []
+    download_from_s3 = sqlite_remote._download_from_s3
+    all_waiting = threading.Barrier(4)
+
+    def counting_download_from_s3(*args, **kwargs):
+        downloads.append(args)
+        return download_from_s3(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite_remote, '_download_from_s3', counting_download_from_s3)
+
+    # independent driver instances, as in different worker processes
+    drivers = [RemoteSQLiteDriver(dbpath) for _ in range(4)]
+
+    def get_datasets(driver):
+        all_waiting.wait(timeout=10)
+        with driver.connect():
+            return driver.get_datasets()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(get_datasets, drivers))
+
+    assert all(result == {('some', 'value'): str(raster_file)} for result in results)
+
+    # database is downloaded once and shared by all drivers
+    assert len(downloads) == 1
+    assert len({driver.path for driver in drivers}) == 1
+    assert len(list(Path(tmpdir).glob('tc_s3_db_*.sqlite'))) == 1
+
+    # connections are read-only and memory-mapped
+    driver = drivers[0]
+    with driver.connect():
+        assert driver._connection.execute('PRAGMA mmap_size').fetchone()[0] > 0
+        with pytest.raises(sqlite3.OperationalError):
+            driver._connection.execute('DELETE FROM datasets')
+
+    # new versions replace old ones
+    s3_db_factory(keys)
+    driver._last_updated = -float('inf')
+
+    with driver.connect():
+        pass
+
+    driver._update_thread.join()
+
+    with driver.connect():
+        assert driver.get_datasets() == {}
+
+    assert len(downloads) == 2
+    assert len(list(Path(tmpdir).glob('tc_s3_db_*.sqlite'))) == 1
+
+    # other drivers pick up the new version once their copy is gone
+    other_driver = drivers[1]
+    assert not os.path.isfile(other_driver.path)
+
+    with other_driver.connect():
+        assert other_driver.get_datasets() == {}
+
+    assert other_driver.path == driver.path
+    assert len(downloads) == 2
+
+
+@moto.mock_s3
+def test_prune_waits_for_readers(s3_db_factory, monkeypatch, tmpdir):
+    import threading
+
+    from terracotta import update_settings
+    from terracotta.drivers import sqlite_remote
+    from terracotta.drivers.sqlite_remote import RemoteSQLiteDriver
+
+    pytest.importorskip('fcntl')
+    update_settings(REMOTE_DB_CACHE_DIR=str(tmpdir))
+
+    dbpath = s3_db_factory(('some', 'keys'))
+    driver = RemoteSQLiteDriver(dbpath)
+
+    with driver.connect():
+        pass
+
+    old_copy = driver.path
+
+    # another process is about to open the outdated copy
+    with sqlite_remote._file_lock(f'{old_copy}.lock', shared=True):
+        pruner = threading.Thread(
+            target=driver._prune_cache, kwargs=dict(keep=f'{old_copy}.new')
+        )
+        pruner.start()
+        pruner.join(timeout=0.5)
+        assert pruner.is_alive()
+        assert os.path.isfile(old_copy)
+
+    pruner.join(timeout=10)
+    assert not pruner.is_alive()
+    assert not os.path.isfile(old_copy)
+    assert not os.path.isfile(f'{old_copy}.lock')
+
+
+@moto.mock_s3
+def test_remote_database_range_requests(s3_db_factory, raster_file, tmpdir):
+    pytest.importorskip('apsw')
+
+    import sqlite3
+    from terracotta import get_driver, update_settings
+
+    update_settings(
+        REMOTE_DB_RANGE_REQUESTS=True, REMOTE_DB_BLOCK_SIZE=1024,
+        REMOTE_DB_CACHE_DIR=str(tmpdir)
+    )
+
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(keys, datasets={('some', 'value'): str(raster_file)})
+
+    local_driver = get_driver(str(raster_file.dirpath('local.sqlite')))
+    local_driver.create(keys)
+    local_driver.insert(('some', 'value'), str(raster_file))
 
     driver = get_driver(dbpath)
-    assert os.path.isfile(driver.path)
 
-    driver.__del__()
-    assert not os.path.isfile(driver.path)
+    with driver.connect():
+        assert driver.key_names == keys
+        assert driver.get_datasets() == {('some', 'value'): str(raster_file)}
+        assert driver.get_metadata(('some', 'value')) == local_driver.get_metadata(
+            ('some', 'value')
+        )
+
+        with pytest.raises(sqlite3.OperationalError):
+            driver._connection.execute('SELECT * FROM nonexisting')
+
+    # database has not been downloaded, only the blocks read are cached
+    assert not os.path.exists(driver.path)
+    block_dirs = list(Path(tmpdir).glob('tc_s3_blocks_*'))
+    assert len(block_dirs) == 1
+    assert list(block_dirs[0].glob('*.block'))
+
+    # new versions are picked up after cache expired
+    s3_db_factory(keys)
+    driver._last_updated = -float('inf')
+
+    with driver.connect():
+        pass
+
+    driver._update_thread.join()
 
-    captured = capsys.readouterr()
-    assert 'Exception ignored' not in captured.err
+    with driver.connect():
+        assert driver.get_datasets() == {}
+
+    # blocks of the outdated version are kept while other processes may still read them
+    assert len(list(Path(tmpdir).glob('tc_s3_blocks_*'))) == 2
+
+    # and removed on the first update after that
+    driver._prune_blocks_after = 0
+    driver._last_updated = -float('inf')
 
-    # re-create file to prevent actual destructor from failing
-    with open(driver.path, 'w'):
+    with driver.connect():
         pass
+
+    driver._update_thread.join()
+
+    new_block_dirs = list(Path(tmpdir).glob('tc_s3_blocks_*'))
+    assert len(new_block_dirs) == 1
+    assert new_block_dirs != block_dirs
+
+
+@moto.mock_s3
+def test_remote_database_range_requests_changed(s3_db_factory, tmpdir):
+    pytest.importorskip('apsw')
+
+    import shutil
+    from terracotta import get_driver, update_settings, exceptions
+
+    update_settings(REMOTE_DB_RANGE_REQUESTS=True, REMOTE_DB_CACHE_DIR=str(tmpdir))
+
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(keys)
+
+    driver = get_driver(dbpath)
+
+    with driver.connect():
+        assert driver.key_names == keys
+
+    # remote database changes before cache expires, and blocks are not cached
+    s3_db_factory(('other', 'keys'))
+    for block_dir in Path(tmpdir).glob('tc_s3_blocks_*'):
+        shutil.rmtree(block_dir)
+
+    with pytest.raises(exceptions.InvalidDatabaseError):
+        with driver.connect():
+            driver.get_keys()
+
+    # new version is used on next connection
+    with driver.connect():
+        assert tuple(driver.get_keys()) == ('other', 'keys')
+
+
+@moto.mock_s3
+def test_remote_database_range_requests_no_apsw(s3_db_factory, monkeypatch):
+    from terracotta import get_driver, update_settings, exceptions
+    from terracotta.drivers import sqlite_remote
+
+    monkeypatch.setattr(sqlite_remote, 'has_apsw', False)
+    update_settings(REMOTE_DB_RANGE_REQUESTS=True)
+
+    keys = ('some', 'keys')
+    dbpath = s3_db_factory(keys)
+
+    with pytest.warns(exceptions.PerformanceWarning):
+        driver = get_driver(dbpath)
+
+    with driver.connect():
+        assert driver.key_names == keys
+
+    # database has been downloaded
+    assert os.path.getsize(driver.path) > 0
+
+
+def test_remote_file_blocks(tmpdir):
+    pytest.importorskip('apsw')
+
+    from terracotta.drivers.sqlite_remote_vfs import RemoteFile
+
+    data = bytes(range(256)) * 10
+    requests = []
+
+    def fetch_range(start, stop):
+        requests.append((start, stop))
+        return data[start:stop]
+
+    remote_file = RemoteFile(fetch_range, len(data), str(tmpdir), block_size=100)
+
+    # contiguous missing blocks are fetched in a single request
+    assert remote_file.read(250, 150) == data[150:400]
+    assert requests == [(100, 400)]
+
+    # cached blocks are not fetched again
+    assert remote_file.read(50, 120) == data[120:170]
+    assert remote_file.read(400, 0) == data[:400]
+    assert requests == [(100, 400), (0, 100)]
+
+    # reads at the end of the file are truncated
+    assert remote_file.read(100, len(data) - 10) == data[-10:]
+    assert remote_file.read(100, len(data)) == b''
+    assert requests[-1] == (2500, 2560)
+
+    # cache is shared between instances
+    other_file = RemoteFile(fetch_range, len(data), str(tmpdir), block_size=100)
+    assert other_file.read(300, 100) == data[100:400]
+    assert len(requests) == 3
+
+    # reads still work after the cache has been removed by another process
+    tmpdir.remove()
+    assert remote_file.read(100, 1000) == data[1000:1100]
+    assert requests[-1] == (1000, 1100)
@@ -0,0 +1,144 @@
+import numpy as np
+
+import pytest
+
+
+@pytest.mark.parametrize('compression', ['none', 'deflate'])
+@pytest.mark.parametrize('dtype', ['uint16', 'int32', 'float32', 'float64'])
+def test_encode_roundtrip(compression, dtype):
+    from terracotta.handlers.data import encode_tile, decode_tile
+
+    np.random.seed(0)
+    values = (1000 * np.random.rand(50, 60)).astype(dtype)
+    tile_data = np.ma.masked_array(values, mask=np.random.rand(50, 60) > 0.8)
+
+    decoded = decode_tile(encode_tile(tile_data, compression=compression))
+    assert decoded.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(decoded.mask, tile_data.mask)
+    np.testing.assert_array_equal(decoded.compressed(), tile_data.compressed())
+
+    # masked values are zeroed
+    assert np.all(decoded.data[decoded.mask] == 0)
+
+
+def test_encode_no_mask():
+    from terracotta.handlers.data import encode_tile, decode_tile, HEADER
+
+    tile_data = np.arange(12, dtype='uint8').reshape(3, 4)
+    buffer = encode_tile(tile_data, compression='none')
+
+    # header followed by raw values, no mask
+    assert len(buffer) == HEADER.size + tile_data.size
+    assert buffer[HEADER.size:] == tile_data.tobytes()
+
+    decoded = decode_tile(buffer)
+    assert not decoded.mask.any()
+    np.testing.assert_array_equal(decoded, tile_data)
+
+
+def test_encode_float16():
+    from terracotta.handlers.data import encode_tile, decode_tile
+
+    tile_data = np.ma.masked_array(np.linspace(0, 1, 100, dtype='float64').reshape(10, 10))
+    full = encode_tile(tile_data, compression='none')
+    quantized = encode_tile(tile_data, compression='none', dtype='float16')
+    assert len(quantized) < len(full) / 3
+
+    decoded = decode_tile(quantized)
+    assert decoded.dtype == np.dtype('float16')
+    np.testing.assert_allclose(decoded, tile_data, atol=1e-3)
+
+
+def test_encode_invalid():
+    from terracotta.handlers.data import encode_tile, decode_tile
+
+    with pytest.raises(ValueError):
+        encode_tile(np.zeros((2, 2)), compression='foo')
+
+    with pytest.raises(ValueError):
+        encode_tile(np.zeros((2, 2)), dtype='int8')
+
+    with pytest.raises(ValueError):
+        encode_tile(np.zeros((2, 2, 2)))
+
+    with pytest.raises(ValueError):
+        decode_tile(b'not a tile, but long enough for a header')
+
+
+def test_decode_invalid_header():
+    from terracotta.handlers.data import encode_tile, decode_tile
+
+    buffer = bytearray(encode_tile(np.zeros((2, 2), dtype='uint8'), compression='none'))
+
+    invalid_compression = bytearray(buffer)
+    invalid_compression[5] = 255
+    with pytest.raises(ValueError, match='compression'):
+        decode_tile(bytes(invalid_compression))
+
+    invalid_dtype = bytearray(buffer)
+    invalid_dtype[8:16] = b'foo\0\0\0\0\0'
+    with pytest.raises(ValueError, match='data type'):
+        decode_tile(bytes(invalid_dtype))
+
+
+def test_zstd():
+    pytest.importorskip('zstandard')
+    from terracotta.handlers.data import encode_tile, decode_tile, HEADER
+
+    tile_data = np.ma.masked_less(np.tile(np.arange(100.), (100, 1)), 10)
+    buffer = encode_tile(tile_data, compression='zstd')
+    assert buffer[5] == 2
+    assert len(buffer) < HEADER.size + tile_data.nbytes
+
+    np.testing.assert_array_equal(decode_tile(buffer), tile_data)
+
+
+def test_zstd_fallback(monkeypatch):
+    import terracotta
+    from terracotta.handlers import data
+
+    monkeypatch.setattr(data, 'has_zstd', False)
+
+    with pytest.warns(terracotta.exceptions.PerformanceWarning):
+        buffer = data.encode_tile(np.ones((4, 4)), compression='zstd')
+
+    np.testing.assert_array_equal(data.decode_tile(buffer), np.ones((4, 4)))
+
+
+def test_empty_tile():
+    from terracotta.handlers.data import empty_tile, decode_tile
+
+    decoded = decode_tile(empty_tile((16, 32)).read())
+    assert decoded.shape == (16, 32)
+    assert decoded.mask.all()
+
+
+def test_data_handler(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta import xyz
+    from terracotta.handlers.data import data, decode_tile
+
+    settings = terracotta.get_settings()
+    keys = ['val11', 'x', 'val12']
+
+    decoded = decode_tile(data(keys, raster_file_xyz).read())
+    assert decoded.shape == settings.DEFAULT_TILE_SIZE
+
+    driver = terracotta.get_driver(settings.DRIVER_PATH)
+    with driver.connect():
+        expected = xyz.get_tile_data(
+            driver, keys, raster_file_xyz, tile_size=settings.DEFAULT_TILE_SIZE,
+            preserve_values=True
+        )
+
+    assert decoded.dtype == expected.dtype
+    np.testing.assert_array_equal(decoded.mask, np.ma.getmaskarray(expected))
+    np.testing.assert_array_equal(decoded.compressed(), expected.compressed())
+
+
+def test_data_handler_invalid(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers.data import data
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        data(['val11', 'x', 'val12'], raster_file_xyz, dtype='int8')
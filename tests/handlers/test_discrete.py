@@ -0,0 +1,64 @@
+from PIL import Image
+import numpy as np
+
+import pytest
+
+
+def test_classify():
+    from terracotta.handlers.discrete import classify
+
+    data = np.array([-1, 0, 0.24, 0.25, 0.5, 0.99, 1, 2])
+    np.testing.assert_array_equal(classify(data, 0, 1, 4), [1, 1, 1, 2, 3, 4, 4, 4])
+    np.testing.assert_array_equal(classify(data, 0, 1, 1), np.ones(len(data)))
+
+
+def test_classify_matches_scaling():
+    from terracotta.handlers.discrete import classify
+
+    data = np.random.rand(100, 100) * 100
+    n_classes = 7
+
+    expected = np.minimum(np.floor((data - 10) / 80 * n_classes), n_classes - 1)
+    expected = np.maximum(expected, 0) + 1
+    np.testing.assert_array_equal(classify(data, 10, 90, n_classes), expected)
+
+
+def test_discrete_palette():
+    import matplotlib.pyplot as plt
+    from terracotta.handlers.discrete import discrete_palette
+
+    palette = discrete_palette('viridis', 5)
+    assert len(palette) == 5
+
+    mpl_colors = plt.get_cmap('viridis', 5)(np.arange(5)) * 255
+    np.testing.assert_allclose(palette, mpl_colors, atol=4)
+
+    # unknown colormaps fall back to viridis
+    assert discrete_palette('foo', 5) == palette
+
+    # bundled colormaps are case-insensitive, others are read from matplotlib
+    assert discrete_palette('Viridis', 5) == palette
+
+    mpl_colors = plt.get_cmap('turbo', 5)(np.arange(5)) * 255
+    np.testing.assert_allclose(discrete_palette('turbo', 5), mpl_colors, atol=4)
+
+
+def test_discrete_handler(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import discrete
+    settings = terracotta.get_settings()
+
+    raw_img = discrete.discrete(['val11', 'x', 'val12'], raster_file_xyz,
+                                colormap='viridis', n_classes=8)
+    img_data = np.asarray(Image.open(raw_img))
+    assert img_data.shape == settings.DEFAULT_TILE_SIZE
+    assert img_data.max() <= 8
+
+
+def test_discrete_handler_invalid_classes(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import discrete
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        discrete.discrete(['val11', 'x', 'val12'], raster_file_xyz,
+                          colormap='viridis', n_classes=256)
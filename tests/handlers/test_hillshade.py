@@ -0,0 +1,159 @@
+from PIL import Image
+import numpy as np
+
+import pytest
+
+
+def test_pad_bounds():
+    from terracotta.xyz import pad_bounds
+
+    bounds, tile_size = pad_bounds((0, 0, 256, 512), (256, 256), 1)
+    assert tile_size == (258, 258)
+    np.testing.assert_allclose(bounds, (-1, -2, 257, 514))
+
+
+def test_padded_tile_data(testdb, raster_file_xyz):
+    import terracotta
+    from terracotta import xyz
+
+    driver = terracotta.get_driver(str(testdb))
+    keys = ['val11', 'x', 'val12']
+
+    with driver.connect():
+        tile_data = xyz.get_tile_data(driver, keys, raster_file_xyz, tile_size=(64, 64))
+        padded_data = xyz.get_tile_data(
+            driver, keys, raster_file_xyz, tile_size=(64, 64), padding=1
+        )
+
+        with pytest.raises(ValueError):
+            xyz.get_tile_data(driver, keys, tile_size=(64, 64), padding=1)
+
+    assert padded_data.shape == (66, 66)
+    assert tile_data.shape == (64, 64)
+
+
+def test_illumination_flat():
+    from terracotta.handlers.hillshade import illumination, light_vector
+
+    elevation = np.full((10, 12), 100.)
+    light = light_vector(315, 30)
+    intensity = illumination(elevation, light, 1, 1)
+    assert intensity.shape == (8, 10)
+    np.testing.assert_allclose(intensity, np.sin(np.radians(30)), rtol=1e-6)
+
+
+def test_illumination_slope_direction():
+    from terracotta.handlers.hillshade import illumination, light_vector
+
+    # terrain rising towards the east
+    elevation = np.tile(np.arange(10, dtype='float32'), (10, 1))
+
+    facing_light = illumination(elevation, light_vector(270, 45), 1, 1)
+    facing_away = illumination(elevation, light_vector(90, 45), 1, 1)
+    flat = np.sin(np.radians(45))
+
+    assert np.all(facing_light > flat)
+    assert np.all(facing_away < flat)
+
+
+def test_illumination_nan():
+    from terracotta.handlers.hillshade import illumination, light_vector
+
+    elevation = np.zeros((5, 5))
+    elevation[2, 2] = np.nan
+    light = light_vector(315, 45)
+    intensity = illumination(elevation, light, 1, 1)
+    assert np.all(np.isfinite(intensity))
+    np.testing.assert_allclose(intensity, light[2], rtol=1e-6)
+
+
+@pytest.mark.parametrize('blend_mode', ['hsv', 'overlay', 'soft'])
+def test_blend_range(blend_mode):
+    from terracotta.handlers.hillshade import blend
+
+    rgb = np.random.rand(20, 20, 3)
+    intensity = np.random.rand(20, 20)
+    out = blend(rgb, intensity, blend_mode)
+    assert out.shape == rgb.shape
+    assert np.all((out >= 0) & (out <= 1 + 1e-6))
+
+    # neutral illumination leaves hsv colors unchanged
+    if blend_mode == 'hsv':
+        np.testing.assert_allclose(blend(rgb, np.full((20, 20), 0.5), 'hsv'), rgb, atol=1e-6)
+
+
+def test_hsv_roundtrip():
+    import matplotlib.colors
+    from terracotta.handlers.hillshade import _rgb_to_hsv, _hsv_to_rgb
+
+    rgb = np.random.rand(50, 3)
+    rgb[0] = (0.5, 0.5, 0.5)
+    rgb[1] = 0
+
+    hsv = _rgb_to_hsv(rgb)
+    np.testing.assert_allclose(hsv, matplotlib.colors.rgb_to_hsv(rgb), atol=1e-10)
+    np.testing.assert_allclose(_hsv_to_rgb(hsv), rgb, atol=1e-10)
+
+
+@pytest.mark.parametrize('blend_mode', ['hsv', 'overlay', 'soft'])
+def test_hillshade_handler(use_testdb, raster_file_xyz, blend_mode):
+    import terracotta
+    from terracotta.handlers import hillshade
+    settings = terracotta.get_settings()
+
+    raw_img = hillshade.hillshade(
+        ['val11', 'x', 'val12'], raster_file_xyz, colormap='greys_r', azimuth_degree=315,
+        altitude_degree=45, vertical_exaggeration=10, blend_mode=blend_mode
+    )
+    img_data = np.asarray(Image.open(raw_img))
+    assert img_data.shape == (*settings.DEFAULT_TILE_SIZE, 4)
+
+
+def test_hillshade_preview(use_testdb):
+    import terracotta
+    from terracotta.handlers import hillshade
+    settings = terracotta.get_settings()
+
+    raw_img = hillshade.hillshade(
+        ['val11', 'x', 'val12'], colormap='viridis', azimuth_degree=315,
+        altitude_degree=45, vertical_exaggeration=10, blend_mode='soft'
+    )
+    img_data = np.asarray(Image.open(raw_img))
+    assert img_data.shape == (*settings.DEFAULT_TILE_SIZE, 4)
+
+
+def test_hillshade_invalid_blend_mode(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import hillshade
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        hillshade.hillshade(
+            ['val11', 'x', 'val12'], raster_file_xyz, colormap='greys_r', azimuth_degree=315,
+            altitude_degree=45, vertical_exaggeration=10, blend_mode='foo'
+        )
+
+
+def test_pixel_spacing():
+    import mercantile
+    from terracotta.handlers.hillshade import pixel_spacing
+
+    # equator tile: spacing equals Mercator resolution
+    bounds = mercantile.xy_bounds(mercantile.Tile(x=0, y=0, z=0))
+    dx, dy = pixel_spacing(bounds, (256, 256))
+    assert dx.shape == dy.shape == (256, 1)
+    np.testing.assert_allclose(dx[127:129], 2 * np.pi * 6378137 / 256, rtol=1e-2)
+
+    # spacing shrinks with cos(latitude) and does not depend on tile size beyond resolution
+    tile = mercantile.tile(10.0, 60.0, 12)
+    bounds = mercantile.xy_bounds(tile)
+    dx_256, _ = pixel_spacing(bounds, (256, 256))
+    dx_512, _ = pixel_spacing(bounds, (512, 512))
+    np.testing.assert_allclose(dx_256.mean(), 2 * dx_512.mean(), rtol=1e-6)
+
+    lat = np.radians(mercantile.ul(tile).lat)
+    expected = 2 * np.pi * 6378137 / 2 ** 12 / 256 * np.cos(lat)
+    np.testing.assert_allclose(dx_256[0, 0], expected, rtol=1e-3)
+
+    # rows further north are closer together
+    assert np.all(np.diff(dx_256[:, 0]) > 0)
+    np.testing.assert_allclose(dx_256, pixel_spacing(bounds, (256, 256))[1])
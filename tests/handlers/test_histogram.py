@@ -0,0 +1,12 @@
+import numpy as np
+
+
+def test_histogram_handler(use_testdb):
+    from terracotta.handlers import histogram, datasets, metadata
+    ds = datasets.datasets()[0]
+    hist = histogram.histogram(ds)
+    md = metadata.metadata(ds)
+
+    assert len(hist['bin_edges']) == len(hist['counts']) + 1
+    np.testing.assert_allclose(np.array(hist['bin_edges'])[[0, -1]], md['range'])
+    assert hist['counts'] == md['histogram']
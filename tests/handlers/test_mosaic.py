@@ -0,0 +1,89 @@
+from PIL import Image
+import numpy as np
+
+import pytest
+
+
+def test_composite():
+    from terracotta.handlers.mosaic import composite
+
+    mask_1 = np.array([[False, True], [True, True]])
+    mask_2 = np.array([[False, False], [True, False]])
+    tile_1 = np.ma.masked_array(np.full((2, 2), 1.), mask=mask_1)
+    tile_2 = np.ma.masked_array(np.full((2, 2), 3.), mask=mask_2)
+
+    first = composite([tile_1, tile_2], 'first')
+    np.testing.assert_array_equal(first.filled(0), [[1, 3], [0, 3]])
+    np.testing.assert_array_equal(first.mask, [[False, False], [True, False]])
+
+    last = composite([tile_1, tile_2], 'last')
+    np.testing.assert_array_equal(last.filled(0), [[3, 3], [0, 3]])
+    np.testing.assert_array_equal(last.mask, first.mask)
+
+    mean = composite([tile_1, tile_2], 'mean')
+    np.testing.assert_array_equal(mean.filled(0), [[2, 3], [0, 3]])
+    np.testing.assert_array_equal(mean.mask, first.mask)
+
+    with pytest.raises(ValueError):
+        composite([tile_1, tile_2], 'median')
+
+
+@pytest.mark.parametrize('method', ['first', 'last', 'mean'])
+def test_mosaic_handler(use_testdb, raster_file_xyz, method):
+    import terracotta
+    from terracotta.handlers import mosaic
+    settings = terracotta.get_settings()
+
+    raw_img = mosaic.mosaic(['val21'], raster_file_xyz, method=method)
+    img_data = np.asarray(Image.open(raw_img))
+    assert img_data.shape == settings.DEFAULT_TILE_SIZE
+
+
+def test_mosaic_single_dataset(use_testdb, testdb, raster_file_xyz):
+    import terracotta
+    from terracotta import image
+    from terracotta.xyz import get_tile_data
+    from terracotta.handlers import mosaic
+
+    ds_keys = ['val11', 'x', 'val12']
+
+    driver = terracotta.get_driver(testdb)
+    with driver.connect():
+        tile_data = get_tile_data(driver, ds_keys, tile_xyz=raster_file_xyz, tile_size=(64, 64))
+        stretch_range = driver.get_metadata(ds_keys)['range']
+
+    expected = image.to_uint8(tile_data, *stretch_range)
+
+    mosaic_img = np.asarray(Image.open(
+        mosaic.mosaic(['val11'], raster_file_xyz, tile_size=(64, 64))
+    ))
+    np.testing.assert_array_equal(mosaic_img, np.ma.filled(expected, 0))
+
+
+def test_mosaic_out_of_bounds(use_testdb):
+    import terracotta
+    from terracotta.handlers import mosaic
+
+    with pytest.raises(terracotta.exceptions.TileOutOfBoundsError):
+        mosaic.mosaic(['val21'], (0, 0, 10))
+
+
+def test_mosaic_invalid_keys(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import mosaic
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        mosaic.mosaic([], raster_file_xyz)
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        mosaic.mosaic(['val21', 'x', 'val22'], raster_file_xyz)
+
+
+def test_mosaic_too_many_datasets(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import mosaic
+
+    terracotta.update_settings(MAX_MOSAIC_DATASETS=2)
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        mosaic.mosaic(['val21'], raster_file_xyz)
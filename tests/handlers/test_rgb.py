@@ -12,6 +12,14 @@ def test_rgb_handler(use_testdb, raster_file, raster_file_xyz):
     assert img_data.shape == (*terracotta.get_settings().DEFAULT_TILE_SIZE, 3)
 
 
+@pytest.mark.parametrize('image_format', ['png', 'webp', 'jpeg'])
+def test_rgb_image_format(use_testdb, raster_file_xyz, image_format):
+    from terracotta.handlers import rgb
+    raw_img = rgb.rgb(['val21', 'x'], ['val22', 'val23', 'val24'], raster_file_xyz,
+                      image_format=image_format)
+    assert Image.open(raw_img).format == image_format.upper()
+
+
 def test_rgb_tile_size(use_testdb, raster_file, raster_file_xyz):
     from terracotta.handlers import rgb
     raw_img = rgb.rgb(['val21', 'x'], ['val22', 'val23', 'val24'], raster_file_xyz,
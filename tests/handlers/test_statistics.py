@@ -0,0 +1,79 @@
+import numpy as np
+
+import pytest
+
+
+def test_statistics_handler(use_testdb, raster_file_xyz):
+    from terracotta.handlers import datasets, statistics
+    ds = datasets.datasets()
+
+    for keys in ds:
+        stats = statistics.statistics(list(keys.values()), raster_file_xyz)
+        assert 0 < stats['valid_percentage'] <= 100
+        assert stats['range'][0] <= stats['mean'] <= stats['range'][1]
+        assert len(stats['percentiles']) == 99
+        assert np.all(np.diff(stats['percentiles']) >= 0)
+
+
+def test_statistics_handler_bounds(use_testdb, testdb):
+    import terracotta
+    from terracotta.handlers import statistics
+
+    keys = ['val11', 'x', 'val12']
+    driver = terracotta.get_driver(str(testdb))
+    west, south, east, north = driver.get_metadata(keys)['bounds']
+
+    full_stats = statistics.statistics(keys)
+    bbox_stats = statistics.statistics(keys, bounds=(west, south, east, north))
+    np.testing.assert_allclose(full_stats['range'], bbox_stats['range'], rtol=1e-2)
+
+    # a sub-region has a narrower range (up to resampling effects)
+    sub_stats = statistics.statistics(
+        keys, bounds=(west, south, (west + east) / 2, (south + north) / 2)
+    )
+    tolerance = 0.01 * (full_stats['range'][1] - full_stats['range'][0])
+    assert sub_stats['range'][0] >= full_stats['range'][0] - tolerance
+    assert sub_stats['range'][1] <= full_stats['range'][1] + tolerance
+
+
+def test_statistics_handler_out_of_bounds(use_testdb):
+    from terracotta.handlers import statistics
+
+    stats = statistics.statistics(['val11', 'x', 'val12'], (10, 0, 0))
+    assert stats['valid_percentage'] == 0
+    assert stats['range'] is None
+    assert stats['percentiles'] is None
+
+
+def test_statistics_handler_invalid(use_testdb):
+    from terracotta import exceptions
+    from terracotta.handlers import statistics
+
+    with pytest.raises(exceptions.InvalidArgumentsError):
+        statistics.statistics(['val11', 'x', 'val12'], (10, 0, 0), bounds=(0, 0, 1, 1))
+
+    with pytest.raises(exceptions.InvalidArgumentsError):
+        statistics.statistics(['val11', 'x', 'val12'], bounds=(1, 0, 0, 1))
+
+
+def test_statistics_handler_partial_coverage(use_testdb, testdb, raster_file_xyz_lowzoom):
+    import terracotta
+    from terracotta.handlers import statistics
+
+    keys = ['val11', 'x', 'val12']
+    driver = terracotta.get_driver(str(testdb))
+    west, south, east, north = driver.get_metadata(keys)['bounds']
+    full_stats = statistics.statistics(keys)
+
+    # dataset covers much less than 1% of these regions
+    width, height = east - west, north - south
+    large_bounds = (west - 10 * width, south - 10 * height, east, north)
+
+    for stats in (
+        statistics.statistics(keys, raster_file_xyz_lowzoom),
+        statistics.statistics(keys, bounds=large_bounds),
+        statistics.statistics(keys, bounds=(-180, -90, 180, 90)),
+    ):
+        assert 0 < stats['valid_percentage'] < 1
+        np.testing.assert_allclose(full_stats['range'], stats['range'], rtol=1e-2)
+        assert len(stats['percentiles']) == 99
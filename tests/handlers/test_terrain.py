@@ -0,0 +1,110 @@
+from PIL import Image
+import numpy as np
+
+import pytest
+
+
+def decode_mapbox(rgb):
+    rgb = rgb.astype('float64')
+    return -10000 + (rgb[..., 0] * 256 * 256 + rgb[..., 1] * 256 + rgb[..., 2]) * 0.1
+
+
+def decode_terrarium(rgb):
+    rgb = rgb.astype('float64')
+    return rgb[..., 0] * 256 + rgb[..., 1] + rgb[..., 2] / 256 - 32768
+
+
+@pytest.mark.parametrize('encoding,decode,precision', [
+    ('mapbox', decode_mapbox, 0.05),
+    ('terrarium', decode_terrarium, 1 / 512),
+])
+def test_encode_elevation(encoding, decode, precision):
+    from terracotta.handlers.terrain import encode_elevation
+
+    elevation = np.array([[-420.3, 0., 0.05, 1.], [1234.56, 8848.86, -9000., 12345.6]])
+    rgba = encode_elevation(elevation, encoding)
+    assert rgba.shape == (*elevation.shape, 4)
+    assert rgba.dtype == np.uint8
+    np.testing.assert_allclose(decode(rgba), elevation, atol=precision + 1e-9)
+    assert np.all(rgba[..., 3] == 255)
+
+
+def test_encode_elevation_reference():
+    from terracotta.handlers.terrain import encode_elevation
+
+    # reference values computed with the formulas from the format specifications
+    elevation = np.array([[0., 100.]])
+    np.testing.assert_array_equal(
+        encode_elevation(elevation, 'mapbox'), [[[1, 134, 160, 255], [1, 138, 136, 255]]]
+    )
+    np.testing.assert_array_equal(
+        encode_elevation(elevation, 'terrarium'), [[[128, 0, 0, 255], [128, 100, 0, 255]]]
+    )
+
+
+def test_encode_elevation_nodata():
+    from terracotta.handlers.terrain import encode_elevation
+
+    elevation = np.ma.masked_array([[1., 2.], [np.nan, -1e6]], mask=[[True, False], [False, False]])
+    rgba = encode_elevation(elevation)
+
+    # masked and invalid pixels are transparent
+    assert np.all(rgba[0, 0] == 0)
+    assert np.all(rgba[1, 0] == 0)
+
+    # too low elevation is clipped to the lowest representable value, but stays opaque
+    np.testing.assert_array_equal(rgba[1, 1], [0, 0, 0, 255])
+    assert rgba[0, 1, 3] == 255
+    np.testing.assert_allclose(decode_mapbox(rgba[1, 1]), -10000)
+
+
+def test_encode_elevation_invalid():
+    from terracotta.handlers.terrain import encode_elevation
+
+    with pytest.raises(ValueError):
+        encode_elevation(np.zeros((2, 2)), 'foo')
+
+
+@pytest.mark.parametrize('encoding', ['mapbox', 'terrarium'])
+def test_terrain_handler(use_testdb, raster_file_xyz, encoding):
+    import terracotta
+    from terracotta.handlers import terrain
+    settings = terracotta.get_settings()
+
+    raw_img = terrain.terrain(['val11', 'x', 'val12'], raster_file_xyz, encoding=encoding)
+    img = Image.open(raw_img)
+    assert img.format == 'PNG'
+    assert img.mode == 'RGBA'
+    assert np.asarray(img).shape == (*settings.DEFAULT_TILE_SIZE, 4)
+
+
+def test_terrain_handler_roundtrip(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta import xyz
+    from terracotta.handlers import terrain
+    settings = terracotta.get_settings()
+    keys = ['val11', 'x', 'val12']
+
+    raw_img = terrain.terrain(keys, raster_file_xyz)
+    rgba = np.asarray(Image.open(raw_img))
+
+    driver = terracotta.get_driver(settings.DRIVER_PATH)
+    with driver.connect():
+        tile_data = xyz.get_tile_data(
+            driver, keys, raster_file_xyz, tile_size=settings.DEFAULT_TILE_SIZE
+        )
+
+    valid = ~np.ma.getmaskarray(tile_data)
+    assert np.any(~valid)
+    expected = np.clip(tile_data.data[valid], -10000, None)
+    np.testing.assert_allclose(decode_mapbox(rgba)[valid], expected, atol=0.05 + 1e-6)
+    assert np.all(rgba[valid, 3] == 255)
+    assert np.all(rgba[~valid, 3] == 0)
+
+
+def test_terrain_handler_invalid_encoding(use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers import terrain
+
+    with pytest.raises(terracotta.exceptions.InvalidArgumentsError):
+        terrain.terrain(['val11', 'x', 'val12'], raster_file_xyz, encoding='foo')
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 from click.testing import CliRunner
@@ -98,3 +100,173 @@ def test_serve_find_socket(raster_file):
         runner = CliRunner()
         result = runner.invoke(cli.cli, ['serve', '-r', input_pattern])
         assert result.exit_code == 0
+
+
+@pytest.mark.parametrize('args', [
+    ['--workers', '2'],
+    ['--threads', '4'],
+    ['--workers', '2', '--threads', '2'],
+])
+def test_serve_production(testdb, args):
+    from terracotta.scripts import cli
+
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['serve', '-d', str(testdb), *args])
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.parametrize('flag', ['--debug', '--profile'])
+def test_serve_production_dev_flags(testdb, flag):
+    from terracotta.scripts import cli
+
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['serve', '-d', str(testdb), '--workers', '2', flag])
+    assert result.exit_code != 0
+    assert 'development server' in result.output
+
+
+def test_serve_invalid_workers(testdb):
+    from terracotta.scripts import cli
+
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['serve', '-d', str(testdb), '--workers', '0'])
+    assert result.exit_code != 0
+
+
+def test_pooled_server(use_testdb):
+    import json
+    import threading
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    from terracotta.server import create_app
+    from terracotta.scripts.wsgi_server import PooledWSGIServer, preload
+
+    preload()
+
+    server = PooledWSGIServer('localhost', 0, create_app(), threads=4)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+
+    def get_keys(_):
+        with urllib.request.urlopen(f'http://localhost:{server.server_port}/keys') as response:
+            return json.loads(response.read())['keys']
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(get_keys, range(16)))
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+    assert len(results) == 16
+    assert all(result == results[0] for result in results)
+    assert len(results[0]) == 3
+
+
+def test_pooled_server_tiles(use_testdb, raster_file_xyz, monkeypatch):
+    import threading
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    from terracotta.drivers import raster_base
+    from terracotta.server import create_app
+    from terracotta.scripts.wsgi_server import PooledWSGIServer
+
+    created_executors = []
+
+    def create_executor():
+        executor = ThreadPoolExecutor(max_workers=1)
+        created_executors.append(executor)
+        return executor
+
+    monkeypatch.setattr(raster_base.context, 'executor', None)
+    monkeypatch.setattr(raster_base, 'create_executor', create_executor)
+
+    server = PooledWSGIServer('localhost', 0, create_app(), threads=4)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+
+    x, y, z = raster_file_xyz
+
+    def get_tile(tile_size):
+        # distinct tile sizes bypass the raster cache
+        url = (
+            f'http://localhost:{server.server_port}/rgb/val21/x/{z}/{x}/{y}.png'
+            f'?r=val22&g=val23&b=val24&tile_size=[{tile_size},{tile_size}]'
+        )
+        with urllib.request.urlopen(url) as response:
+            return response.status
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(get_tile, range(64, 80)))
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+        for executor in created_executors:
+            executor.shutdown()
+
+    assert results == [200] * 16
+    assert len(created_executors) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_run_embedded_respawn(use_testdb):
+    import json
+    import signal
+    import multiprocessing
+    import urllib.request
+
+    from terracotta.server import create_app
+    from terracotta.scripts import wsgi_server
+    from terracotta.scripts.http_utils import find_open_port
+
+    ctx = multiprocessing.get_context('fork')
+    spawned = ctx.Queue()
+    port = find_open_port(range(5100, 5200))
+    assert port is not None
+
+    def run_master():
+        spawn_worker = wsgi_server._spawn_worker
+
+        def recording_spawn_worker(server):
+            pid = spawn_worker(server)
+            spawned.put(pid)
+            return pid
+
+        wsgi_server._spawn_worker = recording_spawn_worker
+        wsgi_server.run_embedded(create_app(), 'localhost', port, workers=2, threads=2)
+
+    def get_keys():
+        with urllib.request.urlopen(f'http://localhost:{port}/keys', timeout=10) as response:
+            return json.loads(response.read())['keys']
+
+    master = ctx.Process(target=run_master)
+    master.start()
+
+    try:
+        workers = [spawned.get(timeout=10) for _ in range(2)]
+        assert get_keys()
+
+        # dead workers are replaced
+        os.kill(workers[0], signal.SIGKILL)
+        respawned = spawned.get(timeout=10)
+        assert respawned not in workers
+
+        for _ in range(8):
+            assert get_keys()
+
+    finally:
+        # graceful shutdown of master and workers
+        os.kill(master.pid, signal.SIGTERM)
+        master.join(timeout=10)
+
+    assert master.exitcode == 0
+
+    for pid in (workers[1], respawned):
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
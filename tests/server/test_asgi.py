@@ -0,0 +1,178 @@
+import asyncio
+from io import BytesIO
+
+from PIL import Image
+import numpy as np
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def asgi_app():
+    from terracotta.server.asgi import create_asgi_app
+    return create_asgi_app()
+
+
+def asgi_get(app, path, query_string=''):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string.encode('latin-1'),
+        'headers': [(b'host', b'localhost'), (b'origin', b'http://example.com')],
+        'client': ('127.0.0.1', 12345),
+        'server': ('localhost', 5000),
+    }
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+
+    start, body = messages
+    assert start['type'] == 'http.response.start'
+    assert body['type'] == 'http.response.body'
+    return start['status'], dict(start['headers']), body['body']
+
+
+def test_asgi_metadata(asgi_app, use_testdb):
+    import json
+    status, headers, body = asgi_get(asgi_app, '/keys')
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert len(json.loads(body)['keys']) == 3
+
+
+def test_asgi_rgb(asgi_app, use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.server import create_app
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    path = f'/rgb/val21/x/{z}/{x}/{y}.png'
+    query = 'r=val22&g=val23&b=val24'
+    status, headers, body = asgi_get(asgi_app, path, query)
+    assert status == 200
+    assert headers[b'content-type'] == b'image/png'
+
+    img = Image.open(BytesIO(body))
+    assert np.asarray(img).shape == (*settings.DEFAULT_TILE_SIZE, 3)
+
+    # responses are identical to the WSGI app
+    with create_app().test_client() as client:
+        assert client.get(f'{path}?{query}').data == body
+
+
+def test_asgi_prefetch(asgi_app, use_testdb, raster_file_xyz, monkeypatch):
+    from terracotta import xyz
+
+    calls = []
+    get_tile_data = xyz.get_tile_data
+
+    def patched_get_tile_data(*args, **kwargs):
+        calls.append(kwargs.get('asynchronous', False))
+        return get_tile_data(*args, **kwargs)
+
+    monkeypatch.setattr(xyz, 'get_tile_data', patched_get_tile_data)
+
+    x, y, z = raster_file_xyz
+    status, _, body = asgi_get(
+        asgi_app, f'/rgb/val21/x/{z}/{x}/{y}.png', 'r=val22&g=val23&b=val24&tile_size=[64,64]'
+    )
+    assert status == 200
+    assert np.asarray(Image.open(BytesIO(body))).shape == (64, 64, 3)
+
+    # three asynchronous prefetches, then three reads by the handler
+    assert calls == [True] * 6
+
+
+@pytest.mark.parametrize('path,query', [
+    ('/hillshade/val11/x/val12/{z}/{x}/{y}.png', ''),
+    ('/hillshade/val11/x/val12/preview.png', ''),
+    ('/discrete/val11/x/val12/{z}/{x}/{y}.png', ''),
+    ('/data/val11/x/val12/{z}/{x}/{y}', ''),
+    ('/terrain/val11/x/val12/{z}/{x}/{y}.png', ''),
+    ('/mosaic/val21/{z}/{x}/{y}.png', ''),
+    ('/statistics/val11/x/val12/{z}/{x}/{y}', 'tile_size=[64,64]'),
+    ('/statistics/val11/x/val12', 'bbox=[{w},{s},{e},{n}]'),
+    ('/statistics/val11/x/val12', ''),
+])
+def test_asgi_prefetch_routes(asgi_app, use_testdb, raster_file_xyz, monkeypatch, path, query):
+    import mercantile
+    import terracotta
+    from terracotta.drivers import raster_base
+    from terracotta.server import asgi
+
+    settings = terracotta.get_settings()
+    terracotta.get_driver(settings.DRIVER_PATH)._raster_cache.clear()
+
+    submitted = []
+    submitted_before_handler = []
+
+    submit_to_executor = raster_base.submit_to_executor
+    call_wsgi = asgi._call_wsgi
+
+    def patched_submit_to_executor(*args, **kwargs):
+        submitted.append(args)
+        return submit_to_executor(*args, **kwargs)
+
+    def patched_call_wsgi(*args, **kwargs):
+        submitted_before_handler.extend(submitted)
+        return call_wsgi(*args, **kwargs)
+
+    monkeypatch.setattr(raster_base, 'submit_to_executor', patched_submit_to_executor)
+    monkeypatch.setattr(asgi, '_call_wsgi', patched_call_wsgi)
+
+    x, y, z = raster_file_xyz
+    w, s, e, n = mercantile.bounds(x, y, z)
+    path = path.format(x=x, y=y, z=z)
+    query = query.format(w=w, s=s, e=e, n=n)
+
+    status, _, _ = asgi_get(asgi_app, path, query)
+    assert status == 200
+
+    # all raster reads are done before the handler runs, which finds them in the cache
+    assert submitted
+    assert submitted == submitted_before_handler
+
+
+def test_asgi_errors(asgi_app, use_testdb, raster_file_xyz):
+    x, y, z = raster_file_xyz
+
+    status, _, _ = asgi_get(asgi_app, f'/rgb/val21/x/{z}/{x}/{y}.png', 'r=val22')
+    assert status == 400
+
+    status, _, _ = asgi_get(
+        asgi_app, f'/rgb/val21/NONEXISTING/{z}/{x}/{y}.png', 'r=val22&g=val23&b=val24'
+    )
+    assert status == 404
+
+    status, _, body = asgi_get(asgi_app, '/rgb/val21/x/10/0/0.png', 'r=val22&g=val23&b=val24')
+    assert status == 200
+    assert np.all(np.asarray(Image.open(BytesIO(body))) == 0)
+
+    status, _, _ = asgi_get(asgi_app, '/foo')
+    assert status == 404
+
+
+def test_asgi_lifespan(asgi_app):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
@@ -39,6 +39,34 @@ def test_get_metadata(client, use_testdb):
     assert ['extra_data'] == json.loads(rv.data)['metadata']
 
 
+def test_get_histogram(client, use_testdb):
+    rv = client.get('/histogram/val11/x/val12/')
+    assert rv.status_code == 200
+    payload = json.loads(rv.data)
+    assert len(payload['bin_edges']) == len(payload['counts']) + 1
+    assert 'histogram' not in json.loads(client.get('/metadata/val11/x/val12/').data)
+
+
+def test_get_statistics(client, use_testdb, raster_file_xyz):
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/statistics/val11/x/val12/{z}/{x}/{y}?tile_size=[64,64]')
+    assert rv.status_code == 200
+    assert len(json.loads(rv.data)['percentiles']) == 99
+
+    rv = client.get('/statistics/val11/x/val12/10/0/0')
+    assert rv.status_code == 200
+    assert json.loads(rv.data)['range'] is None
+
+
+def test_get_statistics_bounds(client, use_testdb):
+    rv = client.get('/statistics/val11/x/val12/')
+    assert rv.status_code == 200
+    assert len(json.loads(rv.data)['range']) == 2
+
+    rv = client.get('/statistics/val11/x/val12/?bbox=[0,0,1]')
+    assert rv.status_code == 400
+
+
 def test_get_metadata_nonexisting(client, use_testdb):
     rv = client.get('/metadata/val11/x/NONEXISTING/')
     assert rv.status_code == 404
@@ -52,6 +80,19 @@ def test_get_datasets(client, use_testdb):
     assert OrderedDict([('key1', 'val11'), ('akey', 'x'), ('key2', 'val12')]) in datasets
 
 
+def test_get_datasets_bbox(client, use_testdb):
+    rv = client.get('/datasets?bbox=[-180,-90,180,90]')
+    assert rv.status_code == 200
+    assert len(json.loads(rv.data)['datasets']) == 4
+
+    rv = client.get('/datasets?bbox=[0,0,1e-6,1e-6]')
+    assert rv.status_code == 200
+    assert json.loads(rv.data)['datasets'] == []
+
+    rv = client.get('/datasets?bbox=[0,0,1]')
+    assert rv.status_code == 400
+
+
 def test_get_datasets_pagination(client, use_testdb):
     # no page (implicit 0)
     rv = client.get('/datasets?limit=2')
@@ -236,12 +277,111 @@ def test_get_singleband_out_of_bounds(client, use_testdb):
     assert np.all(np.asarray(img) == 0)
 
 
+def test_get_data(client, use_testdb, raster_file_xyz):
+    import terracotta
+    from terracotta.handlers.data import decode_tile
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/data/val11/x/val12/{z}/{x}/{y}?compression=none&dtype=float16')
+    assert rv.status_code == 200
+    assert rv.mimetype == 'application/octet-stream'
+
+    decoded = decode_tile(rv.data)
+    assert decoded.shape == settings.DEFAULT_TILE_SIZE
+    assert decoded.dtype == np.dtype('float16')
+
+    rv = client.get(f'/data/val11/x/val12/{z}/{x}/{y}?dtype=foo')
+    assert rv.status_code == 400
+
+    # out of bounds tiles are fully masked
+    rv = client.get('/data/val11/x/val12/10/0/0')
+    assert rv.status_code == 200
+    assert decode_tile(rv.data).mask.all()
+
+
+def test_get_terrain(client, use_testdb, raster_file_xyz):
+    import terracotta
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/terrain/val11/x/val12/{z}/{x}/{y}.png?encoding=terrarium')
+    assert rv.status_code == 200
+
+    img = Image.open(BytesIO(rv.data))
+    assert np.asarray(img).shape == (*settings.DEFAULT_TILE_SIZE, 4)
+
+    rv = client.get(f'/terrain/val11/x/val12/{z}/{x}/{y}.png?encoding=foo')
+    assert rv.status_code == 400
+
+    # only lossless encoding is supported
+    rv = client.get(f'/terrain/val11/x/val12/{z}/{x}/{y}.webp')
+    assert rv.status_code == 404
+
+
+def test_get_mosaic(client, use_testdb, raster_file_xyz):
+    import terracotta
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/mosaic/val21/{z}/{x}/{y}.png?method=mean&colormap=viridis')
+    assert rv.status_code == 200
+
+    img = Image.open(BytesIO(rv.data))
+    assert np.asarray(img).shape[:2] == settings.DEFAULT_TILE_SIZE
+
+    rv = client.get(f'/mosaic/val21/{z}/{x}/{y}.png?method=median')
+    assert rv.status_code == 400
+
+    rv = client.get('/mosaic/val21/10/0/0.png')
+    assert rv.status_code == 200
+    assert np.all(np.asarray(Image.open(BytesIO(rv.data))) == 0)
+
+
 def test_get_singleband_unknown_cmap(client, use_testdb, raster_file_xyz):
     x, y, z = raster_file_xyz
     rv = client.get(f'/singleband/val11/x/val12/{z}/{x}/{y}.png?colormap=UNKNOWN')
     assert rv.status_code == 400
 
 
+def test_get_discrete(client, use_testdb, raster_file_xyz):
+    import terracotta
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/discrete/val11/x/val12/{z}/{x}/{y}.png?colormap=Greys&n_classes=4')
+    assert rv.status_code == 200
+
+    img = Image.open(BytesIO(rv.data))
+    assert np.asarray(img).shape == settings.DEFAULT_TILE_SIZE
+
+    rv = client.get(f'/discrete/val11/x/val12/{z}/{x}/{y}.png?n_classes=1000')
+    assert rv.status_code == 400
+
+    # JSON-quoted names and colormaps that are only available in matplotlib
+    for colormap in ('"Greys"', 'turbo'):
+        rv = client.get(f'/discrete/val11/x/val12/{z}/{x}/{y}.png?colormap={colormap}')
+        assert rv.status_code == 200
+
+    rv = client.get(f'/discrete/val11/x/val12/{z}/{x}/{y}.png?colormap=foo')
+    assert rv.status_code == 400
+
+
+def test_get_hillshade(client, use_testdb, raster_file_xyz):
+    import terracotta
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/hillshade/val11/x/val12/{z}/{x}/{y}.png?colormap=Greys_r&blend_mode=hsv')
+    assert rv.status_code == 200
+
+    img = Image.open(BytesIO(rv.data))
+    assert np.asarray(img).shape == (*settings.DEFAULT_TILE_SIZE, 4)
+
+    rv = client.get(f'/hillshade/val11/x/val12/{z}/{x}/{y}.png?blend_mode=foo')
+    assert rv.status_code == 400
+
+
 def test_get_rgb(client, use_testdb, raster_file_xyz):
     import terracotta
     settings = terracotta.get_settings()
@@ -254,6 +394,49 @@ def test_get_rgb(client, use_testdb, raster_file_xyz):
     assert np.asarray(img).shape == (*settings.DEFAULT_TILE_SIZE, 3)
 
 
+@pytest.mark.parametrize('extension,image_format', [
+    ('png', 'PNG'), ('webp', 'WEBP'), ('jpg', 'JPEG'), ('jpeg', 'JPEG')
+])
+def test_get_rgb_image_format(client, use_testdb, raster_file_xyz, extension, image_format):
+    import terracotta
+    settings = terracotta.get_settings()
+
+    x, y, z = raster_file_xyz
+    rv = client.get(f'/rgb/val21/x/{z}/{x}/{y}.{extension}?r=val22&g=val23&b=val24')
+    assert rv.status_code == 200
+    assert rv.mimetype == f'image/{image_format.lower()}'
+
+    img = Image.open(BytesIO(rv.data))
+    assert img.format == image_format
+    assert img.size == settings.DEFAULT_TILE_SIZE[::-1]
+
+    rv = client.get(f'/rgb/val21/x/{z}/{x}/{y}.gif?r=val22&g=val23&b=val24')
+    assert rv.status_code == 404
+
+
+@pytest.mark.parametrize('extension,image_format', [('webp', 'WEBP'), ('jpg', 'JPEG')])
+def test_get_out_of_bounds_image_format(client, use_testdb, extension, image_format):
+    rv = client.get(f'/rgb/val21/x/10/0/0.{extension}?r=val22&g=val23&b=val24')
+    assert rv.status_code == 200
+    assert Image.open(BytesIO(rv.data)).format == image_format
+
+
+def test_get_out_of_bounds_cache_headers(client, use_testdb):
+    import terracotta
+
+    rv = client.get('/rgb/val21/x/10/0/0.png?r=val22&g=val23&b=val24')
+    assert rv.status_code == 200
+    assert rv.cache_control.public
+    assert rv.cache_control.max_age == terracotta.get_settings().EMPTY_TILE_MAX_AGE
+
+    terracotta.update_settings(EMPTY_TILE_RESPONSE='no-content', EMPTY_TILE_MAX_AGE=0)
+
+    rv = client.get('/rgb/val21/x/10/0/0.png?r=val22&g=val23&b=val24')
+    assert rv.status_code == 204
+    assert not rv.data
+    assert rv.cache_control.max_age is None
+
+
 def test_get_rgb_preview(client, use_testdb):
     import terracotta
     settings = terracotta.get_settings()
@@ -422,3 +605,11 @@ def test_get_spec(client):
     rv = client.get('/apidoc')
     assert rv.status_code == 200
     assert b'Terracotta' in rv.data
+
+
+def test_spec_compat(flask_app):
+    from terracotta.server.flask_api import SPEC, get_spec
+
+    with flask_app.app_context():
+        assert SPEC.to_dict() == get_spec().to_dict()
+        assert '/keys' in SPEC.to_dict()['paths']
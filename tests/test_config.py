@@ -44,6 +44,11 @@ def test_env_config_invalid(monkeypatch):
         with pytest.raises(ValueError):
             config.parse_config()
 
+    with monkeypatch.context() as m:
+        m.setenv('TC_MAX_MOSAIC_DATASETS', '0')  # mosaics need at least one dataset
+        with pytest.raises(ValueError):
+            config.parse_config()
+
     assert True
 
 
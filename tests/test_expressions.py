@@ -262,3 +262,154 @@ def test_out_dtype():
 
     assert isinstance(res, np.ma.MaskedArray)
     assert res.dtype == np.dtype('int64')
+
+
+def test_compile_expression_cached():
+    from terracotta.expressions import compile_expression, evaluate_expression
+
+    compiled = compile_expression('(v1 - v2) / (v1 + v2)')
+    assert compile_expression('(v1 - v2) / (v1 + v2)') is compiled
+    assert compiled.operand_names == {'v1', 'v2'}
+
+    np.testing.assert_array_equal(
+        compiled(OPERANDS),
+        evaluate_expression('(v1 - v2) / (v1 + v2)', OPERANDS)
+    )
+
+    # compiled expressions are reusable with different operands
+    other_operands = {'v1': np.ones(3), 'v2': np.zeros(3)}
+    np.testing.assert_array_equal(compiled(other_operands), np.ones(3))
+
+
+def test_compile_expression_invalid():
+    from terracotta.expressions import compile_expression
+
+    # validation does not need operands
+    with pytest.raises(ValueError) as raised_exc:
+        compile_expression('v1.mean()')
+
+    assert 'not allowed in expressions' in str(raised_exc.value)
+
+
+def test_no_thread_per_evaluation(monkeypatch):
+    import concurrent.futures
+    from terracotta.expressions import evaluate_expression
+
+    def no_executor(*args, **kwargs):
+        raise AssertionError('expression evaluation should not create thread pools')
+
+    monkeypatch.setattr(concurrent.futures, 'ThreadPoolExecutor', no_executor)
+    evaluate_expression('v1 * 2', OPERANDS)
+
+
+def test_integer_power_overflow():
+    from terracotta.expressions import evaluate_expression
+
+    # must fail fast instead of computing a huge integer
+    with pytest.raises(ValueError) as raised_exc:
+        evaluate_expression('v1 * 10 ** 10 ** 10', OPERANDS)
+
+    assert 'unexpected error' in str(raised_exc.value)
+
+
+@pytest.mark.parametrize('case', [
+    ('(v1 - v2) / (v1 + v2)', True),
+    ('2.5 * (v1 - v2) / (v1 + 6 * v2 + 1)', True),
+    ('sqrt(abs(v1 - v2)) * -log(v1)', True),
+    ('(v1 < 0.5) & (v2 > 0.5)', True),
+    ('maximum(v1, v2)', True),
+    ('pi', False),  # no operands
+    ('where(v1 > v2, v1, v2)', False),  # mask operation
+    ('setmask(v1, nomask)', False),
+    ('maximum(log(v1), 0)', False),  # domain error would be absorbed
+    ('v1 / v2 > 1', False),
+])
+def test_fusable(case):
+    from terracotta.expressions import compile_expression
+
+    expr, fusable = case
+    assert compile_expression(expr).fusable is fusable
+
+
+@pytest.mark.parametrize('expr', [
+    '(v1 - v2) / (v1 + v2)',
+    'sqrt(v1 - 2) * -log(v2 - 5)',
+    'minimum(v1, v2) % 3',
+    '(v1 > 0.5) | (v2 <= 3)',
+])
+def test_fused_matches_masked(monkeypatch, expr):
+    import terracotta.expressions
+    from terracotta.expressions import compile_expression
+
+    # force several chunks
+    monkeypatch.setattr(terracotta.expressions, 'FUSED_CHUNK_SIZE', 100)
+
+    np.random.seed(0)
+    operands = {
+        'v1': np.ma.masked_less(10 * np.random.rand(64, 64), 1),
+        'v2': np.ma.masked_array(10 * np.random.rand(64, 64), mask=np.random.rand(64, 64) < 0.1),
+    }
+
+    compiled = compile_expression(expr)
+    assert compiled.fusable
+
+    with np.errstate(all='ignore'):
+        expected = np.ma.masked_invalid(compiled._evaluator(
+            terracotta.expressions.EvaluationContext(operands, float('inf'))
+        ))
+
+    result = compiled(operands)
+    np.testing.assert_array_equal(result.mask, expected.mask)
+    np.testing.assert_allclose(result.compressed(), expected.compressed())
+    assert result.dtype == expected.dtype
+
+
+@pytest.mark.parametrize('expr', ['v1 % v2', '2 * (v1 % v2) + 1', 'v1 % 0'])
+@pytest.mark.parametrize('v2_shape', [(64, 64), (64,)])  # chunked and broadcast
+def test_fused_integer_mod_by_zero(monkeypatch, expr, v2_shape):
+    import terracotta.expressions
+    from terracotta.expressions import compile_expression
+
+    monkeypatch.setattr(terracotta.expressions, 'FUSED_CHUNK_SIZE', 100)
+
+    np.random.seed(0)
+    operands = {
+        'v1': np.ma.masked_array(np.random.randint(-10, 10, (64, 64))),
+        'v2': np.ma.masked_array(
+            np.random.randint(-3, 3, v2_shape), mask=np.random.rand(*v2_shape) < 0.1
+        ),
+    }
+
+    compiled = compile_expression(expr)
+    assert compiled.fusable
+
+    with np.errstate(all='ignore'):
+        expected = np.ma.masked_invalid(compiled._evaluator(
+            terracotta.expressions.EvaluationContext(operands, float('inf'))
+        ))
+
+    result = compiled(operands)
+    assert np.any(result.mask)
+    np.testing.assert_array_equal(result.mask, expected.mask)
+    np.testing.assert_array_equal(result.compressed(), expected.compressed())
+    assert result.dtype == expected.dtype
+
+
+def test_numexpr(monkeypatch):
+    numexpr = pytest.importorskip('numexpr')
+    from terracotta.expressions import evaluate_expression
+
+    calls = []
+
+    def evaluate(*args, **kwargs):
+        calls.append(args)
+        return numexpr_evaluate(*args, **kwargs)
+
+    numexpr_evaluate = numexpr.evaluate
+    monkeypatch.setattr(numexpr, 'evaluate', evaluate)
+
+    res = evaluate_expression('(v2 - v1) / (v2 + v1)', OPERANDS)
+    assert calls
+    np.testing.assert_array_equal(
+        res, (OPERANDS['v2'] - OPERANDS['v1']) / (OPERANDS['v2'] + OPERANDS['v1'])
+    )
@@ -32,6 +32,22 @@ def test_array_to_png_singleband_invalid():
     assert 'must have shape' in str(exc.value)
 
 
+def test_array_to_png_palette_cached():
+    from terracotta import image
+
+    testdata = np.random.randint(0, 256, size=(16, 16), dtype='uint8')
+    explicit_cmap = [(255, 0, 0, 255), (0, 0, 255, 127)]
+
+    for cmap, cached_func in (
+        ('viridis', image._named_colormap_palette),
+        (explicit_cmap, image._explicit_colormap_palette)
+    ):
+        first = image.array_to_png(testdata, colormap=cmap).read()
+        hits = cached_func.cache_info().hits
+        assert image.array_to_png(testdata, colormap=cmap).read() == first
+        assert cached_func.cache_info().hits == hits + 1
+
+
 def test_array_to_png_rgb():
     from terracotta import image
     testdata = np.random.randint(0, 256, size=(256, 512, 3), dtype='uint8')
@@ -61,6 +77,152 @@ def test_array_to_png_rgb_invalid():
     assert '2 or 3 dimensions' in str(exc.value)
 
 
+@pytest.mark.parametrize('encoder', ['pil', 'spng', 'fast'])
+@pytest.mark.parametrize('compress_level', [0, 1, 9])
+@pytest.mark.parametrize('colormap', [None, 'viridis', [(255, 0, 0, 255), (0, 0, 255, 127)]])
+def test_png_encoders_singleband(encoder, compress_level, colormap):
+    import terracotta
+    from terracotta import image
+
+    if encoder == 'spng' and not image.has_spng:
+        pytest.skip('pyspng encoder not available')
+
+    testdata = np.random.randint(0, 3, size=(64, 128), dtype='uint8')
+    expected = np.asarray(Image.open(image.array_to_png(testdata, colormap)).convert('RGBA'))
+
+    terracotta.update_settings(PNG_ENCODER=encoder, PNG_COMPRESS_LEVEL=compress_level)
+    out_img = Image.open(image.array_to_png(testdata, colormap))
+    np.testing.assert_array_equal(np.asarray(out_img.convert('RGBA')), expected)
+
+
+@pytest.mark.parametrize('encoder', ['pil', 'spng', 'fast'])
+def test_png_encoders_rgb(encoder):
+    import terracotta
+    from terracotta import image
+
+    if encoder == 'spng' and not image.has_spng:
+        pytest.skip('pyspng encoder not available')
+
+    testdata = np.random.randint(0, 3, size=(64, 128, 3), dtype='uint8')
+    expected = np.asarray(Image.open(image.array_to_png(testdata)).convert('RGBA'))
+
+    terracotta.update_settings(PNG_ENCODER=encoder)
+    out_img = Image.open(image.array_to_png(testdata))
+    np.testing.assert_array_equal(np.asarray(out_img.convert('RGBA')), expected)
+
+
+@pytest.mark.parametrize('colormap', [None, 'viridis'])
+@pytest.mark.parametrize('bands', [1, 3])
+def test_png_encoder_spng_conversion(monkeypatch, colormap, bands):
+    """Check alpha channel conversion with a stand-in for pyspng.encode"""
+    import types
+    from io import BytesIO
+
+    import terracotta
+    from terracotta import image
+
+    if bands == 3 and colormap is not None:
+        return
+
+    def fake_encode(arr, compress_level):
+        sio = BytesIO()
+        Image.fromarray(arr).save(sio, 'png')
+        return sio.getvalue()
+
+    monkeypatch.setattr(image, 'pyspng', types.SimpleNamespace(encode=fake_encode), raising=False)
+    monkeypatch.setattr(image, 'has_spng', True)
+
+    shape = (64, 128) if bands == 1 else (64, 128, bands)
+    testdata = np.random.randint(0, 3, size=shape, dtype='uint8')
+    expected = np.asarray(Image.open(image.array_to_png(testdata, colormap)).convert('RGBA'))
+
+    terracotta.update_settings(PNG_ENCODER='spng')
+    out_img = Image.open(image.array_to_png(testdata, colormap))
+    np.testing.assert_array_equal(np.asarray(out_img.convert('RGBA')), expected)
+
+
+def test_png_encoder_invalid():
+    from terracotta import image
+
+    with pytest.raises(ValueError):
+        image.get_png_encoder('foo')
+
+
+def test_png_encoder_fallback(monkeypatch):
+    import warnings
+    from terracotta import image, exceptions
+
+    monkeypatch.setattr(image, 'has_spng', False)
+    image._warn_spng_fallback.cache_clear()
+
+    with pytest.warns(exceptions.PerformanceWarning):
+        assert image.get_png_encoder('spng') is image.PNG_ENCODERS['pil']
+
+    # only warn once, not for every tile
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert image.get_png_encoder('spng') is image.PNG_ENCODERS['pil']
+
+
+@pytest.mark.parametrize('colormap', [None, 'viridis'])
+def test_array_to_image_webp(colormap):
+    from terracotta import image
+
+    testdata = np.random.randint(0, 256, size=(64, 128), dtype='uint8')
+    out_img = Image.open(image.array_to_image(testdata, colormap, image_format='webp'))
+    assert out_img.format == 'WEBP'
+
+    out_data = np.asarray(out_img.convert('RGBA'))
+    assert out_data.shape == (64, 128, 4)
+    assert np.all(out_data[testdata == 0, -1] == 0)
+    assert np.all(out_data[testdata != 0, -1] == 255)
+
+
+def test_array_to_image_jpeg():
+    from terracotta import image
+
+    testdata = np.random.randint(0, 256, size=(64, 128, 3), dtype='uint8')
+    out_img = Image.open(image.array_to_image(testdata, image_format='jpeg'))
+    assert out_img.format == 'JPEG'
+    assert out_img.mode == 'RGB'
+    assert out_img.size == (128, 64)
+
+
+def test_array_to_image_invalid_format():
+    from terracotta import image, exceptions
+
+    with pytest.raises(exceptions.InvalidArgumentsError):
+        image.array_to_image(np.zeros((20, 20), dtype='uint8'), image_format='gif')
+
+
+@pytest.mark.parametrize('image_format', ['png', 'webp', 'jpeg'])
+def test_empty_image(image_format):
+    from terracotta import image
+
+    out_img = Image.open(image.empty_image((64, 32), image_format))
+    assert out_img.format == image_format.upper()
+    assert out_img.size == (64, 32)
+
+    out_data = np.asarray(out_img.convert('RGBA'))
+    assert np.all(out_data[..., :3] == 0)
+    if image_format != 'jpeg':
+        assert np.all(out_data[..., -1] == 0)
+
+
+def test_empty_image_cached():
+    import terracotta
+    from terracotta import image
+
+    first = image.empty_image((64, 32)).read()
+    hits = image._empty_image_bytes.cache_info().hits
+    assert image.empty_image((64, 32)).read() == first
+    assert image._empty_image_bytes.cache_info().hits == hits + 1
+
+    # changing compression settings must not return stale images
+    terracotta.update_settings(PNG_COMPRESS_LEVEL=9)
+    assert image.empty_image((64, 32)).read() != first
+
+
 def test_contrast_stretch():
     from terracotta import image
     data = np.arange(0, 10)
@@ -91,6 +253,80 @@ def test_to_uint8():
     )
 
 
+@pytest.mark.parametrize('dtype', ['uint8', 'int8', 'uint16', 'int16'])
+def test_to_uint8_lookup_table(dtype):
+    from terracotta import image
+
+    info = np.iinfo(dtype)
+    data = np.random.randint(info.min, int(info.max) + 1, size=(64, 64)).astype(dtype)
+    data = np.ma.masked_array(data, mask=np.random.rand(64, 64) > 0.5)
+
+    for lower, upper in ((info.min, info.max), (10, 20.5), (-3, 100), (5, 5)):
+        expected = image.contrast_stretch(data, (lower, upper), (1, 255)).astype('uint8')
+        out = image.to_uint8(data, lower, upper)
+        assert out.dtype == np.uint8
+        np.testing.assert_array_equal(out.mask, data.mask)
+        np.testing.assert_array_equal(out.filled(0), expected.filled(0))
+
+        expected = image.contrast_stretch(data.data, (lower, upper), (1, 255)).astype('uint8')
+        np.testing.assert_array_equal(image.to_uint8(data.data, lower, upper), expected)
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64', 'int32'])
+def test_to_uint8_out(dtype):
+    from terracotta import image
+
+    data = (np.random.rand(64, 64) * 1000).astype(dtype)
+    data = np.ma.masked_array(data, mask=np.random.rand(64, 64) > 0.5)
+    data.data[data.mask] = np.nan if dtype.startswith('float') else 0
+
+    expected = image.contrast_stretch(data.filled(0), (100, 900), (1, 255)).astype('uint8')
+    expected[data.mask] = 0
+
+    out = np.full((64, 64, 2), 99, dtype='uint8')
+    res = image.to_uint8(data, 100, 900, out=out[..., 1])
+    assert np.shares_memory(np.ma.getdata(res), out)
+    np.testing.assert_array_equal(res.mask, data.mask)
+    np.testing.assert_array_equal(out[..., 1], expected)
+    np.testing.assert_array_equal(out[..., 0], 99)
+
+    with pytest.raises(ValueError):
+        image.to_uint8(data, 100, 900, out=np.empty((64, 64), dtype='float32'))
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'int64'])
+def test_to_uint8_float32(dtype, monkeypatch):
+    from terracotta import image
+
+    scratch_dtypes = []
+    get_scratch_buffer = image._get_scratch_buffer
+
+    def record_scratch_buffer(shape, dtype):
+        scratch_dtypes.append(dtype)
+        return get_scratch_buffer(shape, dtype)
+
+    monkeypatch.setattr(image, '_get_scratch_buffer', record_scratch_buffer)
+
+    # large offset that is not representable in float32
+    offset = 10 ** 10
+    data = np.arange(offset, offset + 1000, 10).astype(dtype)
+
+    expected = image.contrast_stretch(data, (offset, offset + 1000), (1, 255)).astype('uint8')
+    out = image.to_uint8(data, offset, offset + 1000)
+    np.testing.assert_allclose(out.astype(int), expected.astype(int), atol=1)
+    assert scratch_dtypes == [np.dtype('float32')]
+
+
+def test_contrast_stretch_out():
+    from terracotta import image
+
+    data = np.arange(0, 10)
+    out = np.empty(10, dtype='float32')
+    res = image.contrast_stretch(data, (0, 10), (10, 20), out=out)
+    assert res is out
+    np.testing.assert_array_equal(out, np.arange(10, 20))
+
+
 def test_label():
     from terracotta import image
 
@@ -98,6 +334,29 @@ def test_label():
     np.testing.assert_array_equal(image.label(data, [17, 15]), np.array([2, 0, 1]))
 
 
+@pytest.mark.parametrize('dtype', ['uint8', 'int16', 'uint16', 'int32', 'float32', 'float64'])
+def test_label_matches_loop(dtype):
+    from terracotta import image
+
+    data = np.random.randint(-50, 250, size=(64, 64)).astype(dtype)
+    labels = [*np.random.choice(np.arange(-60, 260), 200, replace=False), 5, 3.5, np.nan]
+
+    expected = np.zeros(data.shape, dtype='uint8')
+    for i, label in enumerate(labels, 1):
+        expected[data == label] = i
+
+    out = image.label(data, labels)
+    assert out.dtype == np.uint8
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_label_empty():
+    from terracotta import image
+
+    data = np.array([15, 16, 17])
+    np.testing.assert_array_equal(image.label(data, []), np.zeros(3))
+
+
 def test_label_invalid():
     from terracotta import image
 
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.mark.parametrize('provider', ['sqlite'])
+def test_get_tile_data_uses_index(driver_path, provider, raster_file, raster_file_xyz,
+                                  monkeypatch):
+    from terracotta import get_driver, exceptions, xyz
+
+    driver = get_driver(driver_path, provider=provider)
+    driver.create(['key'])
+    driver.insert(['indexed'], str(raster_file))
+    driver.insert(['lazy'], str(raster_file), skip_metadata=True)
+
+    with driver.connect():
+        expected = xyz.get_tile_data(driver, ['lazy'], raster_file_xyz, tile_size=(64, 64))
+
+        with monkeypatch.context() as m:
+            m.setattr(driver, 'get_metadata', pytest.fail)
+            data = xyz.get_tile_data(driver, ['indexed'], raster_file_xyz, tile_size=(64, 64))
+
+        assert data.shape == expected.shape == (64, 64)
+
+        with pytest.raises(exceptions.TileOutOfBoundsError):
+            xyz.get_tile_data(driver, ['indexed'], (0, 0, 10))
+
+        with pytest.raises(exceptions.TileOutOfBoundsError):
+            xyz.get_tile_data(driver, ['indexed'], (10, 0, 0))